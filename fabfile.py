@@ -1,17 +1,38 @@
 # fabfile.py
 # Remote management commands for testy: A WiredTiger 24/7 workload testing framework.
 
-import configparser as cp, os, re
+import configparser as cp, os, re, time
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import redirect_stdout
 from invoke.exceptions import Exit
 from invocations.console import confirm
-from fabric import Connection, task
+from fabric import Connection, ThreadingGroup, task
 from pathlib import Path
-from scripts.testy_launch import get_instance_id_from_name, get_instances_info, get_launch_templates, get_snapshots, launch_from_distro, \
-    launch_from_snapshot, terminate_instance
+from scripts.testy_bench import remote_bin_dir, run as run_bench, save_baseline
+from scripts.testy_launch import create_image_from_instance, get_baked_image_id, get_instance_id_from_name, get_instances_info, \
+    get_launch_templates, get_snapshots, launch_from_distro, launch_from_snapshot, terminate_instance
+from scripts.testy_retention import delete_snapshots, get_policy, prune
 
 testy = "\033[1;36mtesty\033[0m"
 testy_config = ".testy"
+verify_order_file = "/tmp/testy_verify_order"
+
+# The delay between the backups of the workloads running alongside each other, in seconds.
+backup_stagger = 3 * 3600
+
+# The state directories of the services and of the threads of the workloads, as (section,
+# option) pairs of the testy configuration file. They are written by the framework user.
+state_dirs = [("backup", "journal_dir"), ("events", "event_dir"), ("profile", "profile_dir"),
+              ("stall", "bundle_dir"), ("trace", "trace_dir"), ("trace", "replay_dir"),
+              ("hotbackup", "backup_dir"), ("checker", "check_dir"), ("cache", "cache_dir"),
+              ("crash", "crash_dir"), ("fault", "fault_dir"), ("resources", "scratch_dir")]
+
+# The services and timers installed on the testy server and reinstalled by its updates, as the
+# options of the testy section of the testy configuration file holding their unit files.
+testy_services = ["testy_service", "backup_service", "crash_service", "profile_service",
+                  "telemetry_service", "events_service", "stall_service", "fault_service",
+                  "mount_service"]
+testy_timers = ["backup_timer", "crash_timer", "profile_timer", "events_timer"]
 wiredtiger = "\033[1;33mwiredtiger\033[0m"
 
 # ---------------------------------------------------------------------------------------
@@ -19,14 +40,26 @@ wiredtiger = "\033[1;33mwiredtiger\033[0m"
 # ---------------------------------------------------------------------------------------
 
 # Launch an AWS instance and install testy using the given WiredTiger and testy branches.
+# If a baked image exists for the distro, the instance is launched from it and the install
+# only fetches and incrementally builds the requested WiredTiger branch.
 @task
-def launch(c, distro, instance_name=None, iam_profile=None, wiredtiger_branch="develop", testy_branch="main"):
+def launch(c, distro, instance_name=None, iam_profile=None, wiredtiger_branch="develop", testy_branch="main",
+           baked=True):
 
     # Check for invalid IAM profiles.
     if iam_profile is not None and not iam_profile:
         raise Exit(f"The IAM profile '{iam_profile}' is invalid.")
 
-    result = launch_from_distro(distro, instance_name, iam_profile)
+    image_id = None
+    if baked:
+        try:
+            image_id = get_baked_image_id(distro)
+        except Exception as e:
+            print(f"Unable to look up a baked image for '{distro}': {str(e).strip()}")
+        if image_id:
+            print(f"Using baked image '{image_id}' for distro '{distro}'.")
+
+    result = launch_from_distro(distro, instance_name, iam_profile, image_id)
     if result['status'] != 0:
         print(f"Launch failed. {result['msg']}")
         return
@@ -36,7 +69,7 @@ def launch(c, distro, instance_name=None, iam_profile=None, wiredtiger_branch="d
 
     try:
         with Connection(f"{user}@{hostname}") as conn:
-            install(conn, wiredtiger_branch, testy_branch)
+            install(conn, wiredtiger_branch, testy_branch, baked=bool(image_id))
     except Exception as e:
         print(f"The EC2 instance was launched successfully but the testy "
               f"installation failed: {e}")
@@ -50,13 +83,22 @@ def launch(c, distro, instance_name=None, iam_profile=None, wiredtiger_branch="d
     print(f"The instance id is '{result['instance_id']}'")
     print(f"The instance name is '{result['instance_name']}'\n")
 
-# Launch an AWS instance using a snapshot.
+# Launch an AWS instance using a snapshot. Volumes restored from a snapshot are loaded
+# lazily from S3, so the first reads of the database are slow. To avoid this, either enable
+# fast snapshot restore for the launch (billed while enabled) or pre-warm the volume once
+# the instance is running by reading its blocks in parallel:
+#   --prewarm=files   Read the database files, most recently modified first.
+#   --prewarm=device  Read the database files, then every block of the root volume.
 @task
-def launch_snapshot(c, snapshot_id, instance_name=None):
+def launch_snapshot(c, snapshot_id, instance_name=None, fast_restore=False, prewarm=None,
+                    prewarm_threads=16):
+
+    if prewarm not in [None, "files", "device"]:
+        raise Exit(f"Invalid prewarm mode '{prewarm}'. Use 'files' or 'device'.")
 
     hostname = None
     user = None
-    result = launch_from_snapshot(snapshot_id, instance_name)
+    result = launch_from_snapshot(snapshot_id, instance_name, fast_restore)
     success = result['status'] == 0
 
     if not success:
@@ -74,19 +116,36 @@ def launch_snapshot(c, snapshot_id, instance_name=None):
         print(f"The instance id is '{result['instance_id']}'")
         print(f"The instance name is '{result['instance_name']}'\n")
 
+        if prewarm:
+            try:
+                with Connection(f"{user}@{hostname}") as conn:
+                    prewarm_volume(conn, prewarm, prewarm_threads)
+            except Exception as e:
+                print(f"The EC2 instance was launched successfully but the pre-warm failed: {e}")
+
     return success, user, hostname
 
-# Launch an AWS instance using a snapshot and validate it.
+# Launch an AWS instance using a snapshot and validate it. If the volume is pre-warmed, the
+# validation runs while the volume is pre-warmed and verifies the database files in the order
+# they are read, the most recently modified tables first.
 @task
-def validate_snapshot(c, snapshot_id, instance_name=None):
-    success, user, hostname = launch_snapshot(c, snapshot_id, instance_name)
+def validate_snapshot(c, snapshot_id, instance_name=None, fast_restore=False, prewarm=None,
+                      prewarm_threads=16):
+    if prewarm not in [None, "files", "device"]:
+        raise Exit(f"Invalid prewarm mode '{prewarm}'. Use 'files' or 'device'.")
+    success, user, hostname = launch_snapshot(c, snapshot_id, instance_name, fast_restore)
 
     if not success:
         return
     try:
-        print('Validating the database files...')
         with Connection(f"{user}@{hostname}") as conn:
-            validate(conn)
+            prewarming = prewarm_volume(conn, prewarm, prewarm_threads, True) if prewarm else None
+            print('Validating the database files...')
+            try:
+                validate(conn, verify_order=verify_order_file if prewarm else None)
+            finally:
+                if prewarming:
+                    prewarming.join()
     except Exception as e:
         print(f"The EC2 instance was launched successfully but the validation failed: {e}")
 
@@ -117,96 +176,96 @@ def terminate(c, instance_id=None, instance_name=None):
     except Exception as e:
         print(f"Error: {str(e)}")
 
-# Install the testy framework.
+# Install the testy framework. On a server launched from a baked image, which already has the
+# software packages, the repositories and a WiredTiger build, use the --baked option to only
+# update the repositories to the given branches and build WiredTiger incrementally.
 @task
-def install(c, wiredtiger_branch="develop", testy_branch="main"):
+def install(c, wiredtiger_branch="develop", testy_branch="main", baked=False):
 
-    # Get Linux distribution.
-    result = c.run("cat /etc/*-release", hide=True)
-    d = dict(line.split('=') for line in result.stdout.split('\n') if '=' in line)
-    release = d["PRETTY_NAME"].strip('\"')
+    release = get_release(c)
     print(f"Starting {testy} installation for {release} ...")
 
     # Read configuration file.
     config = cp.ConfigParser(interpolation=cp.ExtendedInterpolation())
     config.read(testy_config)
 
-    # Create application user.
-    user = config.get("application", "user")
-    create_user(c, user)
-
-    # Create framework directories.
-    testy_dir = config.get("application", "testy_dir")
-    database_dir = config.get("application", "database_dir")
-    failure_dir = config.get("application", "failure_dir")
-    service_script_dir = config.get("application", "service_script_dir")
-
-    for dir in [testy_dir, database_dir, failure_dir, service_script_dir]:
-        create_directory(c, dir)
-    c.sudo(f"chown -R $(whoami):$(whoami) {testy_dir}")
-    c.sudo(f"chown -R {user}:{user} {database_dir}")
-
-    # Install prerequisite software.
-    install_packages(c, release)
-
-    # Add github to known_hosts.
-    c.run("touch ~/.ssh/known_hosts && ssh-keygen -R github.com && " \
-          "ssh-keyscan -t rsa github.com >> ~/.ssh/known_hosts", hide=True)
-
-    # Clone repositories.
-    for repo in [("testy", testy_branch), ("wiredtiger", wiredtiger_branch)]:
-       git_clone(c, config.get(repo[0], "git_url"), config.get(repo[0], "home_dir"), repo[1])
-
-    # Create working files and directories that can be modified by the framework user.
-    create_working_copy(c, config.get("testy", "home_dir") + f"/{testy_config}",
-              testy_dir, user)
-    create_working_copy(c, config.get("testy", "workload_dir"), testy_dir, user)
-    create_working_copy(c, config.get("testy", "service_script_dir"), testy_dir, user)
-
-    # Build WiredTiger.
-    wt_home_dir = config.get("wiredtiger", "home_dir")
-    wt_build_dir = config.get("wiredtiger", "build_dir")
-    if not build_wiredtiger(c, wt_home_dir, wt_build_dir, wiredtiger_branch):
-        raise Exit(f"Failed to build {wiredtiger} for branch '{wiredtiger_branch}'.")
-
-    # Install services.
-    services = ["testy_service", "backup_service", "crash_service"]
-    for service in services:
-        install_service(c, config.get("testy", service))
-    timers = ["backup_timer", "crash_timer"]
-    for timer in timers:
-        install_service_timer(c, config.get("testy", timer))
+    args = {"release": release, "wiredtiger_branch": wiredtiger_branch, "testy_branch": testy_branch}
+    run_steps(c, baked_install_steps if baked else install_steps, config, args)
 
     # Print installation summary on success.
     print("\n~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~")
     print("The testy installation is complete!")
     print("~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~")
-    print(f"The testy framework user is '{user}'")
-    print(f"The testy framework directory is '{testy_dir}'")
-    print(f"The testy workloads are found in '" +
-          config.get("application", "workload_dir") + "'")
-    print(f"The database directory is '{database_dir}'")
-    print(f"The WiredTiger home directory is '{wt_home_dir}'")
-    print(f"The WiredTiger build directory is '{wt_build_dir}'")
+    print(f"The testy framework user is '{config.get('application', 'user')}'")
+    print(f"The testy framework directory is '{config.get('application', 'testy_dir')}'")
+    print(f"The testy workloads are found in '{config.get('application', 'workload_dir')}'")
+    print(f"The database directory is '{config.get('application', 'database_dir')}'")
+    print(f"The WiredTiger home directory is '{config.get('wiredtiger', 'home_dir')}'")
+    print(f"The WiredTiger build directory is '{config.get('wiredtiger', 'build_dir')}'")
+
+# Bake a reusable testy image with the toolchain and dependencies installed, the repositories
+# cloned and the WiredTiger build directory and compiler cache warmed. If a distro is given,
+# an instance is launched from the distro, baked, saved as an image and terminated. Otherwise,
+# the bake steps are run against the host given with the -H option (e.g. a local container
+# standing in for an instance) and no image is created.
+@task
+def bake(c, distro=None, wiredtiger_branch="develop", testy_branch="main", image_name=None):
+
+    config = cp.ConfigParser(interpolation=cp.ExtendedInterpolation())
+    config.read(testy_config)
+
+    if not distro:
+        if type(c) is not Connection:
+            raise Exit("Please specify a distro or the host to bake with the -H option.")
+        release = get_release(c)
+        print(f"Baking {testy} on '{c.host}' for {release} ...")
+        run_steps(c, bake_steps, config, {"release": release,
+            "wiredtiger_branch": wiredtiger_branch, "testy_branch": testy_branch})
+        print(f"\nThe bake steps completed on '{c.host}'. No image was created.")
+        return
+
+    # Always launch the bake instance from the launch template's base image.
+    result = launch_from_distro(distro, None, None)
+    if result['status'] != 0:
+        raise Exit(f"Bake failed. {result['msg']}")
+    instance_id = result['instance_id']
+
+    try:
+        with Connection(f"{result['user']}@{result['hostname']}") as conn:
+            release = get_release(conn)
+            print(f"Baking {testy} for {release} ...")
+            run_steps(conn, bake_steps, config, {"release": release,
+                "wiredtiger_branch": wiredtiger_branch, "testy_branch": testy_branch})
+            with conn.cd(config.get("wiredtiger", "home_dir")):
+                commit = conn.run("git rev-parse --short HEAD", hide=True).stdout.strip()
+
+        if not image_name:
+            image_name = f"testy-{distro}-{commit}-" + time.strftime("%Y%m%d%H%M%S")
+        image_id = create_image_from_instance(instance_id, image_name, distro, commit)
+        print(f"\nBaked image '{image_name}' ({image_id}) for distro '{distro}'.")
+    finally:
+        terminate_instance(instance_id)
 
 # Run the populate function as defined in the workload interface file.
 @task
 def populate(c, workload):
 
-    if testy_running(c):
+    if testy_running(c, workload) or database_in_use(c, workload):
         raise Exit(f"\n{testy} is running. Please stop {testy} to run populate.")
 
     # Verify the specified workload exists.
     wif = get_value(c, "application", "workload_dir") + f"/{workload}/{workload}.sh"
     if not c.run(f"test -f {wif}", warn=True):
         raise Exit(f"\nUnable to run populate: Workload '{workload}' not found.")
+    create_database_dir(c, workload)
 
     # Run the populate workload.
-    command = get_env(c, "environment") + " bash " + wif + " populate"
+    command = get_env(c, "environment", workload) + " bash " + wif + " populate"
 
     if c.sudo(command, user=get_value(c, "application", "user"), warn=True):
-        # Update the current workload.
-        set_value(c, "application", "current_workload", workload)
+        # Update the current workload, keeping the workloads running alongside it.
+        workloads = [w for w in get_running_workloads(c) if w != workload]
+        set_value(c, "application", "current_workload", ",".join(workloads + [workload]))
         print(f"Populate succeeded for workload '{workload}'.")
     else:
         print(f"Populate failed for workload '{workload}'.")
@@ -215,17 +274,24 @@ def populate(c, workload):
 #   (1) testy-run executes the run function as defined in the workload interface file
 #   (2) testy-backup
 #   (3) testy-crash
+# A workload can be started while other workloads are running if each of them has its own
+# database directory, set in a 'workload.<name>' section of the testy configuration file.
 @task
 def start(c, workload, config_file=None):
 
     service_name = Path(get_value(c, "testy", "testy_service")).name
     skip_services = False
 
-    if testy_running(c):
+    if testy_running(c, workload):
+        raise Exit(f"\n{testy} is already running workload '{workload}'.")
+    if database_in_use(c, workload):
         raise Exit(f"\n{testy} is already running. Use 'fab restart' to " \
-                    "change the workload.")
+                    "change the workload, or give each workload its own database directory " \
+                    "in a [workload.<name>] section of .testy to run them side by side.")
+    running = get_running_workloads(c)
 
-    # If we are running test/format we need to specify which config file to use.
+    # If we are running test/format we need to specify which config file to use. A
+    # comma-separated list of config files runs a campaign over all of them.
     if workload == "test_format":
         if not config_file:
             print("Please specify a configuration file through 'fab -H <host> start test_format \
@@ -242,18 +308,31 @@ def start(c, workload, config_file=None):
     wif = get_value(c, "application", "workload_dir") + f"/{workload}/{workload}.sh"
     if not c.run(f"test -f {wif}", warn=True):
         raise Exit(f"\nUnable to start {testy}: Workload '{workload}' not found.")
+    create_database_dir(c, workload)
 
     # Enable service timers.
     if not skip_services:
-        for timer in ["backup_timer", "crash_timer"]:
+        for timer in ["backup_timer", "crash_timer", "profile_timer"]:
             timer_name = get_service_instance_name(
                 Path(get_value(c, "testy", timer)).name, workload)
             if not c.sudo(f"systemctl enable {timer_name}", hide=True, warn=True):
                 print(f"Failed to schedule ${timer_name} service timer.")
 
+    # Enable the telemetry collector, the stall detector and the fault injection service, which
+    # run alongside the workload.
+    for service in ["telemetry_service", "stall_service", "fault_service"]:
+        service_instance = get_service_instance_name(
+            Path(get_value(c, "testy", service)).name, workload)
+        if not c.sudo(f"systemctl enable {service_instance}", hide=True, warn=True):
+            print(f"Failed to enable the {service_instance} service.")
+
+    # Apply the resource settings of the workload and background services from .testy.
+    install_slices(c)
+
     # Update the environment variables for the shell scripts from .testy to systemd services 
     conf = get_systemd_service_conf(c, "environment")
     c.sudo(f"echo '{conf}' | sudo tee /etc/systemd/system/{service_name}.d/env.conf >/dev/null")
+    install_workload_conf(c, workload, get_backup_slot(c, running))
     c.sudo("systemctl daemon-reload")
 
     # Start the testy-run service which manages the long-running
@@ -264,70 +343,60 @@ def start(c, workload, config_file=None):
     testy_service = get_service_instance_name(service_name, workload)
     c.sudo(f"systemctl start {testy_service}", user="root")
     if c.sudo(f"systemctl is-active {testy_service}", hide=True, warn=True):
-        set_value(c, "application", "current_workload", workload)
+        set_value(c, "application", "current_workload", ",".join(running + [workload]))
         c.run(f"systemctl status {testy_service}")
         print(f"\nStarted {testy} running workload '{workload}'!")
     else:
         raise Exit(f"\nUnable to start {testy}.")
 
 # Stop the testy framework, ensuring that all running processes complete gracefully
-# and WiredTiger is shut down cleanly.
+# and WiredTiger is shut down cleanly. If a workload is specified, only that workload is
+# stopped and the workloads running alongside it keep running.
 @task
-def stop(c):
+def stop(c, workload=None):
 
-    skip_services = False
-    workload = get_value(c, "application", "current_workload")
-    if not workload:
+    workloads = get_workloads(c)
+    if not workloads:
         print(f"\nNothing to stop. No workload is defined.")
         return
+    if workload and workload not in workloads:
+        print(f"\nNothing to stop. Workload '{workload}' is not running.")
+        return
 
-    if workload == "test_format":
-        skip_services = True
-    
-    if not skip_services:
-        # Stop service timers for the workloads that have it running.
-        stop_service_timers(c, workload)
-
-    # Stop testy service.
-    testy_service = get_service_instance_name(
-        Path(get_value(c, "testy", "testy_service")).name, workload)
-
-    if c.run(f"systemctl is-active {testy_service}", hide=True, warn=True):
-        print(f"Stopping {testy}. Please wait ...")
-        if c.sudo(f"systemctl stop {testy_service}", user="root"):
-            print(f"{testy} stopped successfully.")
-        else:
-            print(f"Failed to stop {testy}.")
-    else:
-        print(f"{testy} is not running.")
-
-    if not skip_services:
-        # Disable the crash and backup services.
-        disable_crash_backup_services(c, workload)
+    for current_workload in [workload] if workload else workloads:
+        stop_workload(c, current_workload)
 
-# Restarts with the specified workload. If no workload is specified, take the current workload. 
+# Restarts with the specified workload. If no workload is specified, take the current workloads.
+# A workload running alongside other workloads is restarted on its own, any other workload
+# replaces the current workloads.
 @task
 def restart(c, workload=None, validate_workload=False):
 
     # If there is no current workload and no specified workload, return.
-    current_workload = get_value(c, "application", "current_workload")
-    if not current_workload and not workload:
+    current_workloads = get_workloads(c)
+    if not current_workloads and not workload:
         print(f"No workload is defined. Please specify a workload.")
         return
 
-    # If no workload is specified, take the current workload. 
+    # If no workload is specified, take the current workloads.
     if not workload:
-        workload = current_workload
-        
-    # Stop the testy workload.
-    stop(c)
+        workloads = current_workloads
+        stop(c)
+    elif workload in current_workloads:
+        workloads = [workload]
+        stop(c, workload)
+    else:
+        workloads = [workload]
+        stop(c)
 
-    # Validate the stopped workload.
+    # Validate the stopped workloads.
     if validate_workload:
-        validate(c)
+        for current_workload in workloads:
+            validate(c, workload=current_workload)
 
-    # Restart the testy workload.    
-    start(c, workload)
+    # Restart the testy workloads.
+    for current_workload in workloads:
+        start(c, current_workload)
 
 # Update the WiredTiger and/or testy source on the remote server to the specified GitHub
 # branch. If an argument is not specified, no update is made. Updates to WiredTiger are
@@ -370,26 +439,36 @@ def update(c, wiredtiger_branch=None, testy_branch=None):
 
     if update_success:
         # Start testy service.
-        start(c, workload)
+        for current_workload in [w for w in workload.split(",") if w]:
+            start(c, current_workload)
     else:
         raise Exit("One or more errors occurred during update. Please retry the " \
                    f"update or run 'fab start' to restart {testy}.")
 
-# Execute the validate function defined in the workload.
+# Execute the validate function defined in the workload. If a verify order file is given,
+# its path is passed to the workload in the 'verify_order' environment variable. The file
+# lists the WiredTiger objects in the order the workload should verify them. If no workload is
+# specified, each of the current workloads is validated.
 @task
-def validate(c):
-    workload = get_value(c, "application", "current_workload")
-    if not workload:
+def validate(c, verify_order=None, workload=None):
+    workloads = [workload] if workload else get_workloads(c)
+    if not workloads:
         print("Validation skipped, no workload was previously defined.")
         return
 
     user = get_value(c, "application", "user")
-    wif = get_value(c, "application", "workload_dir") + f"/{workload}/{workload}.sh"
-    command = get_env(c, "environment") + " bash " + wif + " validate"
-
-    result = c.sudo(command, user=user, warn=True)
-    if not result:
-        raise Exit(f"Validate failed for '{workload}' workload.")
+    failed = []
+    for current_workload in workloads:
+        wif = get_value(c, "application", "workload_dir") + \
+              f"/{current_workload}/{current_workload}.sh"
+        command = get_env(c, "environment", current_workload) + " bash " + wif + " validate"
+        if verify_order:
+            command = f"verify_order={verify_order} " + command
+        if not c.sudo(command, user=user, warn=True):
+            failed.append(current_workload)
+
+    if failed:
+        raise Exit(f"Validate failed for the {', '.join(failed)} workload(s).")
 
 # The workload function takes three optional arguments: upload, upload_config and describe. 
 # If no arguments are provided, the current workload is returned.
@@ -417,6 +496,7 @@ def workload(c, upload=None, describe=None, upload_config=None):
         archived_name = os.path.basename(upload)
         src = f"{dest}/{archived_name}"
         exists = overwrite = False
+        is_spec = upload.endswith(".toml")
 
         if c.run(f"[ -d {dest}/{workload_name} ] ", warn=True):
             exists = True
@@ -425,7 +505,9 @@ def workload(c, upload=None, describe=None, upload_config=None):
             if not overwrite:
                 print(f"The workload '{workload_name}' has not been uploaded. ")
         
-        if exists == overwrite:
+        if exists == overwrite and is_spec:
+            upload_workload_spec(c, upload, workload_name, dest, user)
+        elif exists == overwrite:
             script = get_value(c, "testy", "unpack_script")
             try: 
                 c.put(upload, "/tmp/", preserve_mode=True)
@@ -447,7 +529,7 @@ def workload(c, upload=None, describe=None, upload_config=None):
     # interface file. A workload must be specified for the describe option. 
     if describe:
         wif = f"{dest}/{describe}/{describe}.sh"
-        command = wif + " describe"
+        command = get_env(c, "environment") + " bash " + wif + " describe"
         result = c.sudo(command, user=user, warn=True)
         if not result: 
             print(f"Unable to describe '{describe}' workload.")
@@ -473,7 +555,9 @@ def workload(c, upload=None, describe=None, upload_config=None):
     
     # If no option has been specified, print the current workload and return as usual.  
     if not describe and not upload and not upload_config:
-        if current_workload:
+        if "," in current_workload:
+            print(f"The current workloads are {current_workload.replace(',', ', ')}.")
+        elif current_workload:
             print(f"The current workload is {current_workload}.")
         else: 
             print("The current workload is unspecified.")
@@ -489,13 +573,34 @@ def snapshot_delete(c, snapshot_id=None):
               --snapshot_id=<snapshotid1,...,snapshotidn> separated by a ',' .")
         return
     
-    snapshot_ids = snapshot_id.split(",")
-    for snapshot_id in snapshot_ids:
-        result = c.run(f"aws ec2 delete-snapshot \
-        --snapshot-id {snapshot_id}")
-        if result.stderr:
-            raise Exit(result.stderr)
-        print(f"Deleted snapshot '{snapshot_id}'.")       
+    # Delete the snapshots concurrently, limiting the rate of delete calls.
+    policy = get_policy(testy_config)
+    errors = delete_snapshots(snapshot_id.split(","), policy["delete_concurrency"],
+                              policy["delete_rate"])
+    if any(errors.values()):
+        raise Exit("One or more snapshots could not be deleted.")
+
+# Apply the snapshot retention policy defined in the 'retention' section of the testy
+# configuration file to the testy snapshots, or only to the snapshots of the specified
+# instance. If the -H option is given, the snapshots whose failure file is still on that
+# testy server are protected. The snapshots tagged with a validation failure file are kept
+# whatever their age, within the number of failed snapshots kept per instance. Use the
+# dry-run option to print the report without deleting anything.
+@task
+def snapshot_prune(c, instance_id=None, dry_run=False):
+
+    protected_ids = []
+    if type(c) is Connection:
+        failure_dir = get_value(c, "application", "failure_dir")
+        result = c.run(f"ls {failure_dir}", hide=True, warn=True)
+        protected_ids = [Path(f).stem for f in result.stdout.split() if f.startswith("snap-")]
+
+    try:
+        success = prune(testy_config, instance_id or "", str(dry_run), ",".join(protected_ids))
+    except Exception as e:
+        raise Exit(f"Error: {str(e)}")
+    if not success:
+        raise Exit("One or more snapshots could not be deleted.")
 
 # The list function takes the following optional arguments:
 #    --distros    List the available distributions for launching a testy server.
@@ -562,9 +667,9 @@ def list(c, distros=False, instances=False, snapshots=False, workloads=False):
         result = c.sudo(command, user=user, warn=True, hide=True)
         if result.ok:
             print("\n\033[1mAvailable workloads: \033[0m")
-            if current_workload:
-                result.stdout = re.sub(r"(?<!-)\b%s(?!-)\b" % current_workload, \
-                    f"\033[1;35m{current_workload} (active)\033[0m", result.stdout)
+            for active in [w for w in current_workload.split(",") if w]:
+                result.stdout = re.sub(r"(?<!-)\b%s(?!-)\b" % active, \
+                    f"\033[1;35m{active} (active)\033[0m", result.stdout)
             print(result.stdout)
         else:
             print(result.stderr)
@@ -591,20 +696,27 @@ def info(c):
     with open(os.devnull, "w") as f, redirect_stdout(f):
         testy_workload = workload(c)
 
-    testy_service = get_service_instance_name(
-        Path(get_value(c, "testy", "testy_service")).name, testy_workload)
-    testy_status = c.run(f"systemctl is-active {testy_service}", hide=True, warn=True)
-
     print(f"{wiredtiger} branch:  {wt_branch.stdout}"
           f"{wiredtiger} commit:  {wt_commit.stdout}"
           f"{wiredtiger} version: {wt_version.stdout}\n"
           f"{testy} branch:   {testy_branch.stdout}"
-          f"{testy} commit:   {testy_commit.stdout}"
-          f"{testy} workload: {testy_workload}\n"
-          f"{testy} status:   {testy_status.stdout}")
+          f"{testy} commit:   {testy_commit.stdout}")
 
-    if testy_status:
-        c.run(f"systemctl status {testy_service}")
+    # Print the status of each workload, several workloads may run alongside each other.
+    script_dir = get_value(c, "testy", "script_dir")
+    for current_workload in testy_workload.split(",") if testy_workload else [None]:
+        testy_service = get_service_instance_name(
+            Path(get_value(c, "testy", "testy_service")).name, current_workload)
+        testy_status = c.run(f"systemctl is-active {testy_service}", hide=True, warn=True)
+
+        print(f"{testy} workload: {current_workload}\n"
+              f"{testy} status:   {testy_status.stdout}")
+
+        if testy_status:
+            c.run(f"systemctl status {testy_service}")
+            c.run(f"python3 {script_dir}/testy_telemetry.py show {current_workload}", warn=True)
+            c.run(f"python3 {script_dir}/testy_governor.py show {current_workload}", warn=True)
+    c.run(f"python3 {script_dir}/testy_cgroups.py show", warn=True)
 
 # Access the saved verify snapshot failure files from the remote testy server. This function takes
 # 5 optional arguments, allowing you to list the files, download a specified file to a specified
@@ -650,20 +762,470 @@ def snapshot_failures(c, list=False, get=None, dest=None, show=None, delete=None
         if c.sudo(f"rm {snapshot_file}", user="root"):
             print(f"{snapshot_file} successfully deleted.")
 
+# Print the statistics of the test/format campaign: the number of runs, the runs per hour,
+# and the failures bucketed by crash signature. The reproducer configs and the home directory
+# of the first failure of each bucket are saved in the 'format' directory of the failure
+# directory, and can be downloaded with the snapshot-failures command.
+@task
+def format_report(c):
+    if type(c) is not Connection:
+        print("Please specify the testy server with the -H option to use this command.")
+        return
+
+    script = get_value(c, "testy", "script_dir") + "/testy_format.py"
+    failure_dir = get_value(c, "application", "failure_dir")
+    c.sudo(f"python3 {script} report {failure_dir}", user=get_value(c, "application", "user"),
+           warn=True)
+
+# Access the workload profiles captured by the testy-profile service. A profile selector is
+# either a time window 'start..end', where each end is an ISO 8601 time or a duration before
+# now such as '12h' or '7d' and may be omitted, or a WiredTiger commit hash prefix. This
+# function takes the following optional arguments:
+#    --list   List the profiles with their WiredTiger commit and I/O and CPU counters.
+#    --get    Download the profiles matching a selector merged into one folded stack file.
+#    --diff   Compare the profiles matching two comma-separated selectors, and download the
+#             differential folded stack file.
+#    --dest   The local directory for the downloaded files, the current directory by default.
+# The folded stack files are the input of flamegraph.pl.
+@task
+def profile(c, list=False, get=None, diff=None, dest="./"):
+    if type(c) is not Connection:
+        print("Please specify the testy server with the -H option to use this command.")
+        return
+
+    script = get_value(c, "testy", "script_dir") + "/testy_profile.py"
+    profile_dir = get_value(c, "profile", "profile_dir")
+    user = get_value(c, "application", "user")
+
+    if list:
+        c.sudo(f"python3 {script} list_profiles {profile_dir}", user=user, warn=True)
+
+    if get:
+        output = "/tmp/testy-profile.folded"
+        if c.sudo(f"python3 {script} merge {profile_dir} '{get}' {output}", user=user, warn=True):
+            c.get(output, dest)
+            c.sudo(f"rm -f {output}", user=user)
+            print(f"Profile downloaded to {dest}")
+
+    if diff:
+        before, after = diff.split(",", 1)
+        output = "/tmp/testy-profile-diff.folded"
+        if c.sudo(f"python3 {script} diff {profile_dir} '{before}' '{after}' {output}",
+                  user=user, warn=True):
+            c.get(output, dest)
+            c.sudo(f"rm -f {output}", user=user)
+            print(f"Differential profile downloaded to {dest}")
+
+# Print the stalls detected in the workload: the time, the operation type, its latency and
+# the likely cause. The diagnostic bundle of each stall is saved in the stall directory with
+# the thread stacks, the latency samples, the WiredTiger statistics and the I/O statistics.
+@task
+def stall_report(c):
+    if type(c) is not Connection:
+        print("Please specify the testy server with the -H option to use this command.")
+        return
+
+    script = get_value(c, "testy", "script_dir") + "/testy_stall.py"
+    bundle_dir = get_value(c, "stall", "bundle_dir")
+    c.sudo(f"python3 {script} report {bundle_dir}", user=get_value(c, "application", "user"),
+           warn=True)
+
+# Print the crashes of the crash testing service aggregated per phase: the number of crashes,
+# how many landed in the phase, how many recovered and the recovery times.
+@task
+def crash_report(c):
+    if type(c) is not Connection:
+        print("Please specify the testy server with the -H option to use this command.")
+        return
+
+    script = get_value(c, "testy", "script_dir") + "/testy_crash.py"
+    config = get_value(c, "application", "testy_dir") + f"/{testy_config}"
+    c.sudo(f"python3 {script} report {config}", user=get_value(c, "application", "user"),
+           warn=True)
+
+# Inject I/O faults under the database of a workload. The database directory of the workload
+# is mounted from a device-mapper device over a loop device, and a fault replaces the table of
+# the device with a 'delay' or 'flakey' target for its duration. The fault profiles are the
+# 'fault.<profile>' sections of .testy, and the fault service injects the profiles of the
+# schedule of the workload while it runs. This function takes the workload and the following
+# optional arguments:
+#    --setup     Mount the database directory from the fault device, now and at boot. Run it
+#                before populate. The snapshot backups cannot validate a database on a fault
+#                device, so the backups must stream the database files.
+#    --teardown  Unmount the database directory and remove the fault device. The image file
+#                holding the database is kept.
+#    --inject    Inject a fault profile now, for its duration or the given duration.
+#    --clear     Remove any fault from the device.
+#    --report    Print the throughput and latencies of the workload around each fault.
+@task
+def fault(c, workload, setup=False, teardown=False, inject=None, duration=None, clear=False,
+          report=False):
+    if type(c) is not Connection:
+        print("Please specify the testy server with the -H option to use this command.")
+        return
+
+    script = get_value(c, "testy", "script_dir") + "/testy_fault.py"
+    config = get_value(c, "application", "testy_dir") + f"/{testy_config}"
+    user = get_value(c, "application", "user")
+    command = get_env(c, "environment", workload) + f" python3 {script}"
+
+    if (setup or teardown) and testy_running(c, workload):
+        raise Exit(f"\n{testy} is running. Please stop {testy} to set up the fault device.")
+
+    # The mount service mounts the database directory from the fault device at boot.
+    mount_service = get_service_instance_name(
+        Path(get_value(c, "testy", "mount_service")).name, workload)
+    if setup:
+        # The database is in the image file, which a snapshot of the root volume only holds
+        # as a file: the snapshot backups would validate an empty mount point.
+        if get_value(c, "backup", "mode") != "stream":
+            raise Exit("The snapshot backups cannot validate a database on a fault device. "
+                       "Please set 'mode = stream' in the 'backup' section first.")
+        if c.sudo(f"{command} setup {config} {workload}", user=user, warn=True):
+            conf_dir = f"/etc/systemd/system/{mount_service}.d"
+            conf = get_systemd_service_conf(c, "environment", workload)
+            c.sudo(f"mkdir -p {conf_dir}")
+            c.sudo(f"echo '{conf}' | sudo tee {conf_dir}/workload.conf >/dev/null")
+            c.sudo("systemctl daemon-reload")
+            c.sudo(f"systemctl enable {mount_service}", warn=True, hide=True)
+    if inject:
+        c.sudo(f"{command} inject {config} {workload} {inject} {duration or ''}", user=user,
+               warn=True)
+    if clear:
+        c.sudo(f"{command} clear {config} {workload}", user=user, warn=True)
+    if report:
+        c.sudo(f"{command} report {config} {workload}", user=user, warn=True)
+    if teardown:
+        c.sudo(f"systemctl disable {mount_service}", warn=True, hide=True)
+        c.sudo(f"{command} teardown {config} {workload}", user=user, warn=True)
+
+# Access the operation traces recorded by workloads in trace mode, and replay them. A workload
+# spec is in trace mode when its [workload] table sets 'trace = true'. Workgen scripts, such as
+# the sample workload, cannot be traced. This function takes the following optional arguments:
+#    --list    List the traces with their time range, number of records and size.
+#    --get     Download a trace as a compressed archive.
+#    --replay  Replay a trace against a new database in the 'replay_dir' of the trace section
+#              of .testy. The trace is either the name of a trace on the server or a trace
+#              archive on the local machine, which is uploaded first, e.g. to replay on a new
+#              instance a trace recorded on another one. The workload must be stopped.
+#    --timing  'max' to replay as fast as possible, 'original' to follow the recorded times,
+#              or a speed factor such as '2'. The default is 'max'.
+#    --dest    The local directory for the downloaded archive, the current directory by default.
+@task
+def trace(c, list=False, get=None, replay=None, timing="max", dest="./"):
+    if type(c) is not Connection:
+        print("Please specify the testy server with the -H option to use this command.")
+        return
+
+    script = get_value(c, "testy", "script_dir") + "/testy_trace.py"
+    trace_dir = get_value(c, "trace", "trace_dir")
+    user = get_value(c, "application", "user")
+
+    if list:
+        c.sudo(f"python3 {script} list_traces {trace_dir}", user=user, warn=True)
+
+    if get:
+        archive = f"/tmp/{get}.tar.gz"
+        if c.sudo(f"tar -czf {archive} -C {trace_dir} {get}", user=user, warn=True):
+            c.get(archive, dest)
+            c.sudo(f"rm -f {archive}", user=user)
+            print(f"Trace downloaded to {dest}")
+
+    if replay:
+        if testy_running(c):
+            print("Please stop the workload before replaying a trace.")
+            return
+        name = replay
+        if os.path.isfile(replay):
+            # Traces are archived with their directory, named after the trace.
+            name = os.path.basename(replay).split(".tar")[0]
+            c.put(replay, f"/tmp/{os.path.basename(replay)}")
+            c.sudo(f"mkdir -p {trace_dir}", user=user)
+            c.sudo(f"tar -xzf /tmp/{os.path.basename(replay)} -C {trace_dir}", user=user)
+            c.run(f"rm -f /tmp/{os.path.basename(replay)}")
+
+        # The replay directory is created at setup, in the testy directory the framework user
+        # cannot write in, so only its contents are removed.
+        replay_dir = get_value(c, "trace", "replay_dir")
+        wt_build_dir = get_value(c, "wiredtiger", "build_dir")
+        c.sudo(f"find {replay_dir} -mindepth 1 -delete", user=user)
+        c.sudo(f"bash -c 'PYTHONPATH={wt_build_dir}/lang/python python3 {script} replay "
+               f"{trace_dir}/{name} {replay_dir} {timing}'", user=user, warn=True)
+
+# Refresh the local mirror of the WiredTiger repository with an incremental fetch, creating it
+# if needed. The mirror is fetched from the 'mirror_url' of the wiredtiger section of .testy,
+# e.g. a mirror on a local file server, or from GitHub. This function takes the following
+# optional argument:
+#    --hosts  A comma-separated list of testy servers whose mirrors are refreshed in parallel,
+#             instead of the server given with the -H option.
+@task
+def mirror(c, hosts=None):
+    if type(c) is not Connection and not hosts:
+        print("Please specify the testy server with the -H option to use this command.")
+        return
+
+    if not hosts:
+        mirror_dir = get_value(c, "wiredtiger", "mirror_dir")
+        source_url = get_value(c, "wiredtiger", "mirror_url") or \
+                     get_value(c, "wiredtiger", "git_url")
+        if not sync_mirror(c, mirror_dir, source_url, get_value(c, "wiredtiger", "clone_filter")):
+            raise Exit(f"Failed to refresh the mirror in '{mirror_dir}'.")
+        return
+
+    # The servers share the layout of the testy configuration file of this machine.
+    config = cp.ConfigParser(interpolation=cp.ExtendedInterpolation())
+    config.read(testy_config)
+    mirror_dir = config.get("wiredtiger", "mirror_dir")
+    results = ThreadingGroup(*hosts.split(",")).run(
+        f"git -C {mirror_dir} fetch --prune origin", warn=True, hide=True)
+    for connection, result in results.items():
+        status = "done" if result.ok else f"failed\n{result.stderr.strip()}"
+        print(f"Refreshing the mirror on '{connection.host}' ... {status}")
+
+# Find the first WiredTiger commit between a good and a bad commit for which a predicate fails.
+# Each commit is built in a cache of builds and probed with the predicate, several commits at
+# a time. The predicate is one of:
+#    validate:<workload>[:<minutes>]        Run the workload, 10 minutes by default, and validate
+#                                           its database.
+#    format:<config>[:<runs>]               Run test/format with a config file of the test_format
+#                                           workload, 3 times by default.
+#    throughput:<workload>:<minutes>:<ops>  Run the workload and compare its mean throughput with
+#                                           a minimum in operations/s.
+# This function takes the following optional arguments:
+#    --slots  The number of commits probed at a time on the server, one per 8 cores by default.
+#    --hosts  A comma-separated list of testy servers probing one commit each at a time, in
+#             parallel. The server given with the -H option keeps the bisection.
+# The workloads must be stopped on the servers running the probes. The bisection runs as the
+# owner of the WiredTiger repository, for git to work in its worktrees. A bisection whose probe
+# results contradict each other, e.g. with a flaky predicate, ends as inconclusive.
+@task
+def bisect(c, good, bad, predicate, slots=0, hosts=None):
+    if type(c) is not Connection:
+        print("Please specify the testy server with the -H option to use this command.")
+        return
+
+    script = get_value(c, "testy", "script_dir") + "/testy_bisect.py"
+    config = get_value(c, "application", "testy_dir") + f"/{testy_config}"
+    probe_hosts = [Connection(host) for host in hosts.split(",")] if hosts else [c]
+    for host in probe_hosts:
+        if testy_running(host):
+            print(f"Please stop the workload on '{host.host}' before bisecting.")
+            return
+
+    if not hosts:
+        c.run(f"python3 {script} run {config} {good} {bad} {predicate} {slots}", warn=True)
+        return
+
+    # The servers share the layout of the testy configuration file of this machine, and fetch
+    # the commits to probe into their mirror.
+    mirror_dir = get_value(c, "wiredtiger", "mirror_dir")
+    ThreadingGroup(*hosts.split(",")).run(f"git -C {mirror_dir} fetch --prune origin",
+                                          warn=True, hide=True)
+    c.run(f"python3 {script} start {config} {good} {bad}")
+
+    def probe(host, commit):
+        result = host.run(f"python3 {script} probe {config} {commit} {predicate}", warn=True)
+        return {0: "good", 1: "bad"}.get(result.exited, "skip")
+
+    while True:
+        probes = c.run(f"python3 {script} next_probes {config} {len(probe_hosts)}",
+                       hide=True).stdout.split()
+        if probes[0] in ["first-bad", "undecided"]:
+            break
+        with ThreadPoolExecutor(len(probe_hosts)) as executor:
+            probe_results = executor.map(probe, probe_hosts, probes)
+            marks = " ".join(f"{commit}:{result}" for commit, result in zip(probes, probe_results))
+        if not c.run(f"python3 {script} mark {config} {marks}", warn=True):
+            break
+
+    c.run(f"python3 {script} finish {config}")
+
+# Benchmark the control plane of testy against a stand-in server, e.g. a container or a local
+# machine reached over SSH, and a local AWS API emulator. Each case is run several times and
+# its median wall time, remote commands, file transfers, local processes, processes forked on
+# the server and AWS API calls are compared with a baseline file. The task fails when a case is
+# measurably slower or makes more calls than in the baseline. This function takes the following
+# optional arguments:
+#    --cases            A comma-separated list of cases among 'info', 'start', 'stop', 'update',
+#                       'launch' and 'backup'. All of them by default.
+#    --workload         The workload started and stopped by the cases, 'sample' by default.
+#    --repeat           The number of runs of each case, 3 by default.
+#    --baseline         The baseline file, 'testy-bench.json' by default.
+#    --save             Save the results as the new baseline of the cases.
+#    --tolerance        The allowed increase of the wall time, 0.2 (20%) by default.
+#    --aws-endpoint     The endpoint of the AWS API emulator. The 'launch' and 'backup' cases
+#                       only run with an emulator.
+#    --distro           The launch template of the 'launch' case, created in the emulator.
+#    --metadata-url     The instance metadata endpoint of the 'backup' case, the EC2 one by
+#                       default.
+@task
+def bench(c, cases="info,start,stop,update,launch,backup", workload="sample", repeat=3,
+          baseline="testy-bench.json", save=False, tolerance=0.2, aws_endpoint=None, distro=None,
+          metadata_url=None):
+    if type(c) is not Connection:
+        print("Please specify the testy server with the -H option to use this command.")
+        return
+
+    user = get_value(c, "application", "user")
+    with c.cd(get_value(c, "testy", "home_dir")):
+        testy_branch = c.run("git rev-parse --abbrev-ref HEAD", hide=True).stdout.strip()
+
+    # The backup case runs a backup as the backup service does, with the aws cli wrapper of the
+    # harness first in the path. The emulator creates no device for the backup volume, so the
+    # backup skips mounting and validating it.
+    env = get_env(c, "environment", workload)
+    script = get_value(c, "environment", "testy_script_dir") + "/testy_backup.py"
+    config = get_value(c, "environment", "testy_config")
+    endpoint = f"AWS_ENDPOINT_URL={aws_endpoint}" if aws_endpoint else ""
+    metadata = f"testy_metadata_url={metadata_url}" if metadata_url else ""
+    backup = lambda: c.sudo(f"env PATH={remote_bin_dir}:$PATH {endpoint} {metadata} {env} "
+                            f"testy_skip_mount=1 python3 {script} run {config} {workload} "
+                            f"testy-backup", user=user)
+
+    available = {
+        "info": (lambda: info(c), None),
+        "start": (lambda: start(c, workload), lambda: stop(c, workload)),
+        "stop": (lambda: stop(c, workload), lambda: start(c, workload)),
+        "update": (lambda: update(c, testy_branch=testy_branch), None),
+        "launch": (lambda: launch_from_distro(distro, None, None), None),
+        "backup": (backup, None),
+    }
+    bench_cases = {}
+    for name in cases.split(","):
+        if name not in available:
+            raise Exit(f"Unknown case '{name}'.")
+        if name in ["launch", "backup"] and not aws_endpoint:
+            print(f"Skipping the '{name}' case, it needs an AWS API emulator.")
+        elif name == "launch" and not distro:
+            print("Skipping the 'launch' case, it needs a distro.")
+        else:
+            bench_cases[name] = available[name]
+
+    results, regressions = run_bench(c, bench_cases, int(repeat), baseline, aws_endpoint,
+                                     float(tolerance))
+    if save:
+        save_baseline(results, baseline)
+        print(f"Saved the results to '{baseline}'.")
+    elif regressions:
+        raise Exit("Regressions:\n  " + "\n  ".join(regressions))
+
+# Query the structured event log of the testy services on the remote server: workload starts
+# and stops, backups, snapshot validations and crash tests. This function takes the following
+# optional arguments:
+#    --start    The start of the time range, an ISO 8601 time or a duration before now such
+#               as '30m', '12h' or '7d'. The default is one day ago.
+#    --end      The end of the time range, now by default.
+#    --service  Only print the events of this service, e.g. 'testy-backup'.
+#    --event    Only print the events of this type, e.g. 'validation'.
+#    --limit    Only print the most recent events, up to this number.
+#    --json     Print the events as JSON records.
+@task
+def logs(c, start="1d", end="", service="", event="", limit=0, json=False):
+    if type(c) is not Connection:
+        print("Please specify the testy server with the -H option to use this command.")
+        return
+
+    script = get_value(c, "testy", "script_dir") + "/testy_events.py"
+    config = get_value(c, "application", "testy_dir") + f"/{testy_config}"
+    output = "json" if json else "text"
+    c.sudo(f"python3 {script} query {config} '{start}' '{end}' '{service}' '{event}' {limit} "
+           f"{output}", user=get_value(c, "application", "user"), warn=True)
+
 # ---------------------------------------------------------------------------------------
 # Helper functions
 # ---------------------------------------------------------------------------------------
 
-# Checks if Testy is running.
-def testy_running(c):
-    current_workload = get_value(c, "application", "current_workload")
+# Upload a workload spec file and create a workload from it: the workload directory holds
+# the spec file and a workload interface file that sources the spec workload interface file of
+# the testy scripts, like the sample spec workload, so the workload follows testy updates. The
+# spec is compiled on the remote server and the workload is removed if the spec is invalid.
+def upload_workload_spec(c, spec, workload_name, dest, user):
+    spec_name = os.path.basename(spec)
+    workload_dir = f"{dest}/{workload_name}"
+    try:
+        c.put(spec, "/tmp/", preserve_mode=True)
+    except Exception as e:
+        print(e)
+        print(f"Upload failed for workload '{workload_name}'.")
+        return
+
+    template = Path(get_value(c, "testy", "spec_template")).name
+    wif = f"{workload_dir}/{workload_name}.sh"
+    c.sudo(f"rm -rf {workload_dir}")
+    success = c.sudo(f"mkdir -p {workload_dir}", user=user, warn=True) and \
+        c.sudo(f"cp /tmp/{spec_name} {workload_dir}/{workload_name}.toml", user=user, warn=True) and \
+        c.sudo(f"bash -c \"printf '%s\\n' '#! /bin/bash' "
+               f"'source \\${{testy_script_dir}}/{template}' > {wif}\"", user=user, warn=True) and \
+        c.sudo(f"chmod +x {wif}", user=user, warn=True)
+    c.sudo(f"rm -f /tmp/{spec_name}")
+
+    script = get_value(c, "testy", "script_dir") + "/testy_workload.py"
+    if success and c.sudo(f"python3 {script} validate {workload_dir}/{workload_name}.toml",
+                          user=user, warn=True):
+        print(f"Upload succeeded! Workload '{workload_name}' ready for use.")
+    else:
+        c.sudo(f"rm -rf {workload_dir}")
+        print(f"Failed to add '{workload_name}'.")
+
+# Checks if Testy is running the specified workload, or any workload if none is specified.
+def testy_running(c, workload=None):
     service_name = Path(get_value(c, "testy", "testy_service")).name
 
-    if current_workload:
+    for current_workload in [workload] if workload else get_workloads(c):
         testy_service = get_service_instance_name(service_name, current_workload)
-        return c.sudo(f"systemctl is-active {testy_service}", hide=True, warn=True)
+        if c.sudo(f"systemctl is-active {testy_service}", hide=True, warn=True):
+            return True
     return False
 
+# Return the current workloads. Several workloads run alongside each other when each of them
+# has its own database directory.
+def get_workloads(c):
+
+    return [w for w in get_value(c, "application", "current_workload").split(",") if w]
+
+# Return the current workloads that are running.
+def get_running_workloads(c):
+
+    return [w for w in get_workloads(c) if testy_running(c, w)]
+
+# Return the database directory of the specified workload: the one set in its 'workload.<name>'
+# section of the testy configuration file, the default database directory otherwise.
+def get_database_dir(c, workload):
+
+    env = dict(v.split("=", 1) for v in get_env(c, "environment", workload).split())
+    return env["database_dir"]
+
+# Create the database directory of the specified workload, owned by the framework user, e.g.
+# the one set in its 'workload.<name>' section of the testy configuration file.
+def create_database_dir(c, workload):
+
+    user = get_value(c, "application", "user")
+    database_dir = get_database_dir(c, workload)
+    c.sudo(f"mkdir -p {database_dir}")
+    c.sudo(f"chown {user}:{user} {database_dir}")
+
+# Return the position of the backup timer of a workload started alongside the running ones: the
+# first position that the timers of the running workloads do not hold, so two workloads never
+# get the same one whatever the order they were stopped and started in.
+def get_backup_slot(c, running):
+
+    timer = Path(get_value(c, "testy", "backup_timer")).name
+    slots = set()
+    for workload in running:
+        conf_dir = f"/etc/systemd/system/{get_service_instance_name(timer, workload)}.d"
+        result = c.run(f"cat {conf_dir}/workload.conf", hide=True, warn=True)
+        match = re.search(r"OnActiveSec=(\d+)s", result.stdout)
+        if match:
+            slots.add((int(match.group(1)) - 86400) // backup_stagger)
+    return min(set(range(len(running) + 1)) - slots)
+
+# Checks if a running workload other than the specified one uses its database directory.
+def database_in_use(c, workload):
+
+    database_dir = get_database_dir(c, workload)
+    return any(get_database_dir(c, w) == database_dir
+               for w in get_running_workloads(c) if w != workload)
+
 # Return the systemd service name for the specified service template and instance.
 def get_service_instance_name(service_name, instance_name):
 
@@ -676,16 +1238,17 @@ def get_value(c, section, key):
     return parser_operation(c, "get_value", section, key)
 
 # Return the key/value pairs in the specified section of the testy configuration file
-# as a single string of shell environment values.
-def get_env(c, section):
+# as a single string of shell environment values. If a workload is specified, the values
+# of its 'workload.<name>' section take precedence.
+def get_env(c, section, workload=None):
 
-    return parser_operation(c, "get_env", section)
+    return parser_operation(c, "get_env", section, workload)
 
 # Return a string suitable for generating a drop-in .conf file of environment
-# values for the testy systemd services.
-def get_systemd_service_conf(c, section):
+# values for the testy systemd services, for the specified workload if any.
+def get_systemd_service_conf(c, section, workload=None):
 
-    return parser_operation(c, "get_systemd_service_conf", section)
+    return parser_operation(c, "get_systemd_service_conf", section, workload)
 
 # Set the value corresponding to the specified key from the specified section
 # of the testy configuration file.
@@ -717,9 +1280,73 @@ def parser_operation(c, func, section, key=None, value=None):
     else:
         raise Exit(f"Error: {result.stderr}")
     
+# Stop the specified workload, its service timers and the services running alongside it.
+def stop_workload(c, workload):
+
+    skip_services = False
+    if workload == "test_format":
+        skip_services = True
+    
+    if not skip_services:
+        # Stop service timers for the workloads that have it running.
+        stop_service_timers(c, workload)
+
+    # Stop testy service.
+    testy_service = get_service_instance_name(
+        Path(get_value(c, "testy", "testy_service")).name, workload)
+
+    if c.run(f"systemctl is-active {testy_service}", hide=True, warn=True):
+        print(f"Stopping {testy} workload '{workload}'. Please wait ...")
+        if c.sudo(f"systemctl stop {testy_service}", user="root"):
+            print(f"{testy} stopped successfully.")
+        else:
+            print(f"Failed to stop {testy}.")
+    else:
+        print(f"{testy} is not running workload '{workload}'.")
+
+    # The telemetry collector, the stall detector and the fault injection service are stopped
+    # with the workload.
+    for service in ["telemetry_service", "stall_service", "fault_service"]:
+        service_instance = get_service_instance_name(
+            Path(get_value(c, "testy", service)).name, workload)
+        c.sudo(f"systemctl disable {service_instance}", hide=True, warn=True)
+
+    if not skip_services:
+        # Disable the crash and backup services.
+        disable_crash_backup_services(c, workload)
+
+# Write the drop-in files of the services of a workload instance: the environment values of
+# its 'workload.<name>' section of the testy configuration file, its own slice if it has one,
+# and the delay of its backup timer. The backups of the workloads running alongside each other
+# are staggered by their position, so their snapshots do not collide.
+def install_workload_conf(c, workload, position):
+
+    conf = get_systemd_service_conf(c, "environment", workload)
+    slice_name = f"testy-workload-{workload.replace('-', '_')}.slice"
+    has_slice = c.run(f"test -f /etc/systemd/system/{slice_name}", hide=True, warn=True)
+
+    services = ["testy_service", "backup_service", "crash_service", "profile_service",
+                "telemetry_service", "stall_service", "fault_service"]
+    for service in services:
+        service_instance = get_service_instance_name(
+            Path(get_value(c, "testy", service)).name, workload)
+        service_conf = conf
+        if service == "testy_service" and has_slice:
+            service_conf += f"\nSlice={slice_name}"
+        conf_dir = f"/etc/systemd/system/{service_instance}.d"
+        c.sudo(f"mkdir -p {conf_dir}")
+        c.sudo(f"echo '{service_conf}' | sudo tee {conf_dir}/workload.conf >/dev/null")
+
+    timer_instance = get_service_instance_name(
+        Path(get_value(c, "testy", "backup_timer")).name, workload)
+    conf_dir = f"/etc/systemd/system/{timer_instance}.d"
+    c.sudo(f"mkdir -p {conf_dir}")
+    c.sudo(f"echo '[Timer]\nOnActiveSec=\nOnActiveSec={86400 + position * backup_stagger}s' "
+           f"| sudo tee {conf_dir}/workload.conf >/dev/null")
+
 # Stop the service timers
 def stop_service_timers(c, workload):
-    for timer in ["backup_timer", "crash_timer"]:
+    for timer in ["backup_timer", "crash_timer", "profile_timer"]:
         timer_name = get_service_instance_name(
             Path(get_value(c, "testy", timer)).name, workload)
         c.sudo(f"systemctl stop {timer_name}", user="root")
@@ -749,6 +1376,10 @@ def disable_crash_backup_services(c, workload):
         Path(get_value(c, "testy", "crash_timer")).name, workload)
     if c.sudo(f"systemctl disable {timer_name}", hide=True, warn=True):
         print(f"Crash test scheduling is disabled.")
+    timer_name = get_service_instance_name(
+        Path(get_value(c, "testy", "profile_timer")).name, workload)
+    if c.sudo(f"systemctl disable {timer_name}", hide=True, warn=True):
+        print("Profiling is disabled.")
 
 # Create framework superuser account.
 def create_user(c, username):
@@ -796,6 +1427,41 @@ def git_clone(c, git_url, local_dir, branch):
         else:
             raise Exit()
 
+# Create or refresh the bare mirror of a repository. The mirror is a partial clone if a filter
+# is given, e.g. 'blob:none' to only fetch the file contents needed by a checkout, on demand.
+# The branches of the source are fetched as remote branches, so the working copies created
+# from the mirror have their own local branches, and each fetch is incremental.
+def sync_mirror(c, mirror_dir, source_url, clone_filter=None):
+
+    if c.run(f"test -d {mirror_dir}", warn=True, hide=True):
+        print(f"Fetching the changes of '{source_url}' into '{mirror_dir}' ...")
+        return c.run(f"git -C {mirror_dir} fetch --prune origin", warn=True)
+
+    print(f"Creating the mirror of '{source_url}' in '{mirror_dir}' ...")
+    filter_option = f"--filter={clone_filter} " if clone_filter else ""
+    if not c.run(f"git clone --bare {filter_option}{source_url} {mirror_dir}", warn=True):
+        return False
+    with c.cd(mirror_dir):
+        c.run("git config remote.origin.fetch '+refs/heads/*:refs/remotes/origin/*'")
+        c.run("git for-each-ref --format='delete %(refname)' refs/heads | git update-ref --stdin")
+        return c.run("git fetch origin", warn=True)
+
+# Create a working copy of the specified branch as a worktree of the local mirror of a
+# repository. The worktree shares the objects of the mirror, so creating it only checks out the
+# files of the branch. A tag or a commit is checked out on a detached HEAD instead.
+def git_worktree(c, mirror_dir, local_dir, branch):
+
+    print(f"Creating a worktree of '{branch}' from '{mirror_dir}' ...")
+    if c.run(f"git -C {mirror_dir} rev-parse --verify -q refs/remotes/origin/{branch}",
+             warn=True, hide=True):
+        command = f"worktree add --track -B {branch} {local_dir} origin/{branch}"
+    else:
+        command = f"worktree add --detach {local_dir} {branch}"
+    if c.run(f"git -C {mirror_dir} {command}", warn=True):
+        print("Success!")
+    else:
+        raise Exit()
+
 # Check out the specified branch from GitHub.
 def git_checkout(c, dir, branch):
     with c.cd(dir):
@@ -828,22 +1494,35 @@ def create_working_copy(c, src, dest, user=None):
 # Build WiredTiger for the specified branch. The function returns True if the WiredTiger
 # configuration and build succeed and False if any of the steps fail. An error message is
 # printed to stderr if the command executed by the Fabric run function returns a non-zero
-# status.
-def build_wiredtiger(c, home_dir, build_dir, branch):
-
-    with c.cd(home_dir):
-        try:
-            c.run(f"rm -rf {build_dir} && mkdir {build_dir}")
-        except:
-            return False
+# status. If incremental is set and the build directory is already configured (e.g. on a
+# baked image), the existing build directory is reused and only the changes are rebuilt.
+def build_wiredtiger(c, home_dir, build_dir, branch, incremental=False):
+
+    reuse = incremental and c.run(f"test -f {build_dir}/CMakeCache.txt", warn=True, hide=True)
+    if not reuse:
+        with c.cd(home_dir):
+            try:
+                c.run(f"rm -rf {build_dir} && mkdir {build_dir}")
+            except:
+                return False
 
     with c.cd(build_dir):
         try:
-            ninja_build = c.run("which ninja", warn=True, hide=True)
+            if reuse:
+                ninja_build = c.run("test -f build.ninja", warn=True, hide=True)
+                print(f"Reusing the existing {wiredtiger} build directory '{build_dir}'.")
+            else:
+                ninja_build = c.run("which ninja", warn=True, hide=True)
+
+                # Use the compiler cache when available so rebuilds on the same host, or on an
+                # instance launched from a baked image, only compile what changed.
+                launcher = ""
+                if c.run("which ccache", warn=True, hide=True):
+                    launcher = " -DCMAKE_C_COMPILER_LAUNCHER=ccache -DCMAKE_CXX_COMPILER_LAUNCHER=ccache"
 
-            print(f"Configuring {wiredtiger} for branch '{branch}'...")
-            c.run("cmake ../. -G Ninja") if ninja_build else c.run("cmake ../.")
-            print("-- Configuration complete!")
+                print(f"Configuring {wiredtiger} for branch '{branch}'...")
+                c.run("cmake ../. -G Ninja" + launcher) if ninja_build else c.run("cmake ../." + launcher)
+                print("-- Configuration complete!")
 
             print(f"Building {wiredtiger} for branch '{branch}' ...")
             if ninja_build:
@@ -856,6 +1535,139 @@ def build_wiredtiger(c, home_dir, build_dir, branch):
 
     return True
 
+# Pre-warm the root volume of a server launched from a snapshot by reading the database
+# files, most recently modified first, and optionally every block of the volume. The order
+# in which the files are read is saved for the validation before the reads start. With the
+# asynchronous option, return the running pre-warm once the order is saved, to be joined.
+def prewarm_volume(c, mode, threads, asynchronous=False):
+
+    script = "scripts/testy_prewarm.py"
+    c.put(script, "/tmp/")
+    remote_script = "/tmp/" + Path(script).name
+
+    database_dir = get_value(c, "application", "database_dir")
+    command = f"python3 {remote_script} prewarm_files {database_dir} {threads} {verify_order_file}"
+    if mode == "device":
+        command += f" && python3 {remote_script} prewarm_device \"\" {threads}"
+    print(f"Pre-warming the database files in '{database_dir}'"
+          f"{' and the root volume' if mode == 'device' else ''} ...")
+    c.sudo(f"rm -f {verify_order_file}")
+    prewarming = c.sudo(f"bash -c 'trap \"rm -f {remote_script}\" EXIT; {command}'",
+                        asynchronous=asynchronous)
+    if not asynchronous:
+        return None
+    c.run(f"timeout 300 bash -c 'until [ -f {verify_order_file} ]; do sleep 1; done'")
+    return prewarming
+
+# Return the name of the Linux distribution running on the remote host.
+def get_release(c):
+
+    result = c.run("cat /etc/*-release", hide=True)
+    d = dict(line.split('=') for line in result.stdout.split('\n') if '=' in line)
+    return d["PRETTY_NAME"].strip('\"')
+
+# Run a sequence of steps on the remote host. Each step is a (description, function) pair,
+# and the function is called with the connection, the local testy configuration and a
+# dictionary of arguments.
+def run_steps(c, steps, config, args):
+
+    for i, (description, step) in enumerate(steps, start=1):
+        print(f"\n[{i}/{len(steps)}] {description} ...", flush=True)
+        step(c, config, args)
+
+# Create the framework user and directories.
+def setup_user_and_directories(c, config, args):
+
+    user = config.get("application", "user")
+    create_user(c, user)
+
+    testy_dir = config.get("application", "testy_dir")
+    database_dir = config.get("application", "database_dir")
+    failure_dir = config.get("application", "failure_dir")
+    service_script_dir = config.get("application", "service_script_dir")
+    # The bisections run as the owner of the WiredTiger repository.
+    bisect_dir = config.get("bisect", "bisect_dir")
+
+    state = [config.get(section, option) for section, option in state_dirs]
+
+    for dir in [testy_dir, database_dir, failure_dir, service_script_dir, bisect_dir] + state:
+        create_directory(c, dir)
+    c.sudo(f"chown -R $(whoami):$(whoami) {testy_dir}")
+    c.sudo(f"chown -R {user}:{user} {database_dir} {' '.join(state)}")
+
+# Install prerequisite software.
+def setup_packages(c, config, args):
+
+    install_packages(c, args["release"])
+
+# Clone the testy and WiredTiger repositories. Repositories that already exist (e.g. on a
+# baked image) are updated to the requested branch instead.
+def setup_repositories(c, config, args):
+
+    # Add github to known_hosts.
+    c.run("touch ~/.ssh/known_hosts && ssh-keygen -R github.com && " \
+          "ssh-keyscan -t rsa github.com >> ~/.ssh/known_hosts", hide=True)
+
+    for repo in [("testy", args["testy_branch"]), ("wiredtiger", args["wiredtiger_branch"])]:
+        home_dir = config.get(repo[0], "home_dir")
+        if c.run(f"test -d {home_dir}", warn=True, hide=True):
+            if not git_checkout(c, home_dir, repo[1]):
+                raise Exit(f"Failed to check out branch '{repo[1]}' in '{home_dir}'.")
+        elif config.get(repo[0], "mirror_dir", fallback=""):
+            # The working copy is a worktree of the local mirror of the repository.
+            mirror_dir = config.get(repo[0], "mirror_dir")
+            source_url = config.get(repo[0], "mirror_url") or config.get(repo[0], "git_url")
+            if not sync_mirror(c, mirror_dir, source_url, config.get(repo[0], "clone_filter")):
+                raise Exit(f"Failed to create the mirror of '{source_url}' in '{mirror_dir}'.")
+            git_worktree(c, mirror_dir, home_dir, repo[1])
+        else:
+            git_clone(c, config.get(repo[0], "git_url"), home_dir, repo[1])
+
+# Create working files and directories that can be modified by the framework user.
+def setup_working_copies(c, config, args):
+
+    user = config.get("application", "user")
+    testy_dir = config.get("application", "testy_dir")
+    create_working_copy(c, config.get("testy", "home_dir") + f"/{testy_config}",
+              testy_dir, user)
+    create_working_copy(c, config.get("testy", "workload_dir"), testy_dir, user)
+    create_working_copy(c, config.get("testy", "service_script_dir"), testy_dir, user)
+
+# Build WiredTiger, reusing an existing build directory if there is one.
+def setup_wiredtiger_build(c, config, args):
+
+    branch = args["wiredtiger_branch"]
+    if not build_wiredtiger(c, config.get("wiredtiger", "home_dir"),
+                            config.get("wiredtiger", "build_dir"), branch, incremental=True):
+        raise Exit(f"Failed to build {wiredtiger} for branch '{branch}'.")
+
+# Install the testy services and timers.
+def setup_services(c, config, args):
+
+    install_slices(c)
+    for service in testy_services:
+        install_service(c, config.get("testy", service))
+    for timer in testy_timers:
+        install_service_timer(c, config.get("testy", timer))
+
+    # The event log is shipped whether or not a workload is running.
+    events_timer = Path(config.get("testy", "events_timer")).name
+    c.sudo("systemctl daemon-reload")
+    c.sudo(f"systemctl enable --now {events_timer}", warn=True, hide=True)
+
+# Remove host-specific state from a baked server so instances launched from its image
+# start clean, e.g. the backup journals of the baked server. The compiler cache and the
+# WiredTiger build directory are kept.
+def prepare_image(c, config, args):
+
+    dirs = [config.get("application", "database_dir"), config.get("application", "failure_dir")]
+    dirs += [config.get(section, option) for section, option in state_dirs]
+    c.sudo(f"bash -c 'rm -rf {' '.join(dir + '/*' for dir in dirs)}'")
+    c.run("ccache --show-stats", warn=True)
+    c.sudo("cloud-init clean --logs", warn=True, hide=True)
+    c.sudo("journalctl --rotate", warn=True, hide=True)
+    c.sudo("journalctl --vacuum-time=1s", warn=True, hide=True)
+
 # Install prerequisite software packages.
 def install_packages(c, release):
 
@@ -874,8 +1686,8 @@ def install_packages(c, release):
 
     if release.startswith("Amazon Linux 2"):
         c.sudo(f"{installer} -y update", warn=True, hide=True)
-        packages = ["gcc10", "gcc10-c++", "git", "libarchive", "python3-devel", "swig",
-                    "unzip"]
+        packages = ["ccache", "gcc10", "gcc10-c++", "gdb", "git", "libarchive", "perf",
+                    "python3-devel", "swig", "unzip"]
         for package in packages:
             if c.run(f"{installer} list installed {package}", warn=True, hide=True):
                 print(f" -- Package '{package}' is already the newest version.", flush=True)
@@ -897,8 +1709,8 @@ def install_packages(c, release):
         install_bash(c)
 
     elif release.startswith("Ubuntu 20") or release.startswith("Ubuntu 22"):
-        packages = ["cmake", "ccache", "gcc", "g++", "git", "ninja-build", "python3-dev", "swig",
-                    "unzip"]
+        packages = ["cmake", "ccache", "gcc", "g++", "gdb", "git", "linux-tools-common",
+                    "ninja-build", "python3-dev", "python3-pip", "swig", "unzip"]
         c.sudo(f"{installer} update", warn=True, hide=True)
         for package in packages:
             if c.run(f"dpkg -s {package}", warn=True, hide=True):
@@ -909,8 +1721,9 @@ def install_packages(c, release):
 
     elif release.startswith("Ubuntu 18"):
         c.sudo("add-apt-repository ppa:ubuntu-toolchain-r/test", hide=True)
-        packages = ["cmake", "ccache", "gcc-11", "g++-11", "git", "ninja-build",
-                    "python3-dev", "swig", "unzip"]
+        packages = ["cmake", "ccache", "gcc-11", "g++-11", "gdb", "git",
+                    "linux-tools-common", "ninja-build", "python3-dev", "python3-pip", "swig",
+                    "unzip"]
         c.sudo(f"{installer} update", warn=True, hide=True)
         for package in packages:
             if c.run(f"dpkg -s {package}", warn=True, hide=True):
@@ -924,6 +1737,19 @@ def install_packages(c, release):
     else:
         raise Exit(f"Package installation is not implemented for {release}.")
 
+    # Workload spec files are TOML, which needs the tomli package before Python 3.11.
+    if not c.run("python3 -c 'import tomllib'", warn=True, hide=True):
+        if c.sudo("python3 -m pip install tomli", warn=True, hide=True):
+            print(" -- Package 'tomli' installed by pip.", flush=True)
+
+    # The profiling service samples the workload with perf, which on Ubuntu is packaged for
+    # each kernel, and falls back to py-spy.
+    if release.startswith("Ubuntu"):
+        if c.sudo(f"{installer} -y install linux-tools-$(uname -r)", warn=True, hide=True):
+            print(f" -- Package 'linux-tools-$(uname -r)' installed by {installer}.", flush=True)
+    if c.sudo("python3 -m pip install py-spy", warn=True, hide=True):
+        print(" -- Package 'py-spy' installed by pip.", flush=True)
+
     install_aws_cli(c)
     print("Package installation complete!")
 
@@ -983,6 +1809,17 @@ def install_service(c, service):
         c.sudo("systemctl daemon-reload")
         print("done!")
 
+# Generate the systemd slices that bound the resources of the workload and of the background
+# services, from the cgroups section of the testy configuration file.
+def install_slices(c):
+
+    script = get_value(c, "testy", "script_dir") + "/testy_cgroups.py"
+    config = get_value(c, "application", "testy_dir") + f"/{testy_config}"
+    print("Installing the testy slices ... ", end='', flush=True)
+    c.sudo(f"python3 {script} install {config}", hide=True)
+    c.sudo("systemctl daemon-reload")
+    print("done!")
+
 # Install a systemd timer.
 def install_service_timer(c, service_timer):
 
@@ -1043,21 +1880,56 @@ def update_testy(c, branch):
     if not git_checkout(c, testy_git_dir, branch):
         raise Exit(f"Failed to update {testy} to branch '{branch}'.")
 
-    # Copy testy config and workload directory.
+    # Copy testy config and workload directory. The workload sections of the configuration
+    # are kept.
     user = get_value(c, "application", "user")
+    config = get_value(c, "application", "testy_dir") + f"/{testy_config}"
+    c.sudo(f"cp {config} /tmp/testy_config.bak", user=user)
     create_working_copy(c, f"{testy_git_dir}/{testy_config}",
                         get_value(c, "application", "testy_dir"), user)
+    c.sudo(f"python3 {get_value(c, 'testy', 'parse_script')} copy_sections "
+           f"/tmp/testy_config.bak {config} workload.", user=user)
     create_working_copy(c, get_value(c, "testy", "workload_dir") + "/*",
                         get_value(c, "application", "workload_dir"), user)
     create_working_copy(c, get_value(c, "testy", "service_script_dir") + "/*",
                         get_value(c, "application", "service_script_dir"), user)
 
-    # Update services.
-    services = ["testy_service", "backup_service", "crash_service"]
-    for service in services:
+    # Update the slices and the services. The services run in the slices.
+    install_slices(c)
+    for service in testy_services:
         install_service(c, get_value(c, "testy", service))
-    timers = ["backup_timer", "crash_timer"]
-    for timer in timers:
+    for timer in testy_timers:
         install_service_timer(c, get_value(c, "testy", timer))
+    c.sudo("systemctl daemon-reload")
+
+    # The event log is shipped whether or not a workload is running.
+    events_timer = Path(get_value(c, "testy", "events_timer")).name
+    c.sudo(f"systemctl enable --now {events_timer}", warn=True, hide=True)
 
     print(f"\nSuccessfully updated {testy} to branch '{branch}'.\n")
+
+# The steps run to install testy on a server, in order.
+install_steps = [
+    ("Creating the framework user and directories", setup_user_and_directories),
+    ("Installing prerequisite software", setup_packages),
+    ("Cloning the repositories", setup_repositories),
+    ("Creating the framework working copies", setup_working_copies),
+    (f"Building {wiredtiger}", setup_wiredtiger_build),
+    ("Installing the testy services", setup_services),
+]
+
+# The steps run to install testy on a server launched from a baked image: the packages are
+# already installed, and the repositories and the WiredTiger build are only updated.
+baked_install_steps = [
+    ("Creating the framework user and directories", setup_user_and_directories),
+    ("Updating the repositories", setup_repositories),
+    ("Creating the framework working copies", setup_working_copies),
+    (f"Building {wiredtiger}", setup_wiredtiger_build),
+    ("Installing the testy services", setup_services),
+]
+
+# The steps run to bake a reusable testy image: a full install, followed by removing the
+# host-specific state.
+bake_steps = install_steps + [
+    ("Preparing the server for imaging", prepare_image),
+]
@@ -0,0 +1,576 @@
+import configparser as cp
+import fcntl, glob, json, os, subprocess, sys, time, uuid
+from testy_events import emit
+from testy_fault import get_device_name
+from testy_retention import aws, prune
+
+# Back up the database with a snapshot of the root volume and validate it on a volume restored
+# from the snapshot. The backup is a sequence of steps: create the snapshot, wait for it to
+# complete, create a volume from it, attach and mount the volume, run the validation of the
+# workload against it, then unmount, detach and delete the volume. The snapshot is deleted once
+# validated, and kept for debugging otherwise.
+#
+# Each step is recorded in a journal with the IDs of the resources it created, so a backup that
+# is interrupted by a reboot, a timeout of the service or an API error resumes from its last
+# completed step the next time a backup runs, and a completed snapshot is never waited for
+# again. The snapshots and volumes are tagged with the ID of their backup, which finds them
+# after an interruption between their creation and the journal update. Backup volumes that no
+# journal refers to are orphans, and are removed before each new backup.
+
+# The backup settings used when the testy configuration file has no 'backup' section or is
+# missing some of its options. The timeouts are in seconds. With the 'stream' mode, the backup
+# service streams the database files with the backup cursor of WiredTiger instead, see
+# testy_hotbackup.py. The crash testing service always snapshots the crashed database.
+default_settings = {
+    "mode": "snapshot",
+    "journal_dir": "/srv/testy/backup",
+    "device_name": "/dev/xvdf",
+    "mount_point": "/mnt/backup",
+    "snapshot_timeout": 10800,
+    "volume_timeout": 3600,
+    "poll_interval": 10,
+    "metadata_url": "http://169.254.169.254/latest/meta-data",
+}
+
+# The backups of all the workloads and services take their snapshots one at a time.
+lock_file = "/tmp/testy-snapshot.lock"
+lock_timeout = 36000
+
+# The steps of a backup, in order.
+steps = ["checked", "snapshot_created", "snapshot_completed", "volume_created",
+         "volume_available", "volume_attached", "mounted", "validated", "unmounted",
+         "detached", "volume_deleted", "snapshot_deleted"]
+
+# The steps that use the backup volume on the server, skipped with the 'skip_mount' setting.
+mount_steps = ["mounted", "validated", "unmounted"]
+
+# A step that fails this many times abandons the backup.
+max_attempts = 3
+
+class BackupError(Exception):
+    pass
+
+class BackupTimeout(BackupError):
+    pass
+
+# Return the backup settings from the 'backup' section of the testy configuration file.
+def get_settings(config):
+
+    parser = cp.ConfigParser(interpolation=cp.ExtendedInterpolation())
+    parser.read(config)
+
+    settings = dict(default_settings)
+    if parser.has_section("backup"):
+        section = parser["backup"]
+        for key, value in default_settings.items():
+            settings[key] = type(value)(section.get(key, value))
+    # The instance metadata endpoint can be replaced by a stand-in, e.g. for benchmarks.
+    settings["metadata_url"] = os.environ.get("testy_metadata_url") or settings["metadata_url"]
+    # Against an AWS API emulator, the attached volume is no device of the server, and the
+    # steps mounting and validating it are skipped.
+    settings["skip_mount"] = os.environ.get("testy_skip_mount") == "1"
+    settings["workload_dir"] = os.environ.get("workload_dir") or \
+                               parser.get("application", "workload_dir")
+    settings["failure_dir"] = os.environ.get("failure_dir") or \
+                              parser.get("application", "failure_dir")
+    settings["failure_file"] = os.environ.get("failure_file") or \
+                               parser.get("application", "failure_file")
+    return settings
+
+def get_metadata(settings, path):
+
+    result = subprocess.run(["curl", "-sf", f"{settings['metadata_url'].rstrip('/')}/{path}"],
+                            capture_output=True, text=True)
+    return result.stdout.strip()
+
+def sudo(*args, check=False):
+    return subprocess.run(["sudo", *args], capture_output=True, text=True, check=check)
+
+# Wait until the function returns a true value, or raise an error after the timeout counted
+# from the given start time, which is kept across interruptions.
+def wait_for(function, start, timeout, interval, message):
+
+    while True:
+        value = function()
+        if value:
+            return value
+        if time.time() - start > timeout:
+            raise BackupTimeout(f"Waited {timeout} seconds for {message}.")
+        time.sleep(interval)
+
+# Hold the snapshot lock, waiting for the backup of another workload to complete.
+def acquire_lock():
+
+    f = open(lock_file, "a")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return f
+    except BlockingIOError:
+        print("Waiting for the snapshot of another workload to complete ...", flush=True)
+    start = time.monotonic()
+    while time.monotonic() - start < lock_timeout:
+        time.sleep(10)
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return f
+        except BlockingIOError:
+            pass
+    raise BackupError("Timed out waiting for the snapshot of another workload.")
+
+class Backup:
+    def __init__(self, config, settings, journal):
+        self.config = config
+        self.settings = settings
+        self.journal = journal
+        self.path = os.path.join(settings["journal_dir"],
+                                 f"{journal['service']}-{journal['workload']}.json")
+
+    # Start a new backup of the workload for the given service, e.g. 'testy-backup'.
+    @classmethod
+    def create(cls, config, settings, workload, service):
+        journal = {"backup_id": uuid.uuid4().hex[:16], "workload": workload,
+                   "service": service, "step": None, "started": time.time(), "history": []}
+        return cls(config, settings, journal)
+
+    # Return the backups interrupted before their completion, oldest first.
+    @classmethod
+    def pending(cls, config, settings):
+        backups = []
+        for path in glob.glob(os.path.join(settings["journal_dir"], "*.json")):
+            try:
+                with open(path) as f:
+                    backups.append(cls(config, settings, json.load(f)))
+            except (OSError, ValueError):
+                print(f"Error: Unable to read the backup journal '{path}'.")
+        return sorted(backups, key=lambda b: b.journal["started"])
+
+    # Record the completion of a step, replacing the journal atomically.
+    def save(self, step=None, **values):
+        self.journal.update(values)
+        if step:
+            self.journal["step"] = step
+            self.journal["history"].append({"step": step, "time": time.time()})
+        os.makedirs(self.settings["journal_dir"], exist_ok=True)
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(self.journal, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.path + ".tmp", self.path)
+
+    # Keep the journal of the last backup of the workload for debugging.
+    def close(self):
+        os.replace(self.path, self.path[:-len(".json")] + ".last")
+
+    def emit_event(self, event, *fields):
+        try:
+            emit(self.config, self.journal["service"], event,
+                 f"workload={self.journal['workload']}",
+                 f"instance_id={self.journal.get('instance_id')}", *fields)
+        except Exception as e:
+            print(f"Error: Failed to record event '{event}': {e}")
+
+    def elapsed(self, step):
+        times = [h["time"] for h in self.journal["history"] if h["step"] == step]
+        return int(time.time() - (times[-1] if times else self.journal["started"]))
+
+    # Run the steps after the last completed one. A step that fails raises an error and leaves
+    # the journal at the previous step, to resume from. The backup is abandoned when a step
+    # times out or fails too many times, whatever the error.
+    def run(self):
+        done = steps.index(self.journal["step"]) + 1 if self.journal["step"] else 0
+        if done:
+            print(f"Resuming backup '{self.journal['backup_id']}' of workload "
+                  f"'{self.journal['workload']}' after step '{self.journal['step']}'.",
+                  flush=True)
+        for step in steps[done:]:
+            if step in mount_steps and self.settings["skip_mount"]:
+                print(f"Skipping step '{step}', the backup volume is not mounted.", flush=True)
+                self.save(step, **({"validation": "skipped"} if step == "validated" else {}))
+                continue
+            try:
+                getattr(self, step)()
+            except Exception as e:
+                attempts = self.journal.get("attempts", 0) + 1
+                if isinstance(e, BackupTimeout) or attempts >= max_attempts:
+                    self.abandon()
+                elif os.path.exists(self.path):
+                    self.save(attempts=attempts)
+                raise
+            self.save(step, attempts=0)
+        self.close()
+
+    # Give up the backup: remove its volume and keep its snapshot, if any, for the retention
+    # policy to remove in time.
+    def abandon(self):
+        print(f"Abandoning backup '{self.journal['backup_id']}'.", flush=True)
+        if self.journal.get("volume_id"):
+            self.unmounted()
+            self.detached()
+            self.volume_deleted()
+        if os.path.exists(self.path):
+            self.close()
+
+    def checked(self):
+        instance_id = get_metadata(self.settings, "instance-id")
+        print(f"Starting database backup for instance '{instance_id}' ...", flush=True)
+        self.save(instance_id=instance_id)
+        self.emit_event("backup_started")
+
+        instances = aws("ec2", "describe-instances", "--instance-ids", instance_id,
+                        "--query", "Reservations[*].Instances[*]")
+        instance = instances[0][0] if instances and instances[0] else None
+        if not instance:
+            raise BackupError(f"Instance '{instance_id}' not found.")
+
+        # The volumes of earlier backups that no journal refers to would be counted as
+        # attached volumes, remove them first.
+        collect_orphans(self.settings, instance_id, {self.journal["backup_id"]})
+
+        volumes = aws("ec2", "describe-volumes", "--filters",
+                      f"Name=attachment.instance-id,Values={instance_id}",
+                      "--query", "Volumes[*].{id:VolumeId,device:Attachments[0].Device}")
+        if not volumes:
+            raise BackupError(f"No volumes found for instance '{instance_id}'.")
+        if len(volumes) > 1:
+            raise BackupError(f"Multiple volumes found for instance '{instance_id}'.")
+        root = [v["id"] for v in volumes if v["device"] == instance.get("RootDeviceName")]
+        if not root:
+            raise BackupError(f"No root volume found for instance '{instance_id}'.")
+
+        # Apply the snapshot retention policy to the previous snapshots of this instance.
+        # Snapshots whose failure file is still on the server are kept.
+        failures = glob.glob(os.path.join(self.settings["failure_dir"], "snap-*"))
+        protected_ids = [os.path.splitext(os.path.basename(f))[0] for f in failures]
+        try:
+            prune(self.config, instance_id, "false", ",".join(protected_ids))
+        except Exception as e:
+            print(f"Error: Failed to apply the snapshot retention policy for instance "
+                  f"'{instance_id}': {e}")
+
+        tags = {t["Key"]: t["Value"] for t in instance.get("Tags", [])
+                if not t["Key"].startswith("aws:")}
+        self.save(root_volume_id=root[0], tags=tags,
+                  availability_zone=get_metadata(self.settings, "placement/availability-zone"))
+
+    # Return the tag specification of a new resource: the tags of the instance and the ID of
+    # the backup.
+    def tag_specification(self, resource_type):
+        tags = {**self.journal["tags"], "TestyBackup": self.journal["backup_id"],
+                "InstanceID": self.journal["instance_id"]}
+        return json.dumps([{"ResourceType": resource_type,
+                            "Tags": [{"Key": k, "Value": v} for k, v in tags.items()]}])
+
+    # Return the resource of the given type tagged with the ID of this backup, if any.
+    def find_resource(self, resource_type):
+        filters = [f"Name=tag:TestyBackup,Values={self.journal['backup_id']}"]
+        if resource_type == "snapshot":
+            found = aws("ec2", "describe-snapshots", "--owner-ids", "self", "--filters",
+                        *filters, "--query", "Snapshots[*].SnapshotId")
+        else:
+            found = aws("ec2", "describe-volumes", "--filters", *filters,
+                        "--query", "Volumes[*].VolumeId")
+        return found[0] if found else None
+
+    def name_tag(self, resource_id):
+        name = self.journal["tags"].get("LaunchTemplateName", "")
+        aws("ec2", "create-tags", "--resources", resource_id, "--tags",
+            f"Key=Name,Value=testy-{name}-{resource_id.replace('-', '')}")
+
+    def snapshot_created(self):
+        snapshot_id = self.find_resource("snapshot")
+        if not snapshot_id:
+            snapshot_id = aws("ec2", "create-snapshot",
+                              "--volume-id", self.journal["root_volume_id"],
+                              "--tag-specifications", self.tag_specification("snapshot"),
+                              "--description", f"testy snapshot for {self.journal['instance_id']}",
+                              "--query", "SnapshotId")
+        self.save(snapshot_id=snapshot_id)
+        self.name_tag(snapshot_id)
+
+    def snapshot_completed(self):
+        snapshot_id = self.journal["snapshot_id"]
+
+        def completed():
+            state = aws("ec2", "describe-snapshots", "--snapshot-ids", snapshot_id,
+                        "--query", "Snapshots[0].State")
+            if state == "error":
+                raise BackupError(f"Snapshot '{snapshot_id}' failed.")
+            return state == "completed"
+
+        try:
+            wait_for(completed, self.journal["history"][-1]["time"],
+                     self.settings["snapshot_timeout"], self.settings["poll_interval"],
+                     f"snapshot '{snapshot_id}' to complete")
+        except BackupError:
+            self.emit_event("snapshot_created", f"snapshot_id={snapshot_id}", "result=failed",
+                            f"duration={self.elapsed('checked')}")
+            raise
+        print(f"Created backup snapshot '{snapshot_id}'.", flush=True)
+        self.emit_event("snapshot_created", f"snapshot_id={snapshot_id}", "result=success",
+                        f"duration={self.elapsed('checked')}")
+
+    def volume_created(self):
+        volume_id = self.find_resource("volume")
+        if not volume_id:
+            volume_id = aws("ec2", "create-volume", "--snapshot-id", self.journal["snapshot_id"],
+                            "--availability-zone", self.journal["availability_zone"],
+                            "--tag-specifications", self.tag_specification("volume"),
+                            "--query", "VolumeId")
+        self.save(volume_id=volume_id)
+        self.name_tag(volume_id)
+        print(f"Created backup volume '{volume_id}' from snapshot "
+              f"'{self.journal['snapshot_id']}'.", flush=True)
+
+    def volume_state(self):
+        return aws("ec2", "describe-volumes", "--volume-ids", self.journal["volume_id"],
+                   "--query", "Volumes[0].State")
+
+    def volume_available(self):
+        volume_id = self.journal["volume_id"]
+        start = self.journal["history"][-1]["time"]
+        wait_for(lambda: aws("ec2", "describe-volume-status", "--volume-ids", volume_id,
+                             "--query", "VolumeStatuses[0].VolumeStatus.Status") == "ok",
+                 start, self.settings["volume_timeout"], self.settings["poll_interval"],
+                 f"volume '{volume_id}' to be ok")
+        wait_for(lambda: self.volume_state() == "available", start,
+                 self.settings["volume_timeout"], self.settings["poll_interval"],
+                 f"volume '{volume_id}' to be available")
+
+    def volume_attached(self):
+        if self.volume_state() == "available":
+            aws("ec2", "attach-volume", "--device", self.settings["device_name"],
+                "--instance-id", self.journal["instance_id"],
+                "--volume-id", self.journal["volume_id"])
+        wait_for(lambda: self.volume_state() == "in-use", self.journal["history"][-1]["time"],
+                 self.settings["volume_timeout"], self.settings["poll_interval"],
+                 f"volume '{self.journal['volume_id']}' to attach")
+
+    def mounted(self):
+        # The mount point is only used by the backup holding the lock, so a mounted volume is
+        # the one of this backup, mounted before an interruption.
+        mount_point = self.settings["mount_point"]
+        if subprocess.run(["mountpoint", "-q", mount_point]).returncode == 0:
+            device = subprocess.run(["findmnt", "-n", "-o", "SOURCE", mount_point],
+                                    capture_output=True, text=True).stdout.strip()
+            self.save(mount_device=device)
+            return
+
+        # The restored volume has the file system of the root volume, and is its only
+        # unmounted device.
+        root_device = subprocess.run(["findmnt", "-n", "-o", "SOURCE", "/"],
+                                     capture_output=True, text=True).stdout.strip()
+        fs = sudo("blkid", "-o", "value", "-s", "TYPE", root_device).stdout.strip()
+
+        def unmounted_device():
+            for device in sudo("blkid", "-t", f"TYPE={fs}", "-o", "device").stdout.split():
+                if subprocess.run(["findmnt", "-n", device], capture_output=True).returncode:
+                    return device
+
+        device = wait_for(unmounted_device, self.journal["history"][-1]["time"], 300,
+                          self.settings["poll_interval"], "the backup volume device")
+        # XFS file systems need a special mount option if the UUID is not unique.
+        options = "rw,nouuid" if fs == "xfs" else "rw"
+        sudo("mkdir", "-p", mount_point)
+        if sudo("mount", "-t", fs, "-o", options, device, mount_point).returncode:
+            raise BackupError(f"Failed to mount device '{device}'.")
+        self.save(mount_device=device)
+
+    def set_validation(self, value, *resources):
+        aws("ec2", "create-tags", "--resources", *resources, "--tags",
+            f"Key=Validation,Value={value}")
+
+    def validated(self):
+        snapshot_id, volume_id = self.journal["snapshot_id"], self.journal["volume_id"]
+        workload = self.journal["workload"]
+        aws("ec2", "create-tags", "--resources", snapshot_id, volume_id, "--tags",
+            "Key=Validation,Value=none", f"Key=InstanceID,Value={self.journal['instance_id']}")
+
+        # The validation script is the one of the database being validated, on the volume.
+        mount_point = self.settings["mount_point"]
+        script = mount_point + os.path.join(self.settings["workload_dir"], workload,
+                                            f"{workload}.sh")
+        print(f"Running validation script '{script}' on volume '{volume_id}'.", flush=True)
+        self.set_validation("incomplete", snapshot_id, volume_id)
+        start = time.time()
+        if subprocess.run([script, "validate", mount_point]).returncode == 0:
+            self.set_validation("success", snapshot_id, volume_id)
+            print(f"Successfully validated database backup snapshot '{snapshot_id}'.")
+            self.emit_event("validation", f"snapshot_id={snapshot_id}", "result=success",
+                            f"duration={int(time.time() - start)}")
+            self.save(validation="success")
+            return
+
+        self.set_validation("failed", snapshot_id, volume_id)
+        # Rename the failure file to the snapshot ID, and tag the snapshot with it so the
+        # retention policy keeps it.
+        failure_dir, failure_file = self.settings["failure_dir"], f"{snapshot_id}.txt"
+        sudo("mv", "-v", os.path.join(failure_dir, self.settings["failure_file"]),
+             os.path.join(failure_dir, failure_file))
+        aws("ec2", "create-tags", "--resources", snapshot_id, "--tags",
+            f"Key=FailureFile,Value={failure_file}")
+        print(f"Validation failed for {snapshot_id}, logs saved to "
+              f"{os.path.join(failure_dir, failure_file)}")
+        self.emit_event("validation", f"snapshot_id={snapshot_id}", "result=failed",
+                        f"duration={int(time.time() - start)}", f"failure_file={failure_file}")
+        self.save(validation="failed")
+
+    def unmounted(self):
+        mount_point = self.settings["mount_point"]
+        if subprocess.run(["mountpoint", "-q", mount_point]).returncode == 0 and \
+           sudo("umount", mount_point).returncode:
+            raise BackupError(f"Failed to unmount '{mount_point}'.")
+
+    def detached(self):
+        detach_volume(self.settings, self.journal["volume_id"], time.time())
+
+    def volume_deleted(self):
+        delete_volume(self.journal["volume_id"])
+        print(f"Deleted volume '{self.journal['volume_id']}'.", flush=True)
+
+    # Delete the snapshot once it has been validated, or its validation skipped. A snapshot
+    # that failed validation is kept for debugging.
+    def snapshot_deleted(self):
+        if self.journal.get("validation") in ["success", "skipped"]:
+            snapshot_id = self.journal["snapshot_id"]
+            print(f"Deleting snapshot '{snapshot_id}' ...")
+            try:
+                aws("ec2", "delete-snapshot", "--snapshot-id", snapshot_id)
+                print(f"Deleted snapshot '{snapshot_id}'.")
+            except RuntimeError as e:
+                print(f"Error: Failed to delete snapshot '{snapshot_id}': {e}")
+
+# Detach a volume, if attached, and wait for it to be available.
+def detach_volume(settings, volume_id, start):
+
+    state = lambda: aws("ec2", "describe-volumes", "--volume-ids", volume_id,
+                        "--query", "Volumes[0].State")
+    if state() == "in-use":
+        aws("ec2", "detach-volume", "--volume-id", volume_id)
+    wait_for(lambda: state() == "available", start, settings["volume_timeout"],
+             settings["poll_interval"], f"volume '{volume_id}' to detach")
+
+# Delete a volume, which may have been deleted already.
+def delete_volume(volume_id):
+
+    try:
+        aws("ec2", "delete-volume", "--volume-id", volume_id)
+    except RuntimeError as e:
+        if "NotFound" not in str(e):
+            raise
+
+# Remove the backup volumes of the instance that no journal refers to: the volumes tagged with
+# another backup ID, and any volume attached at the backup device, which earlier backups left
+# behind when interrupted.
+def collect_orphans(settings, instance_id, backup_ids):
+
+    tagged = aws("ec2", "describe-volumes", "--filters",
+                 f"Name=tag:InstanceID,Values={instance_id}", "Name=tag-key,Values=TestyBackup",
+                 "--query",
+                 "Volumes[*].{id:VolumeId,backup:Tags[?Key=='TestyBackup']|[0].Value}") or []
+    attached = aws("ec2", "describe-volumes", "--filters",
+                   f"Name=attachment.instance-id,Values={instance_id}",
+                   f"Name=attachment.device,Values={settings['device_name']}",
+                   "--query", "Volumes[*].VolumeId") or []
+    orphans = {v["id"] for v in tagged if v["backup"] not in backup_ids}
+    orphans |= set(attached) - {v["id"] for v in tagged if v["backup"] in backup_ids}
+    if not orphans:
+        return
+
+    mount_point = settings["mount_point"]
+    if subprocess.run(["mountpoint", "-q", mount_point]).returncode == 0:
+        sudo("umount", mount_point)
+    for volume_id in sorted(orphans):
+        print(f"Removing orphan backup volume '{volume_id}' ...", flush=True)
+        detach_volume(settings, volume_id, time.time())
+        delete_volume(volume_id)
+
+# Complete the interrupted backups, oldest first, holding the snapshot lock. Return False if
+# one of them failed again.
+def resume(config):
+
+    settings = get_settings(config)
+    lock = acquire_lock()
+    try:
+        return resume_pending(config, settings) is not None
+    finally:
+        lock.close()
+
+# Complete the interrupted backups, oldest first. Return the workloads and services of the
+# completed backups, or None if one of them failed again.
+def resume_pending(config, settings):
+
+    resumed = set()
+    for backup in Backup.pending(config, settings):
+        try:
+            backup.run()
+        except (BackupError, OSError, RuntimeError) as e:
+            print(f"Error: Backup '{backup.journal['backup_id']}' failed after step "
+                  f"'{backup.journal['step']}': {e}")
+            return None
+        resumed.add((backup.journal["workload"], backup.journal["service"]))
+    return resumed
+
+# Back up and validate the database of the workload for the given service, after completing
+# the interrupted backups. An interrupted backup of the workload for the service completes in
+# place of a new one. Return False if a backup failed, to be resumed by the next run.
+def run(config, workload, service="testy-backup"):
+
+    settings = get_settings(config)
+    if settings["mode"] == "stream" and service == "testy-backup":
+        from testy_hotbackup import run as stream
+        return stream(config, workload, service)
+
+    # A database on a fault device is in its image file, which the snapshot only holds as a
+    # file, and the validation would find an empty mount point.
+    if os.path.exists(os.path.join("/dev/mapper", get_device_name(workload))):
+        print(f"Error: The database of workload '{workload}' is on a fault device, which a "
+              f"snapshot of the root volume cannot validate. The backups of such a workload "
+              f"stream the database files with 'mode = stream' in the 'backup' section.")
+        return False
+
+    lock = acquire_lock()
+    try:
+        resumed = resume_pending(config, settings)
+        if resumed is None:
+            return False
+        if (workload, service) in resumed:
+            return True
+        backup = Backup.create(config, settings, workload, service)
+        try:
+            backup.run()
+        except (BackupError, OSError, RuntimeError) as e:
+            print(f"Error: Backup '{backup.journal['backup_id']}' failed after step "
+                  f"'{backup.journal['step']}': {e}")
+            # A backup that failed before its first step has nothing to resume.
+            if not backup.journal["step"] and os.path.exists(backup.path):
+                os.remove(backup.path)
+            return False
+        return True
+    finally:
+        lock.close()
+
+# Print the interrupted backups and the last completed backup of each workload.
+def status(config):
+
+    settings = get_settings(config)
+    journals = sorted(glob.glob(os.path.join(settings["journal_dir"], "*.json")) +
+                      glob.glob(os.path.join(settings["journal_dir"], "*.last")))
+    for path in journals:
+        with open(path) as f:
+            journal = json.load(f)
+        state = "completed" if path.endswith(".last") else f"interrupted after {journal['step']}"
+        print(f"{journal['service']:<13} {journal['workload']:<16} {journal['backup_id']}  "
+              f"{state:<32} snapshot {journal.get('snapshot_id')} volume "
+              f"{journal.get('volume_id')}")
+
+# This allows us to call script functions by name from the command line with an
+# arbitrary number of parameters. Example usage is:
+#
+#   $ python3 testy_backup.py run '/srv/testy/.testy' 'sample' 'testy-backup'
+#   $ python3 testy_backup.py resume '/srv/testy/.testy'
+#   $ python3 testy_backup.py status '/srv/testy/.testy'
+#
+if __name__ == "__main__":
+
+    result = globals()[sys.argv[1]](*sys.argv[2:])
+    sys.exit(0 if result is not False else 1)
@@ -0,0 +1,210 @@
+import json, os, shutil, statistics, tempfile, time
+from contextlib import contextmanager
+from fabric import Connection
+from invoke.runners import Local
+
+# Benchmark the control plane of testy: the fabfile tasks and the backups, run against
+# local stand-ins such as a container or a loopback SSH host and a local AWS API emulator. Each
+# case is run several times and the harness records the median wall time, the number of remote
+# commands and file transfers, the local processes, the processes forked on the server and the
+# AWS API calls. The results are compared with a baseline, and a case regresses when it is
+# measurably slower or makes more calls than in the baseline.
+
+# A case regresses when its median wall time exceeds the baseline by more than the tolerance
+# and the minimum delay in seconds, which absorb the noise of short tasks.
+default_tolerance = 0.2
+min_delay = 0.5
+
+# The forks are counted for the whole server, so the services and the workload add to those of
+# the case. A case regresses on forks when they exceed the baseline by more than the tolerance
+# and this minimum number of processes. The other counters are exact.
+min_forks = 10
+
+# The directory of the aws cli wrapper on the server.
+remote_bin_dir = "/tmp/testy-bench"
+
+counters = ["commands", "transfers", "local_commands", "forks", "aws_calls"]
+
+# The counts of the current measurement, None outside a measurement.
+current = None
+
+def count(name):
+    if current is not None:
+        current[name] += 1
+
+# Count the remote commands and file transfers of the fabric connections, and the local
+# processes run with invoke, while the context is active.
+@contextmanager
+def instrument():
+
+    patched = {(Connection, "run"): "commands", (Connection, "sudo"): "commands",
+               (Connection, "put"): "transfers", (Connection, "get"): "transfers",
+               (Local, "start"): "local_commands"}
+    originals = {}
+    for (cls, method), counter in patched.items():
+        originals[(cls, method)] = getattr(cls, method)
+
+        def wrapper(self, *args, _original=originals[(cls, method)], _counter=counter, **kwargs):
+            count(_counter)
+            return _original(self, *args, **kwargs)
+        setattr(cls, method, wrapper)
+    try:
+        yield
+    finally:
+        for (cls, method), original in originals.items():
+            setattr(cls, method, original)
+
+# Return the number of processes forked on the server since it booted.
+def read_forks(c):
+
+    result = c.run("grep '^processes' /proc/stat", hide=True)
+    return int(result.stdout.split()[1])
+
+# Install a wrapper of the aws cli that logs each call before running it, on the local machine
+# or on the server, and return its directory and its log file.
+def install_aws_wrapper(c=None):
+
+    if c is None:
+        bin_dir = tempfile.mkdtemp(prefix="testy-bench-")
+        aws = shutil.which("aws") or "aws"
+    else:
+        bin_dir = remote_bin_dir
+        aws = c.run("command -v aws", hide=True, warn=True).stdout.strip() or "aws"
+    log = os.path.join(bin_dir, "aws_calls.log")
+    wrapper = f"#!/usr/bin/env bash\necho \"$1 $2\" >> {log}\nexec {aws} \"$@\"\n"
+
+    if c is None:
+        with open(os.path.join(bin_dir, "aws"), "w") as f:
+            f.write(wrapper)
+        os.chmod(os.path.join(bin_dir, "aws"), 0o755)
+    else:
+        c.run(f"mkdir -p {bin_dir} && printf '%s' '{wrapper}' > {bin_dir}/aws && "
+              f"chmod 755 {bin_dir}/aws && touch {log} && chmod 666 {log}", hide=True)
+    return bin_dir, log
+
+# Return the number of aws cli calls logged by the local and remote wrappers, and clear them.
+def read_aws_calls(c, local_log, remote_log):
+
+    calls = 0
+    if os.path.exists(local_log):
+        with open(local_log) as f:
+            calls += len(f.readlines())
+        os.remove(local_log)
+    result = c.run(f"cat {remote_log} 2>/dev/null | wc -l && : > {remote_log}", hide=True,
+                   warn=True)
+    return calls + int(result.stdout.split()[0] if result.stdout.split() else 0)
+
+# Run a case the given number of times and return its median wall time and counts. The reset
+# function, if any, runs before each run without being measured, e.g. to stop the workload
+# before measuring its start. The forks of the harness reading the fork counter are measured
+# first and left out.
+def measure(c, case, reset, repeat, aws_logs):
+
+    global current
+    before = read_forks(c)
+    overhead = read_forks(c) - before
+    runs = []
+    for _ in range(repeat):
+        if reset:
+            reset()
+        read_aws_calls(c, *aws_logs)
+        forks = read_forks(c)
+        current = dict.fromkeys(counters, 0)
+        start = time.monotonic()
+        try:
+            case()
+            ok = True
+        except (Exception, SystemExit) as e:
+            print(f"The case failed: {str(e).strip()}")
+            ok = False
+        elapsed = time.monotonic() - start
+        run, current = current, None
+        run["wall_time"] = elapsed
+        run["forks"] = max(read_forks(c) - forks - overhead, 0)
+        run["aws_calls"] = read_aws_calls(c, *aws_logs)
+        run["ok"] = ok
+        runs.append(run)
+
+    result = {"wall_time": statistics.median(r["wall_time"] for r in runs),
+              "ok": all(r["ok"] for r in runs), "runs": len(runs)}
+    for counter in counters:
+        result[counter] = statistics.median(r[counter] for r in runs)
+    return result
+
+# Return the regressions of the results against the baseline, as messages.
+def compare(results, baseline, tolerance=default_tolerance):
+
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or not base.get("ok") or not result["ok"]:
+            if base and base.get("ok") and not result["ok"]:
+                regressions.append(f"{name}: failed")
+            continue
+        delay = result["wall_time"] - base["wall_time"]
+        if result["wall_time"] > base["wall_time"] * (1 + tolerance) and delay > min_delay:
+            regressions.append(f"{name}: wall time {result['wall_time']:.2f}s, baseline "
+                               f"{base['wall_time']:.2f}s")
+        for counter in counters:
+            limit = base.get(counter, result[counter])
+            if counter == "forks":
+                limit = max(limit * (1 + tolerance), limit + min_forks)
+            if result[counter] > limit:
+                regressions.append(f"{name}: {result[counter]:g} {counter.replace('_', ' ')}, "
+                                   f"baseline {base[counter]:g}")
+    return regressions
+
+# Print the results next to the baseline.
+def report(results, baseline):
+
+    print(f"{'case':<10} {'wall time':>10} {'commands':>9} {'transfers':>10} {'local':>6} "
+          f"{'forks':>7} {'aws':>5}  status")
+    for name, result in results.items():
+        base = baseline.get(name, {})
+        change = ""
+        if base.get("wall_time"):
+            change = f" ({100 * (result['wall_time'] / base['wall_time'] - 1):+.0f}%)"
+        print(f"{name:<10} {result['wall_time']:>9.2f}s {result['commands']:>9g} "
+              f"{result['transfers']:>10g} {result['local_commands']:>6g} {result['forks']:>7g} "
+              f"{result['aws_calls']:>5g}  {'ok' if result['ok'] else 'failed'}{change}")
+
+# Run the cases, given as a dictionary of names and pairs of case and reset functions, against
+# the server and compare them with the baseline file. Return the results and the regressions.
+# The local aws cli calls are sent to the given endpoint of an AWS API emulator, if any.
+def run(c, cases, repeat, baseline_file, aws_endpoint=None, tolerance=default_tolerance):
+
+    local_dir, local_log = install_aws_wrapper()
+    _, remote_log = install_aws_wrapper(c)
+    environ = dict(os.environ)
+    os.environ["PATH"] = f"{local_dir}:{os.environ['PATH']}"
+    if aws_endpoint:
+        os.environ["AWS_ENDPOINT_URL"] = aws_endpoint
+
+    results = {}
+    try:
+        with instrument():
+            for name, (case, reset) in cases.items():
+                print(f"==== {name} ====", flush=True)
+                results[name] = measure(c, case, reset, repeat, (local_log, remote_log))
+    finally:
+        os.environ.clear()
+        os.environ.update(environ)
+        shutil.rmtree(local_dir, ignore_errors=True)
+
+    baseline = {}
+    if baseline_file and os.path.exists(baseline_file):
+        with open(baseline_file) as f:
+            baseline = json.load(f)
+    report(results, baseline)
+    return results, compare(results, baseline, tolerance)
+
+# Write the results into the baseline file, keeping the baseline of the cases not run.
+def save_baseline(results, baseline_file):
+
+    baseline = {}
+    if os.path.exists(baseline_file):
+        with open(baseline_file) as f:
+            baseline = json.load(f)
+    baseline.update(results)
+    with open(baseline_file, "w") as f:
+        json.dump(baseline, f, indent=1, sort_keys=True)
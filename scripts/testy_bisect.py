@@ -0,0 +1,339 @@
+import configparser as cp
+import glob, json, os, shutil, signal, subprocess, sys, time
+from concurrent.futures import ThreadPoolExecutor
+
+# Find the WiredTiger commit that introduced a failure or a regression. The bisection is driven
+# by 'git bisect' in its own worktree of the WiredTiger repository, which keeps the good, bad
+# and skipped commits. Each round probes several commits at once, evenly spaced over the
+# remaining candidates, so k probes divide the range by k + 1 (k-ary bisection).
+#
+# A probe builds the commit in its own worktree, in the cache of builds, and runs a predicate
+# against the build. The predicates are:
+#
+#   validate:<workload>[:<minutes>]    Run the workload for the given minutes, 10 by default,
+#                                      then run its validate function.
+#   format:<config>[:<runs>]           Run test/format with the config file of the test_format
+#                                      workload the given number of times, 3 by default.
+#   throughput:<workload>:<minutes>:<ops>  Run the workload for the given minutes and compare
+#                                      its mean throughput with a minimum in operations/s.
+#
+# A probe exits with 0 for a good commit, 1 for a bad one and 125 when the commit cannot be
+# tested, e.g. it does not build, as for 'git bisect run'.
+
+# The bisection settings used when the testy configuration file has no 'bisect' section or is
+# missing some of its options. Zero slots runs one probe per 8 cores.
+default_settings = {
+    "bisect_dir": "/srv/testy/bisect",
+    "max_builds": 8,
+    "slots": 0,
+}
+
+probe_good, probe_bad, probe_skip = 0, 1, 125
+results = {probe_good: "good", probe_bad: "bad", probe_skip: "skip"}
+
+# Return the bisection settings from the 'bisect' section of the testy configuration file, and
+# the paths and environment the probes need.
+def get_settings(config):
+
+    parser = cp.ConfigParser(interpolation=cp.ExtendedInterpolation())
+    parser.read(config)
+
+    settings = dict(default_settings)
+    if parser.has_section("bisect"):
+        section = parser["bisect"]
+        for key, value in default_settings.items():
+            settings[key] = type(value)(section.get(key, value))
+    settings["wt_home_dir"] = parser.get("wiredtiger", "home_dir")
+    settings["environment"] = dict(parser.items("environment"))
+    settings["state_dir"] = os.path.join(settings["bisect_dir"], "state")
+    settings["build_root"] = os.path.join(settings["bisect_dir"], "builds")
+    return settings
+
+def git(repo, *args, check=True):
+    result = subprocess.run(["git", "-C", repo, *args], capture_output=True, text=True)
+    if check and result.returncode != 0:
+        raise RuntimeError(f"git {' '.join(args)}: {result.stderr.strip()}")
+    return result.stdout.strip()
+
+# Start a bisection between a good and a bad commit in the bisection worktree.
+def start(config, good, bad):
+
+    settings = get_settings(config)
+    state_dir = settings["state_dir"]
+    inconclusive = os.path.join(settings["bisect_dir"], "inconclusive")
+    if os.path.exists(inconclusive):
+        os.remove(inconclusive)
+    if not os.path.isdir(state_dir):
+        os.makedirs(settings["bisect_dir"], exist_ok=True)
+        git(settings["wt_home_dir"], "worktree", "add", "--detach", state_dir, bad)
+    git(state_dir, "fetch", "--quiet", "origin", check=False)
+    git(state_dir, "bisect", "reset", check=False)
+    git(state_dir, "bisect", "start", "--no-checkout", bad, good)
+    print(f"Bisecting {len(get_candidates(state_dir))} commits between '{good}' and '{bad}'.")
+
+# Return the remaining candidates of the bisection, oldest first. The last one is the oldest
+# known bad commit.
+def get_candidates(state_dir):
+
+    goods = git(state_dir, "for-each-ref", "--format=%(objectname)", "refs/bisect/good-*")
+    return git(state_dir, "rev-list", "--topo-order", "--reverse", "refs/bisect/bad", "--not",
+               *goods.split()).split()
+
+# Return the commits skipped because they could not be tested.
+def get_skipped(state_dir):
+    return set(git(state_dir, "for-each-ref", "--format=%(objectname)",
+                   "refs/bisect/skip-*").split())
+
+# Return up to 'count' commits to probe, evenly spaced over the untested candidates.
+def pick_probes(candidates, skipped, count):
+
+    untested = [c for c in candidates[:-1] if c not in skipped]
+    probes = []
+    for i in range(count):
+        index = (i + 1) * len(untested) // (count + 1)
+        if index < len(untested) and untested[index] not in probes:
+            probes.append(untested[index])
+    return probes or untested[:1]
+
+# Print the commits to probe in the next round, or the result of the bisection as
+# 'first-bad <commit>' or 'undecided <commit> ...' when there is nothing left to probe.
+def next_probes(config, count="1"):
+
+    state_dir = get_settings(config)["state_dir"]
+    candidates = get_candidates(state_dir)
+    probes = pick_probes(candidates, get_skipped(state_dir), int(count))
+    if len(candidates) == 1:
+        print(f"first-bad {candidates[0]}")
+    elif not probes:
+        print("undecided " + " ".join(candidates))
+    else:
+        print(" ".join(probes))
+
+# Record the results of a round of probes, given as '<commit>:<result>' with the result 'good',
+# 'bad' or 'skip'. Marking a commit bad moves the bad end of the range to it, so the bad commits
+# are marked last and newest first, ending with the oldest one. Return False if the results
+# contradict the earlier ones, e.g. a good commit following a bad one, which happens when the
+# predicate is flaky: the bisection is then inconclusive.
+def mark(config, *probe_results):
+
+    state_dir = get_settings(config)["state_dir"]
+    marks = [r.split(":") for r in probe_results]
+    candidates = get_candidates(state_dir)
+    marks.sort(key=lambda m: (m[1] == "bad", -candidates.index(m[0])
+                              if m[0] in candidates else 0))
+    for commit, result in marks:
+        try:
+            git(state_dir, "bisect", result, commit)
+        except RuntimeError as e:
+            print(f"Commit {commit[:12]} cannot be marked {result}, the bisection is "
+                  f"inconclusive and the predicate may be flaky: {e}")
+            with open(os.path.join(os.path.dirname(state_dir), "inconclusive"), "w") as f:
+                f.write(f"{commit} {result}\n")
+            return False
+    return True
+
+# Print the bisection log and the first bad commit, and end the bisection.
+def finish(config):
+
+    state_dir = get_settings(config)["state_dir"]
+    log = git(state_dir, "bisect", "log", check=False)
+    with open(os.path.join(os.path.dirname(state_dir), "bisect.log"), "w") as f:
+        f.write(log + "\n")
+    print(log)
+    candidates = get_candidates(state_dir)
+    inconclusive = os.path.join(os.path.dirname(state_dir), "inconclusive")
+    if os.path.exists(inconclusive):
+        with open(inconclusive) as f:
+            commit, result = f.read().split()
+        os.remove(inconclusive)
+        print(f"\nThe bisection is inconclusive: commit {commit[:12]} probed {result} "
+              f"contradicts the earlier results, the predicate may be flaky. The remaining "
+              f"candidates are:")
+    elif len(candidates) == 1:
+        print("\nThe first bad commit is:")
+    else:
+        print("\nThe first bad commit could be any of:")
+    for commit in candidates:
+        print("  " + git(state_dir, "show", "--no-patch", "--format=%H %an %ad %s", commit))
+    git(state_dir, "bisect", "reset", check=False)
+
+# Remove the least recently used builds beyond the maximum number of builds.
+def prune_builds(settings):
+
+    builds = sorted(glob.glob(os.path.join(settings["build_root"], "*")), key=os.path.getmtime)
+    for source in builds[:-settings["max_builds"]] if settings["max_builds"] > 0 else []:
+        git(settings["wt_home_dir"], "worktree", "remove", "--force", source, check=False)
+        shutil.rmtree(source, ignore_errors=True)
+
+# Build a commit in its own worktree, with the build directory inside it as the workloads
+# expect, and return the worktree. Builds are kept in a cache of the most recent ones, and
+# share the compiler cache.
+def build(settings, commit, jobs):
+
+    source = os.path.join(settings["build_root"], commit)
+    build_dir = os.path.join(source, "build")
+    if os.path.exists(os.path.join(build_dir, ".testy-built")):
+        os.utime(source)
+        return source
+
+    if not os.path.isdir(source):
+        os.makedirs(settings["build_root"], exist_ok=True)
+        git(settings["wt_home_dir"], "worktree", "add", "--detach", source, commit)
+    os.makedirs(build_dir, exist_ok=True)
+
+    configure = ["cmake", "..", "-DCMAKE_BUILD_TYPE=RelWithDebInfo"]
+    if shutil.which("ccache"):
+        configure += ["-DCMAKE_C_COMPILER_LAUNCHER=ccache", "-DCMAKE_CXX_COMPILER_LAUNCHER=ccache"]
+    if shutil.which("ninja"):
+        configure += ["-G", "Ninja"]
+    make = ["ninja" if shutil.which("ninja") else "make", f"-j{jobs}"]
+    with open(os.path.join(build_dir, "build.log"), "w") as log:
+        for command in [configure, make]:
+            result = subprocess.run(command, cwd=build_dir, stdout=log, stderr=subprocess.STDOUT)
+            if result.returncode:
+                return None
+    open(os.path.join(build_dir, ".testy-built"), "w").close()
+    prune_builds(settings)
+    return source
+
+# Return the environment of the workloads for a probe: its build and database directory.
+def get_probe_env(settings, source, database_dir):
+
+    env = {**os.environ, **settings["environment"]}
+    env["wt_home_dir"] = source
+    env["wt_build_dir"] = os.path.join(source, "build")
+    env["database_dir"] = database_dir
+    return env
+
+# Run the workload for the given number of seconds, and return whether it was still running.
+def run_workload(env, workload, seconds, log):
+
+    wif = os.path.join(env["workload_dir"], workload, f"{workload}.sh")
+    process = subprocess.Popen(["bash", wif, "run"], env=env, stdout=log,
+                               stderr=subprocess.STDOUT, start_new_session=True)
+    try:
+        process.wait(seconds)
+        return False
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait()
+        return True
+
+# Return the mean throughput of a workgen workload in operations/s from its monitor file.
+def get_throughput(database_dir):
+
+    totals = []
+    try:
+        with open(os.path.join(database_dir, "monitor.json")) as f:
+            for line in f:
+                sample = json.loads(line).get("workgen", {})
+                totals.append(sum(v.get("ops per sec", 0) for v in sample.values()
+                                  if isinstance(v, dict)))
+    except (OSError, ValueError):
+        pass
+    # Leave out the first minute, while the cache warms up.
+    totals = totals[60:] or totals
+    return sum(totals) / len(totals) if totals else 0
+
+# Run the predicate against the build of a commit and return the probe result.
+def run_predicate(settings, source, predicate, home, log):
+
+    kind, _, args = predicate.partition(":")
+    args = args.split(":")
+    env = get_probe_env(settings, source, home)
+
+    if kind == "format":
+        config = os.path.join(env["workload_dir"], "test_format", args[0])
+        binary = os.path.join(source, "build", "test", "format", "t")
+        for run in range(int(args[1]) if len(args) > 1 else 3):
+            shutil.rmtree(home, ignore_errors=True)
+            os.makedirs(home)
+            log.write(f"==== test/format run {run} ====\n")
+            log.flush()
+            if subprocess.run([binary, "-c", config, "-h", home], cwd=home, stdout=log,
+                              stderr=subprocess.STDOUT).returncode:
+                return probe_bad
+        return probe_good
+
+    workload = args[0]
+    minutes = float(args[1]) if len(args) > 1 else 10
+    if not run_workload(env, workload, minutes * 60, log):
+        log.write("The workload stopped before the end of the probe.\n")
+        return probe_bad
+
+    if kind == "validate":
+        wif = os.path.join(env["workload_dir"], workload, f"{workload}.sh")
+        # The workload validates the database under the given root, '/' for the probe's.
+        result = subprocess.run(["bash", wif, "validate", "/"], env=env, stdout=log,
+                                stderr=subprocess.STDOUT)
+        return probe_bad if result.returncode else probe_good
+    if kind == "throughput":
+        throughput = get_throughput(home)
+        log.write(f"Mean throughput: {throughput:.0f} ops/s, minimum {args[2]} ops/s.\n")
+        return probe_good if throughput >= float(args[2]) else probe_bad
+    raise ValueError(f"Unknown predicate '{predicate}'.")
+
+# Probe a commit: build it and run the predicate against it in its own database directory.
+# The result is the exit status. 'jobs' is the number of build jobs.
+def probe(config, commit, predicate, jobs="0"):
+
+    settings = get_settings(config)
+    commit = git(settings["wt_home_dir"], "rev-parse", commit)
+    jobs = int(jobs) or os.cpu_count()
+    home = os.path.join(settings["bisect_dir"], "probes", commit)
+    shutil.rmtree(home, ignore_errors=True)
+    os.makedirs(home)
+
+    log_file = os.path.join(settings["bisect_dir"], "probes", f"{commit}.log")
+    with open(log_file, "w") as log:
+        start_time = time.monotonic()
+        source = build(settings, commit, jobs)
+        if source is None:
+            result = probe_skip
+            log.write("The commit does not build.\n")
+        else:
+            result = run_predicate(settings, source, predicate, home, log)
+    shutil.rmtree(home, ignore_errors=True)
+    print(f"{commit[:12]}: {results[result]} ({time.monotonic() - start_time:.0f}s, log in "
+          f"'{log_file}')", flush=True)
+    return result
+
+# Bisect between a good and a bad commit on this server, running the probes of each round in
+# parallel build slots.
+def run(config, good, bad, predicate, slots="0"):
+
+    settings = get_settings(config)
+    slots = int(slots) or settings["slots"] or max(os.cpu_count() // 8, 1)
+    jobs = max(os.cpu_count() // slots, 1)
+    start(config, good, bad)
+
+    script = os.path.abspath(__file__)
+    def run_probe(commit):
+        return subprocess.run(["python3", script, "probe", config, commit, predicate,
+                               str(jobs)]).returncode
+
+    state_dir = settings["state_dir"]
+    with ThreadPoolExecutor(slots) as executor:
+        while True:
+            candidates = get_candidates(state_dir)
+            probes = pick_probes(candidates, get_skipped(state_dir), slots)
+            if len(candidates) == 1 or not probes:
+                break
+            print(f"{len(candidates)} candidates left, probing {len(probes)} commit(s).",
+                  flush=True)
+            if not mark(config, *[f"{commit}:{results.get(result, 'skip')}"
+                                  for commit, result in zip(probes,
+                                                            executor.map(run_probe, probes))]):
+                break
+    finish(config)
+
+# This allows us to call script functions by name from the command line with an
+# arbitrary number of parameters. Example usage is:
+#
+#   $ python3 testy_bisect.py run '/srv/testy/.testy' 'a1b2c3d' 'develop' 'validate:sample:30'
+#   $ python3 testy_bisect.py probe '/srv/testy/.testy' 'a1b2c3d' 'format:CONFIG.stress'
+#
+if __name__ == "__main__":
+
+    result = globals()[sys.argv[1]](*sys.argv[2:])
+    sys.exit(result if type(result) is int else 0 if result is not False else 1)
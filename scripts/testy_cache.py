@@ -0,0 +1,300 @@
+import configparser as cp
+import hashlib, json, os, re, shutil, subprocess, sys, tempfile, time, zlib
+from concurrent.futures import ThreadPoolExecutor
+from testy_resources import get_cpu_count
+
+# A cache of populated databases, so a new or relaunched server restores the starting database
+# of its workload instead of populating it again. A populated database is saved as an artifact:
+# a manifest listing its files and, for each file, the chunks of its contents. The chunks are
+# compressed and named after the hash of their contents, so chunks shared by artifacts, such as
+# empty or preallocated log files, are stored once.
+#
+# An artifact is keyed on a hash of the workload spec and of the data it holds, as derived from
+# the workload by populate with no value taken from the host, and on the data format version of
+# WiredTiger, so a database is restored by any server running the workload with a build that
+# can read it. The artifacts are kept in a local cache directory and, optionally, in a shared
+# store, a directory or an S3 URL, from which the other servers fetch them. A restore writes the
+# chunks in parallel into a new directory, whose files are moved into the database directory
+# when complete.
+
+# The cache settings used when the testy configuration file has no 'cache' section or is
+# missing some of its options. Zero threads uses one per core.
+default_settings = {
+    "enabled": True,
+    "cache_dir": "/srv/testy/cache",
+    "store": "",
+    "chunk_size_mb": 64,
+    "level": 1,
+    "threads": 0,
+    "max_size_gb": 100,
+}
+
+# Return the cache settings from the 'cache' section of the testy configuration file.
+def get_settings(config):
+
+    parser = cp.ConfigParser(interpolation=cp.ExtendedInterpolation())
+    parser.read(config)
+
+    settings = dict(default_settings)
+    if parser.has_section("cache"):
+        section = parser["cache"]
+        for key, value in default_settings.items():
+            if isinstance(value, bool):
+                settings[key] = section.getboolean(key, value)
+            else:
+                settings[key] = type(value)(section.get(key, value))
+    return settings
+
+# Return the data format version of the WiredTiger build, its major and minor versions.
+def get_format_version():
+
+    import wiredtiger
+
+    match = re.search(r"(\d+)\.(\d+)\.\d+", str(wiredtiger.wiredtiger_version()))
+    return f"{match.group(1)}.{match.group(2)}" if match else "unknown"
+
+# Return the key of the artifact holding the database described by the layout: the digest of
+# the workload spec, the explicit table count and target size the records follow from, the
+# shape of the data and the data format version of WiredTiger.
+def get_key(layout):
+
+    data = json.dumps(layout, sort_keys=True) + get_format_version()
+    return hashlib.sha256(data.encode()).hexdigest()[:32]
+
+def chunk_path(digest):
+    return f"chunks/{digest[:2]}/{digest}.z"
+
+def manifest_path(key):
+    return f"manifests/{key}.json"
+
+# Return the contents of a file of the shared store, or None if it does not exist.
+def store_read(store, path):
+
+    if store.startswith("s3://"):
+        result = subprocess.run(["aws", "s3", "cp", f"{store}/{path}", "-"],
+                                capture_output=True)
+        return result.stdout if result.returncode == 0 else None
+    try:
+        with open(os.path.join(store, path), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+# Write a file of the shared store.
+def store_write(store, path, data):
+
+    if store.startswith("s3://"):
+        subprocess.run(["aws", "s3", "cp", "-", f"{store}/{path}"], input=data,
+                       capture_output=True, check=True)
+        return
+    write_file(os.path.join(store, path), data)
+
+# Return the chunks already in the shared store.
+def store_chunks(store):
+
+    if store.startswith("s3://"):
+        result = subprocess.run(["aws", "s3", "ls", "--recursive", f"{store}/chunks/"],
+                                capture_output=True, text=True)
+        return {os.path.basename(line.split()[-1]) for line in result.stdout.splitlines()
+                if line.strip()}
+    chunk_dir = os.path.join(store, "chunks")
+    return {name for _, _, names in os.walk(chunk_dir) for name in names}
+
+# Write a file atomically, so a reader never sees a partial chunk or manifest.
+def write_file(path, data):
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+# Return the contents of a chunk, from the local cache or from the shared store, and keep it
+# in the local cache.
+def read_chunk(cache_dir, store, digest):
+
+    path = os.path.join(cache_dir, chunk_path(digest))
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        data = store_read(store, chunk_path(digest)) if store else None
+        if data is None:
+            raise FileNotFoundError(f"Chunk {digest} not found.")
+        write_file(path, data)
+    return data
+
+# Return the manifest of an artifact, from the local cache or from the shared store, or None
+# if there is no such artifact.
+def read_manifest(cache_dir, store, key):
+
+    path = os.path.join(cache_dir, manifest_path(key))
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+        os.utime(path)
+        return manifest
+    except FileNotFoundError:
+        data = store_read(store, manifest_path(key)) if store else None
+        if data is None:
+            return None
+        write_file(path, data)
+        return json.loads(data)
+
+# Save the database in the given directory as the artifact of the key, into the local cache
+# and the shared store. The database must be closed.
+def save(config, home, key):
+
+    settings = get_settings(config)
+    cache_dir, store = settings["cache_dir"], settings["store"]
+    chunk_size = settings["chunk_size_mb"] * 1024 * 1024
+    stored = store_chunks(store) if store else set()
+    start = time.monotonic()
+
+    files, tasks = [], []
+    for root, _, names in os.walk(home):
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            size = os.path.getsize(path)
+            files.append({"path": os.path.relpath(path, home), "size": size,
+                          "mode": os.stat(path).st_mode & 0o777, "chunks": []})
+            tasks += [(path, offset, files[-1]) for offset in range(0, size, chunk_size)]
+
+    def save_chunk(task):
+        path, offset, _ = task
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read(chunk_size)
+        digest = hashlib.sha256(data).hexdigest()
+        local = os.path.join(cache_dir, chunk_path(digest))
+        if not os.path.exists(local) or (store and f"{digest}.z" not in stored):
+            compressed = zlib.compress(data, settings["level"])
+            if not os.path.exists(local):
+                write_file(local, compressed)
+            if store and f"{digest}.z" not in stored:
+                store_write(store, chunk_path(digest), compressed)
+        return digest
+
+    with ThreadPoolExecutor(settings["threads"] or get_cpu_count()) as executor:
+        for task, digest in zip(tasks, executor.map(save_chunk, tasks)):
+            task[2]["chunks"].append(digest)
+
+    # The manifest is written last, so an artifact is only found once all its chunks are.
+    manifest = {"key": key, "format_version": get_format_version(), "chunk_size": chunk_size,
+                "created": time.time(), "files": files}
+    data = json.dumps(manifest, indent=1).encode()
+    write_file(os.path.join(cache_dir, manifest_path(key)), data)
+    if store:
+        store_write(store, manifest_path(key), data)
+    print(f"Saved the database as artifact {key}: {len(files)} files, {len(tasks)} chunks in "
+          f"{time.monotonic() - start:.0f}s.", flush=True)
+    prune(cache_dir, settings["max_size_gb"] * 1e9)
+
+# Restore the database of the key into the given directory, which must not hold a database.
+# Other files of the directory are kept.
+# Return whether a compatible artifact was found and restored.
+def restore(config, home, key):
+
+    settings = get_settings(config)
+    cache_dir, store = settings["cache_dir"], settings["store"]
+    manifest = read_manifest(cache_dir, store, key)
+    if manifest is None:
+        print(f"No artifact {key} in the cache.", flush=True)
+        return False
+    start = time.monotonic()
+
+    # The database directory may be the only one the framework user can write in its parent.
+    os.makedirs(home, exist_ok=True)
+    target = tempfile.mkdtemp(prefix=".restore-", dir=home)
+
+    def restore_chunk(task):
+        path, offset, digest = task
+        data = zlib.decompress(read_chunk(cache_dir, store, digest))
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"Chunk {digest} is corrupted.")
+        fd = os.open(path, os.O_WRONLY)
+        try:
+            os.pwrite(fd, data, offset)
+        finally:
+            os.close(fd)
+        return len(data)
+
+    try:
+        tasks = []
+        for entry in manifest["files"]:
+            path = os.path.join(target, entry["path"])
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.truncate(entry["size"])
+            tasks += [(path, i * manifest["chunk_size"], digest)
+                      for i, digest in enumerate(entry["chunks"])]
+        with ThreadPoolExecutor(settings["threads"] or get_cpu_count()) as executor:
+            restored = sum(executor.map(restore_chunk, tasks))
+    except (OSError, ValueError, zlib.error) as e:
+        print(f"Unable to restore artifact {key}: {e}", flush=True)
+        shutil.rmtree(target, ignore_errors=True)
+        return False
+
+    for entry in manifest["files"]:
+        os.chmod(os.path.join(target, entry["path"]), entry["mode"])
+    for name in os.listdir(target):
+        os.replace(os.path.join(target, name), os.path.join(home, name))
+    os.rmdir(target)
+    elapsed = time.monotonic() - start
+    print(f"Restored artifact {key} into '{home}': {restored / 1e9:.1f}GB in {elapsed:.0f}s "
+          f"({restored / 1e6 / max(elapsed, 0.001):.0f}MB/s).", flush=True)
+    return True
+
+# Remove the least recently used artifacts of the local cache beyond its size limit, and the
+# chunks no longer used by an artifact.
+def prune(cache_dir, max_size):
+
+    manifest_dir = os.path.join(cache_dir, "manifests")
+    if not os.path.isdir(manifest_dir):
+        return
+    manifests = sorted((os.path.join(manifest_dir, name) for name in os.listdir(manifest_dir)),
+                       key=os.path.getmtime)
+    chunk_sizes = {}
+    for root, _, names in os.walk(os.path.join(cache_dir, "chunks")):
+        for name in names:
+            chunk_sizes[name] = os.path.getsize(os.path.join(root, name))
+
+    def used_chunks(paths):
+        used = set()
+        for path in paths:
+            with open(path) as f:
+                for entry in json.load(f)["files"]:
+                    used.update(f"{digest}.z" for digest in entry["chunks"])
+        return used
+
+    used = used_chunks(manifests)
+    while len(manifests) > 1 and sum(chunk_sizes.get(c, 0) for c in used) > max_size:
+        os.remove(manifests.pop(0))
+        used = used_chunks(manifests)
+    for name in set(chunk_sizes) - used:
+        os.remove(os.path.join(cache_dir, chunk_path(name[:-2])))
+
+# Print the artifacts of the local cache.
+def show(config):
+
+    settings = get_settings(config)
+    manifest_dir = os.path.join(settings["cache_dir"], "manifests")
+    names = sorted(os.listdir(manifest_dir)) if os.path.isdir(manifest_dir) else []
+    for name in names:
+        with open(os.path.join(manifest_dir, name)) as f:
+            manifest = json.load(f)
+        size = sum(entry["size"] for entry in manifest["files"])
+        created = time.strftime("%Y-%m-%d %H:%M", time.localtime(manifest["created"]))
+        print(f"{manifest['key']}  WiredTiger {manifest['format_version']:<6} "
+              f"{size / 1e9:>7.1f}GB  {created}")
+    if not names:
+        print("The cache is empty.")
+
+# This allows us to call script functions by name from the command line with an
+# arbitrary number of parameters. Example usage is:
+#
+#   $ python3 testy_cache.py show '/srv/testy/.testy'
+#
+if __name__ == "__main__":
+
+    globals()[sys.argv[1]](*sys.argv[2:])
@@ -0,0 +1,231 @@
+import configparser as cp
+import glob, os, sys
+
+# Isolate the workload from the backup, crash and other background services with cgroup v2
+# slices managed by systemd. The workload runs in testy-workload.slice and the background
+# services in testy-background.slice, both under testy.slice. The slices are generated from
+# the 'cgroups' section of the testy configuration file, so the workload keeps a guaranteed
+# share of the CPU, memory and I/O while the background services get a bounded one.
+
+cgroup_root = "/sys/fs/cgroup"
+unit_dir = "/etc/systemd/system"
+
+# The slices and their resource settings, used when the testy configuration file has no
+# 'cgroups' section or is missing some of its options. An empty value leaves the resource
+# unbounded. The memory settings accept a percentage of the physical memory, and the
+# bandwidth settings apply to the volume holding the database.
+default_settings = {
+    "workload_cpu_weight": "1000",
+    "workload_io_weight": "1000",
+    "workload_memory_low": "50%",
+    "background_cpu_weight": "100",
+    "background_io_weight": "100",
+    "background_memory_max": "25%",
+    "background_read_bandwidth_max": "",
+    "background_write_bandwidth_max": "",
+}
+
+slices = ["workload", "background"]
+descriptions = {"workload": "the workload", "background": "the background services"}
+
+# The resource options of a 'workload.<name>' section and their slice properties.
+workload_properties = {"cpu_weight": "CPUWeight", "io_weight": "IOWeight",
+                       "memory_low": "MemoryLow", "memory_max": "MemoryMax"}
+
+# Return the cgroups settings from the 'cgroups' section of the testy configuration file,
+# and the database directory the bandwidth limits apply to.
+def get_settings(config):
+
+    parser = cp.ConfigParser(interpolation=cp.ExtendedInterpolation())
+    parser.read(config)
+
+    settings = dict(default_settings)
+    if parser.has_section("cgroups"):
+        for key in default_settings:
+            settings[key] = parser.get("cgroups", key, fallback=settings[key]).strip()
+    settings["database_dir"] = parser.get("application", "database_dir")
+    return settings
+
+# Return the systemd unit file of the slice for the given settings.
+def get_slice_unit(name, settings):
+
+    properties = {
+        "CPUWeight": settings.get(f"{name}_cpu_weight"),
+        "IOWeight": settings.get(f"{name}_io_weight"),
+        "MemoryLow": settings.get(f"{name}_memory_low"),
+        "MemoryMax": settings.get(f"{name}_memory_max"),
+    }
+    for direction in ["read", "write"]:
+        bandwidth = settings.get(f"{name}_{direction}_bandwidth_max")
+        if bandwidth:
+            properties[f"IO{direction.capitalize()}BandwidthMax"] = \
+                f"{settings['database_dir']} {bandwidth}"
+
+    unit = (f"[Unit]\nDescription=\"testy-{name}.slice: The resources of {descriptions[name]}\"\n"
+            "Documentation=https://github.com/wiredtiger/testy\nBefore=slices.target\n\n"
+            "[Slice]\n")
+    for key, value in properties.items():
+        if value:
+            unit += f"{key}={value}\n"
+    return unit
+
+# Return the name of the slice of a workload that runs alongside other workloads. A dash in a
+# slice name nests the slice, so the dashes of the workload name are replaced.
+def get_workload_slice(workload):
+    return f"testy-workload-{workload.replace('-', '_')}.slice"
+
+# Return the systemd unit file of the slice of a workload for the options of its section.
+def get_workload_slice_unit(workload, section):
+
+    unit = (f"[Unit]\nDescription=\"{get_workload_slice(workload)}: The resources of the "
+            f"workload '{workload}'\"\nDocumentation=https://github.com/wiredtiger/testy\n"
+            "Before=slices.target\n\n[Slice]\n")
+    for key, name in workload_properties.items():
+        value = section.get(key, "").strip()
+        if value:
+            unit += f"{name}={value}\n"
+    return unit
+
+# Write the slice units for the settings of the testy configuration file. This needs to run
+# as root, followed by a daemon-reload of systemd.
+def install(config):
+
+    settings = get_settings(config)
+    with open(os.path.join(unit_dir, "testy.slice"), "w") as f:
+        f.write("[Unit]\nDescription=\"testy.slice: The resources of the testy framework\"\n"
+                "Documentation=https://github.com/wiredtiger/testy\nBefore=slices.target\n")
+    for name in slices:
+        with open(os.path.join(unit_dir, f"testy-{name}.slice"), "w") as f:
+            f.write(get_slice_unit(name, settings))
+
+    parser = cp.ConfigParser(interpolation=cp.ExtendedInterpolation())
+    parser.read(config)
+    for section in parser.sections():
+        if section.startswith("workload."):
+            workload = section[len("workload."):]
+            with open(os.path.join(unit_dir, get_workload_slice(workload)), "w") as f:
+                f.write(get_workload_slice_unit(workload, parser[section]))
+
+# Return the first value of a cgroup file, or None if the file does not exist.
+def read_value(path):
+
+    try:
+        with open(path) as f:
+            return f.read().split("\n")[0].strip()
+    except OSError:
+        return None
+
+# Return the key/value pairs of a flat-keyed cgroup file such as cpu.stat.
+def read_keyed(path):
+
+    try:
+        with open(path) as f:
+            return {k: int(v) for k, v in (line.split() for line in f if line.strip())}
+    except (OSError, ValueError):
+        return {}
+
+# Return the 10-second average of the time some tasks of the cgroup were stalled on the
+# resource, in percent.
+def read_pressure(path):
+
+    value = read_value(path)
+    try:
+        return float(value.split()[1].split("=")[1]) if value else None
+    except (IndexError, ValueError):
+        return None
+
+# Return the counters and the applied limits of a slice, or None if it does not exist.
+def get_slice_stats(name):
+
+    path = os.path.join(cgroup_root, "testy.slice", f"testy-{name}.slice")
+    if not os.path.isdir(path):
+        return None
+
+    cpu = read_keyed(os.path.join(path, "cpu.stat"))
+    memory_events = read_keyed(os.path.join(path, "memory.events"))
+    io = {"rbytes": 0, "wbytes": 0}
+    try:
+        with open(os.path.join(path, "io.stat")) as f:
+            for line in f:
+                for field in line.split()[1:]:
+                    key, _, value = field.partition("=")
+                    if key in io:
+                        io[key] += int(value)
+    except OSError:
+        pass
+
+    memory_max = read_value(os.path.join(path, "memory.max"))
+    stats = {
+        "cpu_usec": cpu.get("usage_usec", 0),
+        "cpu_throttled_usec": cpu.get("throttled_usec", 0),
+        "memory_current": int(read_value(os.path.join(path, "memory.current")) or 0),
+        "memory_high_events": memory_events.get("high", 0),
+        "memory_max_events": memory_events.get("max", 0),
+        "memory_oom_kills": memory_events.get("oom_kill", 0),
+        "io_read_bytes": io["rbytes"],
+        "io_write_bytes": io["wbytes"],
+        "cpu_weight": int(read_value(os.path.join(path, "cpu.weight")) or 0),
+        "memory_max": -1 if memory_max in (None, "max") else int(memory_max),
+    }
+    for resource in ["cpu", "memory", "io"]:
+        pressure = read_pressure(os.path.join(path, f"{resource}.pressure"))
+        if pressure is not None:
+            stats[f"{resource}_pressure"] = pressure
+    return stats
+
+# Return the metrics of the slices between two readings of their stats taken 'elapsed'
+# seconds apart: the resource usage and throttling, the pressure and the applied limits.
+def get_slice_metrics(before, after, elapsed):
+
+    metrics = {}
+    for name in slices:
+        start, end = before.get(name), after.get(name)
+        if not start or not end:
+            continue
+        delta = {k: max(end[k] - start.get(k, 0), 0) for k in end}
+        prefix = f"slice_{name}"
+        metrics[f"{prefix}_cpu_percent"] = 100 * delta["cpu_usec"] / 1e6 / elapsed
+        metrics[f"{prefix}_cpu_throttled_percent"] = \
+            100 * delta["cpu_throttled_usec"] / 1e6 / elapsed
+        metrics[f"{prefix}_memory_mb"] = end["memory_current"] / 1e6
+        metrics[f"{prefix}_memory_throttle_events"] = delta["memory_high_events"] + \
+                                                      delta["memory_max_events"]
+        metrics[f"{prefix}_oom_kills"] = delta["memory_oom_kills"]
+        metrics[f"{prefix}_read_mbps"] = delta["io_read_bytes"] / 1e6 / elapsed
+        metrics[f"{prefix}_write_mbps"] = delta["io_write_bytes"] / 1e6 / elapsed
+        metrics[f"{prefix}_cpu_weight"] = end["cpu_weight"]
+        metrics[f"{prefix}_memory_max_mb"] = \
+            end["memory_max"] / 1e6 if end["memory_max"] >= 0 else -1
+        for resource in ["cpu", "memory", "io"]:
+            if f"{resource}_pressure" in end:
+                metrics[f"{prefix}_{resource}_pressure_percent"] = end[f"{resource}_pressure"]
+    return metrics
+
+# Print the applied limits and the current usage of the slices, including the slices of the
+# workloads running alongside other workloads.
+def show():
+
+    workload_slices = glob.glob(os.path.join(cgroup_root, "testy.slice", "testy-workload.slice",
+                                             "testy-workload-*.slice"))
+    names = slices + [f"workload.slice/{os.path.basename(p)[:-len('.slice')]}"
+                      for p in sorted(workload_slices)]
+    for name in names:
+        stats = get_slice_stats(name)
+        if stats is None:
+            print(f"testy-{name}.slice: not active")
+            continue
+        memory_max = "max" if stats["memory_max"] < 0 else f"{stats['memory_max'] / 1e9:.1f}GB"
+        print(f"testy-{name}.slice: cpu weight {stats['cpu_weight']}, memory max {memory_max}, "
+              f"memory {stats['memory_current'] / 1e9:.1f}GB, "
+              f"{stats['memory_high_events'] + stats['memory_max_events']} memory throttle "
+              f"events, {stats['memory_oom_kills']} OOM kills")
+
+# This allows us to call script functions by name from the command line with an
+# arbitrary number of parameters. Example usage is:
+#
+#   $ sudo python3 testy_cgroups.py install '/srv/testy/.testy'
+#   $ python3 testy_cgroups.py show
+#
+if __name__ == "__main__":
+
+    globals()[sys.argv[1]](*sys.argv[2:])
@@ -0,0 +1,318 @@
+import configparser as cp
+import errno, json, os, sys, threading, time
+from testy_events import emit
+from testy_hotbackup import RateLimiter, lower_priority, read_json, write_json
+
+# Check the consistency of the database of a running workload continuously, instead of only
+# when a backup is validated. The checker walks every table in slices of keys, reading each key
+# once per pass, and compares the mirror tables of workgen with their base tables: a key
+# missing from one of them, or holding different values, is a divergence. Keys out of order and
+# read errors are divergences too. A divergence is read again after a delay to rule out an
+# update in flight, and is reported as soon as it is confirmed.
+#
+# WiredTiger only lets one process open a database, so the checker runs in a thread of the
+# workload process, like the governor, with its own sessions. It reads the latest checkpoint
+# with read-only checkpoint cursors, or the live tables in snapshot transactions, one slice per
+# transaction so the checker never pins much history. The thread runs at the lowest CPU and
+# I/O priorities and its reads are rate-limited. The position of the walk is saved after each
+# slice, so a restarted workload resumes the pass where it stopped.
+
+# The checker settings used when the testy configuration file has no 'checker' section or is
+# missing some of its options. The 'source' is 'checkpoint' or 'snapshot'.
+default_settings = {
+    "check_dir": "/srv/testy/checker",
+    "source": "checkpoint",
+    "slice_keys": 1000,
+    "rate_mb": 20,
+    "slice_interval": 1,
+    "pass_interval": 60,
+    "confirm_delay": 5,
+}
+
+# The application metadata of the mirror tables of workgen.
+mirror_table_metadata = "workgen_table_mirror="
+base_table_metadata = "workgen_base_table=true"
+
+# The number of divergences of a slice reported in full.
+max_reported = 10
+
+# Return the checker settings from the 'checker' section of the testy configuration file.
+def get_settings(config):
+
+    parser = cp.ConfigParser(interpolation=cp.ExtendedInterpolation())
+    parser.read(config)
+
+    settings = dict(default_settings)
+    if parser.has_section("checker"):
+        section = parser["checker"]
+        for key, value in default_settings.items():
+            settings[key] = type(value)(section.get(key, value))
+    return settings
+
+# Return the directory of the checker of a workload, holding its state and its divergences.
+def get_workload_dir(settings, workload):
+    return os.path.join(settings["check_dir"], workload)
+
+# Return the tables of the database to check and the mirror of each base table, if any. The
+# mirrors are checked with their base table.
+def get_tables(session):
+
+    tables, mirrors = [], set()
+    cursor = session.open_cursor("metadata:", None, None)
+    for uri, value in cursor:
+        if not uri.startswith("table:"):
+            continue
+        mirror = None
+        if mirror_table_metadata in value:
+            mirror = value.split(mirror_table_metadata, 1)[1].split(",")[0].strip("\")")
+            if base_table_metadata not in value:
+                mirrors.add(uri)
+                continue
+        tables.append((uri, mirror))
+    cursor.close()
+    return sorted((uri, mirror) for uri, mirror in tables if uri not in mirrors)
+
+def size_of(value):
+    return len(value) if isinstance(value, (str, bytes)) else 8
+
+class Checker(threading.Thread):
+    def __init__(self, connection, database_dir, settings=None):
+        super().__init__(daemon=True)
+        self.connection = connection
+        self.database_dir = database_dir
+        self.config = os.environ.get("testy_config", "")
+        self.settings = settings or get_settings(self.config)
+        self.workload = os.environ.get("testy_workload", "workload")
+        self.workload_dir = get_workload_dir(self.settings, self.workload)
+        self.state_file = os.path.join(self.workload_dir, "state.json")
+        self.limiter = RateLimiter(self.settings["rate_mb"])
+        self.stopping = threading.Event()
+
+    def run(self):
+
+        lower_priority(3)
+        state = None
+        while not self.stopping.is_set():
+            finished = False
+            try:
+                if state is None:
+                    state = self.load_state()
+                finished = self.check_slice(state)
+                write_json(self.state_file, state)
+                if finished:
+                    self.finish_pass(state)
+                    write_json(self.state_file, state)
+            except Exception as e:
+                print(f"Checker: Error: {e}", flush=True)
+            self.stopping.wait(self.settings["pass_interval" if finished else "slice_interval"])
+
+    # Return the saved state of the walk, or the state of a new walk.
+    def load_state(self):
+        os.makedirs(self.workload_dir, exist_ok=True)
+        state = read_json(self.state_file) or {}
+        state.setdefault("pass", 1)
+        state.setdefault("pass_start", time.time())
+        state.setdefault("keys", 0)
+        state.setdefault("divergences", 0)
+        return state
+
+    # Open a cursor on the table in the source of the checker.
+    def open_cursor(self, session, uri):
+        checkpoint = "checkpoint=WiredTigerCheckpoint"
+        return session.open_cursor(uri, None,
+                                   checkpoint if self.settings["source"] == "checkpoint" else None)
+
+    # Return up to 'count' records of the table following the key, or from the first key if
+    # the key is None, and up to the end key if given.
+    def read_records(self, cursor, key, count, end=None):
+        import wiredtiger
+
+        records = []
+        if key is None:
+            ret = cursor.next()
+        else:
+            cursor.set_key(key)
+            exact = cursor.search_near()
+            if exact == wiredtiger.WT_NOTFOUND:
+                ret = exact
+            else:
+                ret = cursor.next() if exact <= 0 else 0
+        while ret == 0 and (count is None or len(records) < count):
+            record_key = cursor.get_key()
+            if end is not None and record_key > end:
+                break
+            record_value = cursor.get_value()
+            self.limiter.acquire(size_of(record_key) + size_of(record_value))
+            records.append((record_key, record_value))
+            ret = cursor.next()
+        return records
+
+    # Return the records of a table, and of its mirror if any, for a slice of keys following
+    # the given key, read in one snapshot.
+    def read_slice(self, uri, mirror, key, count):
+        session = self.connection.open_session()
+        try:
+            if self.settings["source"] == "snapshot":
+                session.begin_transaction("isolation=snapshot")
+            cursor = self.open_cursor(session, uri)
+            records = self.read_records(cursor, key, count)
+            mirror_records = None
+            if mirror:
+                # A slice ending the table extends to the last key of the mirror.
+                end = records[-1][0] if len(records) == count else None
+                mirror_records = self.read_records(self.open_cursor(session, mirror), key,
+                                                   None, end)
+            return records, mirror_records
+        finally:
+            session.close()
+
+    # Return the divergences of a slice: keys out of order, and keys missing from the table or
+    # its mirror or holding different values.
+    def compare(self, key, records, mirror_records):
+        divergences = []
+        previous = key
+        for record_key, _ in records:
+            if previous is not None and record_key <= previous:
+                divergences.append({"kind": "key_order", "key": str(record_key)})
+            previous = record_key
+        if mirror_records is None:
+            return divergences
+        base, mirror = dict(records), dict(mirror_records)
+        for record_key in sorted(set(base) | set(mirror)):
+            if record_key not in mirror:
+                divergences.append({"kind": "missing_in_mirror", "key": str(record_key)})
+            elif record_key not in base:
+                divergences.append({"kind": "missing_in_base", "key": str(record_key)})
+            elif base[record_key] != mirror[record_key]:
+                divergences.append({"kind": "value_mismatch", "key": str(record_key)})
+        return divergences
+
+    # Check the next slice of the walk and update the state. Return whether the pass is over.
+    def check_slice(self, state):
+        import wiredtiger
+
+        session = self.connection.open_session()
+        try:
+            tables = get_tables(session)
+        finally:
+            session.close()
+        tables = [(uri, mirror) for uri, mirror in tables if uri >= state.get("table", "")]
+        if not tables:
+            return True
+        uri, mirror = tables[0]
+        key = state.get("key") if uri == state.get("table") else None
+        count = self.settings["slice_keys"]
+
+        try:
+            records, mirror_records = self.read_slice(uri, mirror, key, count)
+            divergences = self.compare(key, records, mirror_records)
+            if divergences:
+                # Read the slice again to rule out updates of the table and its mirror in
+                # flight, or a checkpoint completing between the two reads.
+                self.stopping.wait(self.settings["confirm_delay"])
+                again = self.compare(key, *self.read_slice(uri, mirror, key, count))
+                divergences = [d for d in divergences if d in again]
+        except wiredtiger.WiredTigerError as e:
+            # A table dropped by the workload, or without a checkpoint yet, is skipped.
+            if self.exists(uri) and not self.not_checkpointed(e):
+                records, divergences = [], [{"kind": "read_error", "error": str(e)}]
+            else:
+                records, divergences = [], []
+
+        if divergences:
+            self.report(uri, mirror, divergences)
+            state["divergences"] += len(divergences)
+        state["keys"] += len(records)
+        if len(records) == count:
+            state["table"], state["key"] = uri, records[-1][0]
+        else:
+            # Move on to the table following this one.
+            state["table"], state["key"] = uri + "\0", None
+        return False
+
+    # Return whether the error of a checkpoint cursor means that the table, or its mirror, was
+    # created after the latest checkpoint.
+    def not_checkpointed(self, error):
+        message = str(error)
+        return self.settings["source"] == "checkpoint" and \
+            ("WT_NOTFOUND" in message or os.strerror(errno.ENOENT) in message)
+
+    # Return whether the table still exists in the database.
+    def exists(self, uri):
+        session = self.connection.open_session()
+        try:
+            cursor = session.open_cursor("metadata:", None, None)
+            cursor.set_key(uri)
+            return cursor.search() == 0
+        except Exception:
+            return False
+        finally:
+            session.close()
+
+    # Report the divergences of a slice in the log of the workload, the divergences file and
+    # the event store.
+    def report(self, uri, mirror, divergences):
+        for divergence in divergences[:max_reported]:
+            print(f"Checker: Divergence in '{uri}'"
+                  f"{f' and its mirror {mirror!r}' if mirror else ''}: {divergence['kind']} "
+                  f"{divergence.get('key') or divergence.get('error')}", flush=True)
+        with open(os.path.join(self.workload_dir, "divergences.jsonl"), "a") as f:
+            for divergence in divergences:
+                f.write(json.dumps({"time": time.time(), "table": uri, "mirror": mirror,
+                                    "source": self.settings["source"], **divergence}) + "\n")
+        emit(self.config, "testy-checker", "divergence", f"workload={self.workload}",
+             f"table={uri}", f"kind={divergences[0]['kind']}", f"count={len(divergences)}")
+
+    # Record the end of a pass over all the tables and start the next one.
+    def finish_pass(self, state):
+        duration = time.time() - state["pass_start"]
+        print(f"Checker: Pass {state['pass']} checked {state['keys']} keys in {duration:.0f}s, "
+              f"{state['divergences']} divergences.", flush=True)
+        emit(self.config, "testy-checker", "check_pass", f"workload={self.workload}",
+             f"pass={state['pass']}", f"keys={state['keys']}",
+             f"divergences={state['divergences']}", f"duration={duration:.0f}",
+             f"result={'failed' if state['divergences'] else 'success'}")
+        state.update({"pass": state["pass"] + 1, "pass_start": time.time(), "keys": 0,
+                      "divergences": 0, "table": "", "key": None,
+                      "last_pass": {"pass": state["pass"], "time": time.time(),
+                                    "keys": state["keys"], "divergences": state["divergences"],
+                                    "duration": duration}})
+
+    def stop(self):
+        self.stopping.set()
+
+# Print the progress of the checker of each workload and its latest divergences.
+def show(config, count="10"):
+
+    settings = get_settings(config)
+    if not os.path.isdir(settings["check_dir"]):
+        print("No workload has been checked.")
+        return
+    for workload in sorted(os.listdir(settings["check_dir"])):
+        workload_dir = get_workload_dir(settings, workload)
+        state = read_json(os.path.join(workload_dir, "state.json")) or {}
+        last = state.get("last_pass")
+        print(f"{workload}: pass {state.get('pass', 1)} at '{state.get('table') or '-'}', "
+              f"{state.get('keys', 0)} keys checked, {state.get('divergences', 0)} divergences")
+        if last:
+            print(f"  last pass: {last['keys']} keys in {last['duration']:.0f}s, "
+                  f"{last['divergences']} divergences, {time.time() - last['time']:.0f}s ago")
+        try:
+            with open(os.path.join(workload_dir, "divergences.jsonl")) as f:
+                lines = f.readlines()[-int(count):]
+        except FileNotFoundError:
+            lines = []
+        for line in lines:
+            divergence = json.loads(line)
+            print(f"  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(divergence['time']))} "
+                  f"{divergence['table']}: {divergence['kind']} "
+                  f"{divergence.get('key') or divergence.get('error')}")
+
+# This allows us to call script functions by name from the command line with an
+# arbitrary number of parameters. Example usage is:
+#
+#   $ python3 testy_checker.py show '/srv/testy/.testy'
+#
+if __name__ == "__main__":
+
+    globals()[sys.argv[1]](*sys.argv[2:])
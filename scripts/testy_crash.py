@@ -0,0 +1,329 @@
+import configparser as cp
+import glob, json, os, random, signal, subprocess, sys, threading, time, uuid
+from testy_hotbackup import read_json, write_json
+
+# Crash the workload in the phases where recovery bugs live, instead of at a random time: during
+# a checkpoint or a background compaction, or right after a table drop or a log file switch.
+# The crash testing service requests a crash in a phase, and a thread of the workload process
+# watches for that phase and kills the process with SIGKILL a configurable delay into it. The
+# phases are watched through the statistics of the connection, which are only read while a
+# crash is requested, and through the log files. A crash is recorded with its phase, the delay
+# and, for the phases that run for a while, whether the phase was still running at the time of
+# the kill.
+#
+# After the backup of the crashed database, the crash testing service runs recovery on the
+# database with the wt utility, timing it, before restarting the workload. The crashes and their
+# recovery are aggregated per phase by the report.
+
+# The crash settings used when the testy configuration file has no 'crash' section or is
+# missing some of its options. The crash testing service requests a crash in the phase of the
+# list with the fewest crashes. The delay into the phase, in seconds, is picked in the given
+# range. A phase not seen within 'phase_timeout' seconds falls back to an immediate crash.
+default_settings = {
+    "crash_dir": "/srv/testy/crashes",
+    "phases": "checkpoint,after_drop,compact,after_log_switch",
+    "delay": "0:5",
+    "phase_timeout": 3600,
+    "poll_ms": 50,
+    "request_interval": 5,
+}
+
+# The connection statistics showing the phases: a 'level' statistic is non-zero while the phase
+# runs, and a 'count' statistic increases once the phase has completed. Neither a table drop nor
+# a log switch can be seen while it runs, so their phases start right after them: the drops are
+# counted by WiredTiger once done, and the log switches are seen as new log files.
+phase_stats = {
+    "checkpoint": ("txn_checkpoint_running", "level"),
+    "compact": ("background_compact_running", "level"),
+    "after_drop": ("session_table_drop_success", "count"),
+}
+phases = list(phase_stats) + ["after_log_switch"]
+
+# The former names of the phases, in the configuration and the crash records.
+phase_aliases = {"drop": "after_drop", "log_switch": "after_log_switch"}
+
+# Return the crash settings from the 'crash' section of the testy configuration file.
+def get_settings(config):
+
+    parser = cp.ConfigParser(interpolation=cp.ExtendedInterpolation())
+    parser.read(config)
+
+    settings = dict(default_settings)
+    if parser.has_section("crash"):
+        section = parser["crash"]
+        for key, value in default_settings.items():
+            settings[key] = type(value)(section.get(key, value))
+    return settings
+
+# Return the directory of the crashes of a workload, holding the crash request, the latest
+# crash and the crash records.
+def get_workload_dir(settings, workload):
+    return os.path.join(settings["crash_dir"], workload)
+
+# Return the number of the latest log file of the database.
+def get_log_number(database_dir):
+
+    logs = glob.glob(os.path.join(database_dir, "WiredTigerLog.*"))
+    return max((int(os.path.splitext(log)[1][1:]) for log in logs), default=0)
+
+# Write a crash record atomically and durably before the process is killed. Only the record is
+# synced, the database files are left as the crash finds them.
+def write_record(path, record):
+
+    with open(path + ".tmp", "w") as f:
+        json.dump(record, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+class CrashInjector(threading.Thread):
+    def __init__(self, connection, database_dir, settings=None):
+        super().__init__(daemon=True)
+        self.connection = connection
+        self.database_dir = database_dir
+        self.settings = settings or get_settings(os.environ.get("testy_config", ""))
+        self.workload_dir = get_workload_dir(self.settings,
+                                             os.environ.get("testy_workload", "workload"))
+        self.stopping = threading.Event()
+
+    def run(self):
+        while not self.stopping.wait(self.settings["request_interval"]):
+            request = read_json(os.path.join(self.workload_dir, "request.json"))
+            latest = read_json(os.path.join(self.workload_dir, "latest.json")) or {}
+            if request and request["id"] != latest.get("id") and request["phase"] in phases:
+                try:
+                    self.crash(request)
+                except Exception as e:
+                    print(f"Crash injector: Error: {e}", flush=True)
+
+    # Return the value of a connection statistic.
+    def read_stat(self, name):
+        from wiredtiger import stat
+
+        session = self.connection.open_session()
+        try:
+            cursor = session.open_cursor("statistics:", None, None)
+            cursor.set_key(getattr(stat.conn, name))
+            cursor.search()
+            return cursor.get_value()[2]
+        finally:
+            session.close()
+
+    # Return the statistic showing the phase, or the number of the latest log file. Following
+    # a previous sample, only the next log files are looked for.
+    def sample(self, phase, previous=None):
+        if phase != "after_log_switch":
+            return self.read_stat(phase_stats[phase][0])
+        number = get_log_number(self.database_dir) if previous is None else previous
+        while os.path.exists(os.path.join(self.database_dir, f"WiredTigerLog.{number + 1:010d}")):
+            number += 1
+        return number
+
+    # Return whether the phase started between two samples.
+    def started(self, phase, previous, current):
+        if phase in phase_stats and phase_stats[phase][1] == "level":
+            return previous == 0 and current > 0
+        return current > previous
+
+    # Return whether the phase is still running at the second of two samples, or None for the
+    # phases following a completed operation, which do not run.
+    def running(self, phase, previous, current):
+        if phase in phase_stats and phase_stats[phase][1] == "level":
+            return current > 0
+        return None
+
+    # Wait for the requested phase to start, kill the process the requested delay into it and
+    # record the crash first. Return if the phase does not start in time.
+    def crash(self, request):
+        phase, delay, poll = request["phase"], request["delay"], self.settings["poll_ms"] / 1000
+        print(f"Crash injector: Waiting for a {phase} to crash {delay:.2f}s into it.", flush=True)
+        deadline = time.monotonic() + self.settings["phase_timeout"]
+        previous = self.sample(phase)
+        while not self.stopping.wait(poll):
+            if time.monotonic() > deadline:
+                print(f"Crash injector: No {phase} in {self.settings['phase_timeout']}s.",
+                      flush=True)
+                return
+            current = self.sample(phase, previous)
+            if self.started(phase, previous, current):
+                break
+            previous = current
+        else:
+            return
+
+        detected = time.time()
+        time.sleep(delay)
+        record = {"id": request["id"], "phase": phase, "delay": delay, "time": time.time(),
+                  "detected": detected, "poll_ms": poll * 1000}
+        record["in_phase"] = self.running(phase, current, self.sample(phase, current))
+        path = os.path.join(self.workload_dir, "latest.json")
+        write_record(path, record)
+        # The phase may end while the record is written: sample it again right before the
+        # kill, and correct the record if it did.
+        if record["in_phase"] and not self.running(phase, current, self.sample(phase, current)):
+            record["in_phase"] = False
+            write_record(path, record)
+        os.kill(os.getpid(), signal.SIGKILL)
+
+    def stop(self):
+        self.stopping.set()
+
+def emit_event(config, event, *fields):
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    subprocess.run(["python3", os.path.join(script_dir, "testy_events.py"), "emit", config,
+                    "testy-crash", event, *fields])
+
+def read_records(workload_dir):
+
+    try:
+        with open(os.path.join(workload_dir, "crashes.jsonl")) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+    # The crashes recorded under the former names of the phases could not tell whether they
+    # landed in the operation.
+    for record in records:
+        if record["phase"] in phase_aliases:
+            record["phase"], record["in_phase"] = phase_aliases[record["phase"]], None
+    return records
+
+# Return the phase of the list with the fewest recorded crashes, so every phase gets tested.
+def pick_phase(settings, records):
+
+    candidates = [phase_aliases.get(p.strip(), p.strip()) for p in settings["phases"].split(",")]
+    candidates = [p for p in candidates if p in phases]
+    if not candidates:
+        return None
+    counts = {p: sum(1 for r in records if r["phase"] == p) for p in candidates}
+    return min(candidates, key=lambda p: (counts[p], random.random()))
+
+def is_active(service):
+    return subprocess.run(["systemctl", "is-active", "--quiet", service]).returncode == 0
+
+# Crash the workload for the crash testing service: request a crash in the next phase and wait
+# for the workload to crash, or kill it at once if the phase does not come in time or the
+# phases are disabled. The crash is recorded as the latest crash of the workload.
+def crash(config, workload):
+
+    settings = get_settings(config)
+    workload_dir = get_workload_dir(settings, workload)
+    service = f"testy-run@{workload}.service"
+    low, _, high = settings["delay"].partition(":")
+    delay = random.uniform(float(low), float(high or low))
+    request_id = uuid.uuid4().hex[:16]
+
+    # A crash that cannot be requested in a phase is still a crash, made at once.
+    try:
+        os.makedirs(workload_dir, exist_ok=True)
+        phase = pick_phase(settings, read_records(workload_dir))
+        if phase:
+            write_json(os.path.join(workload_dir, "request.json"),
+                       {"id": request_id, "phase": phase, "delay": delay})
+    except OSError as e:
+        print(f"Error: Unable to request a crash in a phase, crashing at once: {e}")
+        phase = None
+
+    if phase:
+        deadline = time.time() + settings["phase_timeout"] + delay + 60
+        while time.time() < deadline and is_active(service):
+            time.sleep(1)
+
+    latest = read_json(os.path.join(workload_dir, "latest.json")) or {}
+    if latest.get("id") != request_id or is_active(service):
+        # The phase did not come: crash at once, as the crash testing service always did.
+        result = subprocess.run(["systemctl", "show", "--property", "MainPID", "--value",
+                                 service], capture_output=True, text=True)
+        subprocess.run(["pkill", "-P", result.stdout.strip(), "--signal", "SIGKILL"])
+        latest = {"id": request_id, "phase": "none", "requested_phase": phase, "delay": 0,
+                  "time": time.time(), "in_phase": False}
+        try:
+            write_json(os.path.join(workload_dir, "latest.json"), latest)
+        except OSError as e:
+            print(f"Error: Unable to record the crash: {e}")
+
+    print(f"Crashed workload '{workload}' in phase '{latest['phase']}', {latest['delay']:.2f}s "
+          f"into it{', after it ended' if latest['in_phase'] is False else ''}.")
+    in_phase = [] if latest["in_phase"] is None else \
+        [f"in_phase={str(latest['in_phase']).lower()}"]
+    emit_event(config, "crash", f"workload={workload}", f"phase={latest['phase']}",
+               f"delay={latest['delay']:.2f}", *in_phase)
+
+# Run recovery on the crashed database with the wt utility, time it and record the latest crash
+# of the workload with its recovery, for the crash testing service. The workload would run the
+# same recovery when it restarts.
+def recover(config, workload):
+
+    settings = get_settings(config)
+    workload_dir = get_workload_dir(settings, workload)
+    latest = read_json(os.path.join(workload_dir, "latest.json"))
+    if not latest or latest.get("recovered") is not None:
+        print(f"No crash of workload '{workload}' to recover.")
+        return
+    parser = cp.ConfigParser(interpolation=cp.ExtendedInterpolation())
+    parser.read(config)
+    database_dir = os.environ.get("database_dir") or parser.get("application", "database_dir")
+    wt = os.path.join(os.environ.get("wt_build_dir") or parser.get("wiredtiger", "build_dir"),
+                      "wt")
+
+    start = time.monotonic()
+    result = subprocess.run([wt, "-R", "-h", database_dir, "list"], capture_output=True,
+                            text=True)
+    latest["recovery_time"] = time.monotonic() - start
+    latest["recovered"] = result.returncode == 0
+    if not latest["recovered"]:
+        latest["error"] = (result.stderr or result.stdout).strip()[-2000:]
+    with open(os.path.join(workload_dir, "crashes.jsonl"), "a") as f:
+        f.write(json.dumps(latest) + "\n")
+    write_json(os.path.join(workload_dir, "latest.json"), latest)
+
+    print(f"Recovery after the crash in phase '{latest['phase']}' "
+          f"{'succeeded' if latest['recovered'] else 'failed'} in "
+          f"{latest['recovery_time']:.1f}s.")
+    if not latest["recovered"]:
+        print(latest["error"])
+    emit_event(config, "crash_recovery", f"workload={workload}", f"phase={latest['phase']}",
+               f"result={'success' if latest['recovered'] else 'failed'}",
+               f"duration={latest['recovery_time']:.1f}")
+
+# Print the crashes of each workload aggregated per phase: the number of crashes, the kills
+# landing in the phase for the phases that run for a while, the recovery successes and the
+# recovery times.
+def report(config):
+
+    settings = get_settings(config)
+    workloads = sorted(os.listdir(settings["crash_dir"])) \
+                if os.path.isdir(settings["crash_dir"]) else []
+    for workload in workloads:
+        records = read_records(get_workload_dir(settings, workload))
+        if not records:
+            continue
+        print(f"==== {workload} ====")
+        print(f"{'phase':<16} {'crashes':>8} {'in phase':>9} {'recovered':>10} "
+              f"{'mean time':>10} {'max time':>9}")
+        for phase in phases + ["none"]:
+            selected = [r for r in records if r["phase"] == phase]
+            if not selected:
+                continue
+            times = [r["recovery_time"] for r in selected]
+            in_phase = "-" if phase.startswith("after_") else \
+                sum(1 for r in selected if r["in_phase"])
+            print(f"{phase:<16} {len(selected):>8} {in_phase:>9} "
+                  f"{sum(1 for r in selected if r['recovered']):>10} "
+                  f"{sum(times) / len(times):>9.1f}s {max(times):>8.1f}s")
+        for record in records:
+            if not record["recovered"]:
+                failed = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record["time"]))
+                error = (record.get("error") or "").splitlines()
+                print(f"  Recovery failed after the crash of {failed} in phase "
+                      f"'{record['phase']}': {error[-1] if error else 'unknown error'}")
+
+# This allows us to call script functions by name from the command line with an
+# arbitrary number of parameters. Example usage is:
+#
+#   $ python3 testy_crash.py report '/srv/testy/.testy'
+#
+if __name__ == "__main__":
+
+    result = globals()[sys.argv[1]](*sys.argv[2:])
+    sys.exit(0 if result is not False else 1)
@@ -0,0 +1,250 @@
+import configparser as cp
+import fcntl, glob, gzip, json, os, socket, subprocess, sys, tempfile, time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from testy_profile import parse_time
+
+# A local store of structured event records emitted by the testy services: the workload
+# starting and stopping, backups, snapshot validations, crash tests. Each record is a JSON
+# object with at least the time, the service and the event type, and optionally the workload,
+# snapshot ID, phase, duration and result.
+#
+# Records are appended to the current segment, one line per record. When the segment reaches
+# its size limit it is compressed, and named after the time range of its records so queries
+# only read the segments overlapping the requested range. The oldest segments are removed
+# beyond the store's size limit. The records are shipped to CloudWatch Logs in batches from
+# the store, which keeps a cursor of the records already shipped. Each server ships to its own
+# log stream, named after its instance ID, and the records carry the instance ID too.
+
+# The event settings used when the testy configuration file has no 'events' section or is
+# missing some of its options.
+default_settings = {
+    "event_dir": "/srv/testy/events",
+    "segment_size_mb": 16,
+    "max_size_mb": 512,
+    "log_group": "testy-logs",
+    "log_stream": "testy-events",
+}
+
+current_segment = "current.jsonl"
+
+metadata_url = "http://169.254.169.254/latest/meta-data"
+
+# The largest batch of records shipped to CloudWatch Logs in one request.
+ship_batch_records = 1000
+ship_batch_bytes = 512 * 1024
+
+# Return the event settings from the 'events' section of the testy configuration file.
+def get_settings(config):
+
+    parser = cp.ConfigParser(interpolation=cp.ExtendedInterpolation())
+    parser.read(config)
+
+    settings = dict(default_settings)
+    if parser.has_section("events"):
+        section = parser["events"]
+        for key, value in default_settings.items():
+            settings[key] = type(value)(section.get(key, value))
+    return settings
+
+class EventStore:
+    def __init__(self, event_dir, segment_size_mb=16, max_size_mb=512):
+        self.event_dir = event_dir
+        self.segment_size = segment_size_mb * 1024 * 1024
+        self.max_size = max_size_mb * 1024 * 1024
+        os.makedirs(event_dir, exist_ok=True)
+
+    # Serialize the writers of the store, which run in different services.
+    @contextmanager
+    def lock(self):
+        with open(os.path.join(self.event_dir, ".lock"), "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def append(self, record):
+        current = os.path.join(self.event_dir, current_segment)
+        with self.lock():
+            with open(current, "a") as f:
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+            if os.path.getsize(current) >= self.segment_size:
+                self.rotate()
+
+    # Compress the current segment into a segment named after its first and last record
+    # times, in milliseconds, and remove the oldest segments beyond the size limit. The
+    # caller holds the lock.
+    def rotate(self):
+        current = os.path.join(self.event_dir, current_segment)
+        with open(current) as f:
+            times = [json.loads(line)["time"] for line in f if line.strip()]
+        if not times:
+            return
+        name = f"events-{int(min(times) * 1000):013d}-{int(max(times) * 1000):013d}.jsonl.gz"
+        with open(current, "rb") as src:
+            with gzip.open(os.path.join(self.event_dir, name), "wb") as dst:
+                dst.writelines(src)
+        os.remove(current)
+
+        segments = self.segments()
+        total = sum(os.path.getsize(s) for s in segments)
+        for segment in segments[:-1]:
+            if total <= self.max_size:
+                break
+            total -= os.path.getsize(segment)
+            os.remove(segment)
+
+    # Return the compressed segments, oldest first, keeping the ones whose time range
+    # overlaps the given range. The current segment is not included.
+    def segments(self, start=None, end=None):
+        segments = []
+        for path in sorted(glob.glob(os.path.join(self.event_dir, "events-*.jsonl.gz"))):
+            first, last = [int(t) / 1000 for t in os.path.basename(path)[7:-9].split("-")]
+            if (start is None or last >= start) and (end is None or first <= end):
+                segments.append(path)
+        return segments
+
+    # Yield the records in the given time range, oldest segment first, matching the service
+    # and event type if given.
+    def read(self, start=None, end=None, service=None, event=None):
+        sources = [gzip.open(s, "rt") for s in self.segments(start, end)]
+        current = os.path.join(self.event_dir, current_segment)
+        if os.path.exists(current):
+            sources.append(open(current))
+        for source in sources:
+            with source:
+                for line in source:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A partial line written by a writer that died.
+                        continue
+                    if (start is None or record["time"] >= start) and \
+                       (end is None or record["time"] <= end) and \
+                       (not service or record["service"] == service) and \
+                       (not event or record["event"] == event):
+                        yield record
+
+# Return a field value given on the command line as a number if it is one.
+def parse_value(value):
+
+    for convert in [int, float]:
+        try:
+            return convert(value)
+        except ValueError:
+            pass
+    return value
+
+# Record an event. The fields are given as 'key=value' arguments, e.g. 'snapshot_id=snap-1234'
+# or 'duration=95'.
+def emit(config, service, event, *fields):
+
+    settings = get_settings(config)
+    record = {"time": time.time(), "service": service, "event": event}
+    for field in fields:
+        key, _, value = field.partition("=")
+        record[key] = parse_value(value)
+    store = EventStore(settings["event_dir"], settings["segment_size_mb"], settings["max_size_mb"])
+    store.append(record)
+
+# Print the records of a time range matching the service and event type, if given. The start
+# and end are ISO 8601 times or durations before now such as '30m', '12h' or '7d'.
+def query(config, start="1d", end="", service="", event="", limit="0", output="text"):
+
+    settings = get_settings(config)
+    store = EventStore(settings["event_dir"], settings["segment_size_mb"], settings["max_size_mb"])
+    start = parse_time(start).timestamp() if start else None
+    end = parse_time(end).timestamp() if end else None
+    records = list(store.read(start, end, service, event))
+    if int(limit):
+        records = records[-int(limit):]
+
+    for record in records:
+        if output == "json":
+            print(json.dumps(record))
+            continue
+        when = datetime.fromtimestamp(record["time"], timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        fields = " ".join(f"{k}={v}" for k, v in record.items()
+                          if k not in ("time", "service", "event"))
+        print(f"{when} {record['service']:<16} {record['event']:<20} {fields}")
+
+# Run an aws cli command, returning whether it succeeded.
+def aws(*args):
+    result = subprocess.run(["aws", *args], capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"Error: {result.stderr.strip()}", flush=True)
+    return result.returncode == 0
+
+# Return the ID of the instance, or the host name of a server that is not an EC2 instance.
+def get_instance_id():
+
+    url = os.environ.get("testy_metadata_url") or metadata_url
+    result = subprocess.run(["curl", "-sf", "--max-time", "5", f"{url.rstrip('/')}/instance-id"],
+                            capture_output=True, text=True)
+    return result.stdout.strip() or socket.gethostname()
+
+# Ship the records not shipped yet to CloudWatch Logs, in batches, then rotate the current
+# segment if it is older than a day so the time index stays useful on quiet servers.
+def ship(config):
+
+    settings = get_settings(config)
+    store = EventStore(settings["event_dir"], settings["segment_size_mb"], settings["max_size_mb"])
+    cursor_file = os.path.join(settings["event_dir"], "shipped.json")
+    try:
+        with open(cursor_file) as f:
+            cursor = json.load(f)["time"]
+    except (OSError, ValueError, KeyError):
+        cursor = time.time() - 86400
+
+    instance_id = get_instance_id()
+    group, stream = settings["log_group"], f"{settings['log_stream']}/{instance_id}"
+    subprocess.run(["aws", "logs", "create-log-stream", "--log-group-name", group,
+                    "--log-stream-name", stream], capture_output=True)
+
+    def save_cursor():
+        with open(cursor_file, "w") as f:
+            json.dump({"time": cursor}, f)
+
+    pending = [r for r in store.read(start=cursor) if r["time"] > cursor]
+    shipped = 0
+    while pending:
+        batch, batch_bytes = [], 0
+        for record in pending[:ship_batch_records]:
+            message = json.dumps({**record, "instance_id": instance_id})
+            if batch and batch_bytes + len(message) + 26 > ship_batch_bytes:
+                break
+            batch.append({"timestamp": int(record["time"] * 1000), "message": message})
+            batch_bytes += len(message) + 26
+        batch.sort(key=lambda e: e["timestamp"])
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as f:
+            json.dump(batch, f)
+            f.flush()
+            if not aws("logs", "put-log-events", "--log-group-name", group,
+                       "--log-stream-name", stream, "--log-events", f"file://{f.name}"):
+                save_cursor()
+                return False
+        cursor = max(r["time"] for r in pending[:len(batch)])
+        pending = pending[len(batch):]
+        shipped += len(batch)
+    save_cursor()
+    print(f"Shipped {shipped} event(s) to CloudWatch Logs '{group}/{stream}'.")
+
+    current = os.path.join(settings["event_dir"], current_segment)
+    with store.lock():
+        if os.path.exists(current):
+            with open(current) as f:
+                first = f.readline()
+            if first and time.time() - json.loads(first)["time"] > 86400:
+                store.rotate()
+    return True
+
+# This allows us to call script functions by name from the command line with an
+# arbitrary number of parameters. Example usage is:
+#
+#   $ python3 testy_events.py emit '/srv/testy/.testy' 'testy-backup' 'validation' \
+#         'snapshot_id=snap-0123456789abcdef0' 'result=success' 'duration=1800'
+#   $ python3 testy_events.py query '/srv/testy/.testy' '12h' '' 'testy-backup'
+#   $ python3 testy_events.py ship '/srv/testy/.testy'
+#
+if __name__ == "__main__":
+
+    result = globals()[sys.argv[1]](*sys.argv[2:])
+    sys.exit(0 if result is not False else 1)
@@ -0,0 +1,350 @@
+import configparser as cp
+import json, os, signal, subprocess, sys, time
+from testy_stall import checkpoint_stats, eviction_stats, flatten_stats, read_latest_stats
+
+# Inject I/O faults under the database of a workload, to test how WiredTiger behaves when the
+# disk gets slow, stalls or fails, and not only when the workload crashes. The database
+# directory of the workload is mounted from a device-mapper device over a loop device backed by
+# a file, so it runs on any Linux machine. The device maps the loop device linearly, and a
+# fault replaces its table for the duration of the fault: with a 'delay' target adding latency
+# to the reads and writes, or with a 'flakey' target failing or dropping the I/O periodically.
+#
+# The fault profiles are defined in the 'fault.<profile>' sections of the testy configuration
+# file, and each workload has a schedule of profiles injected one after the other by the fault
+# service. Each fault window is recorded with the throughput and latencies of the workload
+# before, during and after the fault, and with the change of the WiredTiger statistics, so the
+# effect of a fault and the recovery from it can be compared between builds.
+
+# The fault settings used when the testy configuration file has no 'fault' section or is
+# missing some of its options. The schedule is a list of profiles, and the fault service
+# injects the next one every 'interval' seconds. A workload may have its own schedule, set as
+# 'fault_schedule' in its 'workload.<name>' section.
+default_settings = {
+    "fault_dir": "/srv/testy/faults",
+    "image_size_gb": 100,
+    "filesystem": "ext4",
+    "schedule": "",
+    "interval": 3600,
+}
+
+# The settings of a fault profile used when its section is missing some of its options. The
+# 'delay' target delays the reads and writes by the given milliseconds. The 'flakey' target
+# passes the I/O for 'up' seconds, then fails it for 'down' seconds, with the given features,
+# e.g. 'error_writes' or 'drop_writes', or fails all the I/O without features.
+default_profile = {
+    "target": "delay",
+    "duration": 300,
+    "read_ms": 0,
+    "write_ms": 0,
+    "up": 60,
+    "down": 5,
+    "features": "",
+}
+
+# The statistics whose change is recorded for each fault window, matched by substring.
+fault_stats = checkpoint_stats + eviction_stats + [
+    "block-manager: bytes read", "block-manager: bytes written", "total fsync I/Os",
+    "log: log sync operations"]
+
+# Return the fault settings from the 'fault' section of the testy configuration file, with the
+# schedule of the workload and the fault profiles.
+def get_settings(config, workload=None):
+
+    parser = cp.ConfigParser(interpolation=cp.ExtendedInterpolation())
+    parser.read(config)
+
+    settings = dict(default_settings)
+    if parser.has_section("fault"):
+        section = parser["fault"]
+        for key, value in default_settings.items():
+            settings[key] = type(value)(section.get(key, value))
+    workload_section = f"workload.{workload}"
+    if workload and parser.has_option(workload_section, "fault_schedule"):
+        settings["schedule"] = parser.get(workload_section, "fault_schedule")
+
+    settings["profiles"] = {}
+    for name in parser.sections():
+        if name.startswith("fault."):
+            profile = dict(default_profile)
+            for key, value in default_profile.items():
+                profile[key] = type(value)(parser[name].get(key, value))
+            settings["profiles"][name.split(".", 1)[1]] = profile
+
+    # The service environment holds the database directory of the workload instance.
+    settings["database_dir"] = os.environ.get("database_dir") or \
+                               parser.get("application", "database_dir")
+    settings["user"] = parser.get("application", "user", fallback="testy")
+    return settings
+
+def get_device_name(workload):
+    return f"testy-{workload}"
+
+def get_workload_dir(settings, workload):
+    return os.path.join(settings["fault_dir"], workload)
+
+def sudo(*args, check=True):
+    return subprocess.run(["sudo", *args], capture_output=True, text=True, check=check)
+
+# Return the loop device backed by the image, or None if it is not attached.
+def get_loop_device(image):
+
+    result = sudo("losetup", "--noheadings", "--output", "NAME", "--associated", image,
+                  check=False)
+    devices = result.stdout.split()
+    return devices[0] if devices else None
+
+# Return the device-mapper table of a fault profile, or the linear table without a profile.
+def get_table(loop_device, profile=None):
+
+    sectors = sudo("blockdev", "--getsz", loop_device).stdout.strip()
+    if profile is None:
+        return f"0 {sectors} linear {loop_device} 0"
+    if profile["target"] == "delay":
+        return (f"0 {sectors} delay {loop_device} 0 {profile['read_ms']} "
+                f"{loop_device} 0 {profile['write_ms']}")
+    if profile["target"] == "flakey":
+        features = profile["features"].split()
+        table = f"0 {sectors} flakey {loop_device} 0 {profile['up']} {profile['down']}"
+        return table + (f" {len(features)} {' '.join(features)}" if features else "")
+    raise ValueError(f"Unknown fault target '{profile['target']}'.")
+
+# Replace the table of the device of the workload. The I/O is held while the table changes.
+def load_table(workload, table):
+
+    device = get_device_name(workload)
+    sudo("dmsetup", "suspend", device)
+    try:
+        sudo("dmsetup", "load", device, "--table", table)
+    finally:
+        sudo("dmsetup", "resume", device)
+
+# Mount the database directory of the workload from a device that faults can be injected into.
+# The image file, the loop device and the device are created if needed, so this also restores
+# the mount after a reboot. A new device requires the database directory to be empty: run it
+# before populating the database.
+def setup(config, workload):
+
+    settings = get_settings(config, workload)
+    database_dir, device = settings["database_dir"], get_device_name(workload)
+    image = os.path.join(settings["fault_dir"], f"{workload}.img")
+    mapped = f"/dev/mapper/{device}"
+
+    if sudo("mountpoint", "-q", database_dir, check=False).returncode == 0:
+        print(f"'{database_dir}' is already mounted.")
+        return True
+    new = not os.path.exists(image)
+    if new and os.path.isdir(database_dir) and os.listdir(database_dir):
+        print(f"Error: '{database_dir}' is not empty. Stop the workload and move the database "
+              "away, or set up the fault device before populating it.")
+        return False
+
+    os.makedirs(settings["fault_dir"], exist_ok=True)
+    if new:
+        subprocess.run(["fallocate", "-l", f"{settings['image_size_gb']}G", image], check=True)
+    loop_device = get_loop_device(image) or \
+                  sudo("losetup", "--find", "--show", image).stdout.strip()
+    if sudo("dmsetup", "info", device, check=False).returncode != 0:
+        sudo("dmsetup", "create", device, "--table", get_table(loop_device))
+    if new:
+        sudo(f"mkfs.{settings['filesystem']}", "-q", mapped)
+    sudo("mkdir", "-p", database_dir)
+    sudo("mount", mapped, database_dir)
+    sudo("chown", f"{settings['user']}:{settings['user']}", database_dir)
+    print(f"Mounted '{database_dir}' from {mapped} over {loop_device} ({image}).")
+    return True
+
+# Unmount the database directory of the workload and remove its device. The image file, which
+# holds the database, is kept unless 'remove' is true.
+def teardown(config, workload, remove="false"):
+
+    settings = get_settings(config, workload)
+    image = os.path.join(settings["fault_dir"], f"{workload}.img")
+    sudo("umount", settings["database_dir"], check=False)
+    sudo("dmsetup", "remove", get_device_name(workload), check=False)
+    loop_device = get_loop_device(image)
+    if loop_device:
+        sudo("losetup", "--detach", loop_device)
+    if remove == "true" and os.path.exists(image):
+        os.remove(image)
+    print(f"Removed the fault device of workload '{workload}'.")
+
+# Return the position of the end of the workgen monitor file, to read the samples written
+# after it.
+def monitor_position(path):
+
+    try:
+        stat = os.stat(path)
+        return stat.st_ino, stat.st_size
+    except OSError:
+        return None, 0
+
+# Return the monitor samples written between two positions of the monitor file. The samples
+# are lost if the file was recreated in between by a workload restart, or rotated.
+def read_samples(path, start, end):
+
+    if start[0] is None or start[0] != end[0] or end[1] < start[1]:
+        return []
+    samples = []
+    with open(path) as f:
+        f.seek(start[1])
+        for line in f.read(end[1] - start[1]).splitlines():
+            try:
+                samples.append(json.loads(line))
+            except ValueError:
+                pass
+    return samples
+
+# Return the mean throughput and the maximum latency in milliseconds of each operation type of
+# the monitor samples. The monitor reports the latencies in microseconds.
+def summarize(samples):
+
+    summary = {}
+    for sample in samples:
+        for name, values in sample.get("workgen", {}).items():
+            if isinstance(values, dict) and "ops per sec" in values:
+                entry = summary.setdefault(name, {"ops_per_sec": 0, "max_latency_ms": 0})
+                entry["ops_per_sec"] += values["ops per sec"] / len(samples)
+                entry["max_latency_ms"] = max(entry["max_latency_ms"],
+                                              values.get("max latency", 0) / 1000)
+    return summary
+
+# Return the latest WiredTiger statistics recorded for the fault window.
+def read_stats(database_dir):
+
+    records = read_latest_stats(database_dir, 1)
+    stats = flatten_stats(records[-1]) if records else {}
+    return {k: v for k, v in stats.items()
+            if isinstance(v, (int, float)) and any(p in k for p in fault_stats)}
+
+def emit_event(config, event, *fields):
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    subprocess.run(["python3", os.path.join(script_dir, "testy_events.py"), "emit", config,
+                    "testy-fault", event, *fields])
+
+# Inject a fault profile into the device of the workload for its duration, or the given
+# duration in seconds, and record the fault window. The workload is observed for the same
+# duration before the fault, as a baseline, and after it, to measure the recovery.
+def inject(config, workload, profile_name, duration=None):
+
+    settings = get_settings(config, workload)
+    if profile_name not in settings["profiles"]:
+        print(f"Error: No 'fault.{profile_name}' section in the testy configuration file.")
+        return False
+    profile = settings["profiles"][profile_name]
+    duration = float(duration or profile["duration"])
+    image = os.path.join(settings["fault_dir"], f"{workload}.img")
+    loop_device = get_loop_device(image)
+    if not loop_device:
+        print(f"Error: Workload '{workload}' has no fault device. Run setup first.")
+        return False
+
+    monitor = os.path.join(settings["database_dir"], "monitor.json")
+    table = get_table(loop_device, profile)
+    positions = [monitor_position(monitor)]
+    time.sleep(duration)
+    stats = [read_stats(settings["database_dir"])]
+    positions.append(monitor_position(monitor))
+
+    print(f"Injecting fault '{profile_name}' for {duration:.0f}s: {table}", flush=True)
+    emit_event(config, "fault_injected", f"workload={workload}", f"profile={profile_name}",
+               f"target={profile['target']}", f"duration={duration:.0f}")
+    start = time.time()
+    load_table(workload, table)
+    try:
+        time.sleep(duration)
+    finally:
+        load_table(workload, get_table(loop_device))
+    end = time.time()
+    stats.append(read_stats(settings["database_dir"]))
+    positions.append(monitor_position(monitor))
+    print(f"Cleared fault '{profile_name}'.", flush=True)
+
+    time.sleep(duration)
+    positions.append(monitor_position(monitor))
+    window = {"profile": profile_name, **profile, "start": start, "end": end, "table": table}
+    for name, i in [("baseline", 0), ("fault", 1), ("recovery", 2)]:
+        window[name] = summarize(read_samples(monitor, positions[i], positions[i + 1]))
+    window["stats_delta"] = {k: v - stats[0].get(k, v) for k, v in stats[1].items()}
+
+    workload_dir = get_workload_dir(settings, workload)
+    os.makedirs(workload_dir, exist_ok=True)
+    with open(os.path.join(workload_dir, "windows.jsonl"), "a") as f:
+        f.write(json.dumps(window) + "\n")
+    emit_event(config, "fault_cleared", f"workload={workload}", f"profile={profile_name}",
+               f"duration={end - start:.0f}")
+    print_window(window)
+    return True
+
+# Restore the linear table of the device of the workload, e.g. after an interrupted fault.
+def clear(config, workload):
+
+    settings = get_settings(config, workload)
+    loop_device = get_loop_device(os.path.join(settings["fault_dir"], f"{workload}.img"))
+    if loop_device:
+        load_table(workload, get_table(loop_device))
+        print(f"Cleared the faults of workload '{workload}'.")
+
+# Inject the faults of the schedule of the workload one after the other, one every interval,
+# for the fault service. The device is restored when the service stops.
+def schedule(config, workload):
+
+    settings = get_settings(config, workload)
+    profiles = [p.strip() for p in settings["schedule"].split(",") if p.strip()]
+    if not profiles:
+        print(f"No fault schedule for workload '{workload}'.")
+        return
+    if not get_loop_device(os.path.join(settings["fault_dir"], f"{workload}.img")):
+        print(f"Workload '{workload}' has no fault device, no fault is injected.")
+        return
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"Injecting the faults {', '.join(profiles)} every {settings['interval']}s.",
+          flush=True)
+    i = 0
+    try:
+        while True:
+            time.sleep(settings["interval"])
+            inject(config, workload, profiles[i % len(profiles)])
+            i += 1
+    finally:
+        clear(config, workload)
+
+def print_window(window):
+
+    start = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(window["start"]))
+    print(f"{start}  {window['profile']} ({window['target']}) for "
+          f"{window['end'] - window['start']:.0f}s")
+    for name in sorted(set(window["baseline"]) | set(window["fault"])):
+        values = [window[phase].get(name, {}) for phase in ["baseline", "fault", "recovery"]]
+        print(f"  {name:<8} ops/s " +
+              " -> ".join(f"{v.get('ops_per_sec', 0):.0f}" for v in values) +
+              "   max latency ms " +
+              " -> ".join(f"{v.get('max_latency_ms', 0):.0f}" for v in values))
+
+# Print the fault windows of the workload, or of every workload: the throughput and maximum
+# latency of each operation type before, during and after each fault.
+def report(config, workload=""):
+
+    settings = get_settings(config)
+    workloads = [workload] if workload else sorted(os.listdir(settings["fault_dir"])) \
+                if os.path.isdir(settings["fault_dir"]) else []
+    for name in workloads:
+        path = os.path.join(get_workload_dir(settings, name), "windows.jsonl")
+        if not os.path.isfile(path):
+            continue
+        print(f"==== {name} ====")
+        with open(path) as f:
+            for line in f:
+                print_window(json.loads(line))
+
+# This allows us to call script functions by name from the command line with an
+# arbitrary number of parameters. Example usage is:
+#
+#   $ python3 testy_fault.py setup '/srv/testy/.testy' sample
+#   $ python3 testy_fault.py inject '/srv/testy/.testy' sample slow 60
+#
+if __name__ == "__main__":
+
+    result = globals()[sys.argv[1]](*sys.argv[2:])
+    sys.exit(0 if result is not False else 1)
@@ -0,0 +1,285 @@
+import hashlib, json, os, queue, re, resource, shutil, subprocess, sys, threading, time
+from testy_resources import get_disk_capacity, get_fast_storage
+
+# Run a test/format campaign: test/format runs from a matrix of CONFIG files scheduled on
+# all cores, each in its own home directory. Unlike format.sh, the campaign keeps going
+# after a failure. Failures are bucketed by a crash signature, and the first failure of each
+# bucket is kept with its reproducer configs.
+#
+# Most runs are short-lived and I/O-bound, so the home directories are placed on fast local
+# storage (instance store NVMe or tmpfs) when there is enough space. A home directory is
+# only copied to persistent storage when its run fails, and home directories are removed in
+# the background so that the next run does not wait for the cleanup.
+
+# The number of stack frames used for a crash signature.
+signature_frames = 8
+
+# Seconds between two campaign statistics updates.
+report_interval = 300
+
+# The free space to reserve for each run's home directory.
+home_reserve = 2 * 1024 ** 3
+
+# Return the test/format binary for the WiredTiger build directory.
+def get_format_binary(wt_build_dir):
+    return os.path.join(wt_build_dir, "test", "format", "t")
+
+# Read a format CONFIG file into a dictionary. Values may be randomized ranges such as
+# "runs.rows=1000000:5000000", which format resolves for each run.
+def read_config(path):
+    config = {}
+    with open(path) as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if "=" in line:
+                key, value = line.split("=", 1)
+                config[key.strip()] = value.strip()
+    return config
+
+# Normalize a line of output for a crash signature: remove the numbers, addresses and paths
+# that differ between runs hitting the same bug.
+def normalize(line):
+    line = re.sub(r"0x[0-9a-fA-F]+", "ADDR", line)
+    line = re.sub(r"(/[\w.-]+)+/", "", line)
+    return re.sub(r"\d+", "N", line).strip()
+
+# Return the function names of the crashing thread's stack from a core file, or an empty
+# list if there is no core file or gdb is not available.
+def get_core_stack(binary, home):
+    cores = [f for f in os.listdir(home) if f.startswith("core")]
+    if not cores or not shutil.which("gdb"):
+        return []
+    result = subprocess.run(["gdb", "-batch", "-ex", "bt", binary, os.path.join(home, cores[0])],
+                            capture_output=True, text=True)
+    frames = re.findall(r"^#\d+\s+(?:0x[0-9a-f]+ in )?(\S+) \(", result.stdout, re.MULTILINE)
+    # Skip the frames of the abort handling itself.
+    frames = [f for f in frames if not re.match(r"(raise|abort|__GI_|__wt_abort|__wt_panic)", f)]
+    return frames[:signature_frames]
+
+# Return the signature of a failed run and a one-line description of it. The signature is
+# based on the crash stack if the run left a core file, or on the error lines in its output.
+def get_signature(binary, home, log):
+    frames = get_core_stack(binary, home)
+    if frames:
+        return hashlib.sha1(" ".join(frames).encode()).hexdigest()[:12], " <- ".join(frames)
+
+    with open(log, errors="replace") as f:
+        lines = f.readlines()[-200:]
+    errors = [normalize(l) for l in lines
+              if re.search(r"error|assert|panic|abort|fail", l, re.IGNORECASE)]
+    description = errors[0] if errors else "no error output"
+    return hashlib.sha1("\n".join(errors[:3]).encode()).hexdigest()[:12], description
+
+# Save the reproducer configs for a failed run into the bucket directory:
+#   CONFIG      The complete config format resolved for the run.
+#   CONFIG.min  The parameters of the campaign config with the values resolved for the
+#               run, and the run's random seeds.
+def save_reproducer(home, source_config, bucket_dir):
+    resolved = os.path.join(home, "CONFIG")
+    if not os.path.exists(resolved):
+        return
+    shutil.copy(resolved, os.path.join(bucket_dir, "CONFIG"))
+    values = read_config(resolved)
+    keys = [k for k in values if k in source_config or k.startswith("random.")]
+    with open(os.path.join(bucket_dir, "CONFIG.min"), "w") as f:
+        f.writelines(f"{k}={values[k]}\n" for k in keys)
+
+# Publish a metric through the testy metrics script, if it is available.
+def publish_metric(name, value):
+    script = os.path.join(os.environ.get("script_dir", ""), "testy-metrics.sh")
+    if os.path.exists(script):
+        subprocess.run([script, name, f"{value:.2f}"], capture_output=True)
+
+# Remove a file or a directory tree. The entries that cannot be removed are skipped, and
+# reported together once the rest is removed.
+def remove(path):
+    errors = []
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, onerror=lambda _, entry, error: errors.append((entry, error[1])))
+    else:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    if errors:
+        raise OSError(f"Unable to remove {len(errors)} entries of '{path}', e.g. "
+                      f"'{errors[0][0]}': {errors[0][1]}")
+
+# Run file operations in a background thread, in order.
+class BackgroundWorker:
+    def __init__(self):
+        self.tasks = queue.Queue()
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        while True:
+            func, args = self.tasks.get()
+            try:
+                func(*args)
+            except OSError as e:
+                print(f"Error: Background {func.__name__} failed: {e}", flush=True)
+            self.tasks.task_done()
+
+    def submit(self, func, *args):
+        self.tasks.put((func, args))
+
+    def pending(self):
+        return self.tasks.unfinished_tasks
+
+    def wait(self):
+        self.tasks.join()
+
+class Campaign:
+    def __init__(self, configs, run_root, failure_dir, wt_build_dir, jobs):
+        self.configs = configs
+        fast_storage = get_fast_storage(jobs * home_reserve)
+        self.run_root = os.path.join(fast_storage, "testy-format") if fast_storage else run_root
+        print(f"Running format in '{self.run_root}'.", flush=True)
+        self.worker = BackgroundWorker()
+        self.bucket_root = os.path.join(failure_dir, "format")
+        self.stats_file = os.path.join(self.bucket_root, "campaign.json")
+        self.binary = get_format_binary(wt_build_dir)
+        self.jobs = jobs
+        self.running = {}
+        self.run_id = 0
+        self.stats = {"started": time.time(), "runs": 0, "failures": 0, "buckets": {}}
+
+        # The failure buckets are kept across restarts of the campaign so known failures
+        # are not saved again. The run counters are for the current campaign only.
+        try:
+            with open(self.stats_file) as f:
+                self.stats["buckets"] = json.load(f)["buckets"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+        # Remove the home directories left by a previous campaign.
+        os.makedirs(self.run_root, exist_ok=True)
+        for root in {self.run_root, run_root}:
+            for entry in os.listdir(root):
+                self.discard(os.path.join(root, entry))
+
+    # Remove a home directory, or a file left in the run directory, in the background. It is
+    # renamed first so its name can be reused immediately.
+    def discard(self, home):
+        trash = f"{home}.{time.monotonic_ns()}.trash"
+        try:
+            os.rename(home, trash)
+        except OSError:
+            trash = home
+        self.worker.submit(remove, trash)
+
+    # Start the next run in its own home directory, cycling through the configs.
+    def start_run(self):
+        config = self.configs[self.run_id % len(self.configs)]
+        home = os.path.join(self.run_root, f"RUNDIR.{self.run_id}")
+        self.run_id += 1
+        shutil.rmtree(home, ignore_errors=True)
+        os.makedirs(home)
+
+        # Allow the run to dump core so crashes can be bucketed by their stack.
+        def set_core_limit():
+            resource.setrlimit(resource.RLIMIT_CORE, (resource.RLIM_INFINITY, resource.RLIM_INFINITY))
+
+        log = open(os.path.join(home, "format.log"), "w")
+        process = subprocess.Popen([self.binary, "-c", config, "-h", home], cwd=home,
+                                   stdout=log, stderr=subprocess.STDOUT, preexec_fn=set_core_limit)
+        log.close()
+        self.running[process] = (config, home)
+
+    # Process a completed run: bucket the failure, or remove the home directory on success.
+    def finish_run(self, process, config, home):
+        self.stats["runs"] += 1
+        if process.returncode == 0:
+            self.discard(home)
+            return
+
+        self.stats["failures"] += 1
+        signature, description = get_signature(self.binary, home, os.path.join(home, "format.log"))
+        bucket = self.stats["buckets"].setdefault(signature, {
+            "count": 0, "description": description, "config": config, "first_seen": time.time()})
+        bucket["count"] += 1
+        print(f"Run in '{home}' failed with exit status {process.returncode}: [{signature}] "
+              f"{description} ({bucket['count']} occurrence(s)).", flush=True)
+
+        # Keep the first failure of each bucket, the other failures are duplicates. The home
+        # directory is moved to persistent storage in the background.
+        bucket_dir = os.path.join(self.bucket_root, signature)
+        if bucket["count"] == 1:
+            os.makedirs(bucket_dir, exist_ok=True)
+            save_reproducer(home, read_config(config), bucket_dir)
+            self.worker.submit(shutil.move, home, os.path.join(bucket_dir, "home"))
+        else:
+            self.discard(home)
+
+    def runs_per_hour(self):
+        hours = (time.time() - self.stats["started"]) / 3600
+        return self.stats["runs"] / hours if hours > 0 else 0.0
+
+    def save_stats(self):
+        self.stats["runs_per_hour"] = self.runs_per_hour()
+        os.makedirs(self.bucket_root, exist_ok=True)
+        with open(self.stats_file + ".tmp", "w") as f:
+            json.dump(self.stats, f, indent=1)
+        os.replace(self.stats_file + ".tmp", self.stats_file)
+
+    # Keep all job slots busy until 'max_runs' runs have completed, or forever if zero.
+    def run(self, max_runs=0):
+        last_report = time.monotonic()
+        while True:
+            while len(self.running) < self.jobs and (not max_runs or self.run_id < max_runs):
+                # Wait for the background cleanup if the run root is short of space.
+                if get_disk_capacity(self.run_root)[1] < home_reserve and self.worker.pending():
+                    break
+                self.start_run()
+            if not self.running:
+                break
+
+            time.sleep(1)
+            for process, (config, home) in list(self.running.items()):
+                if process.poll() is not None:
+                    del self.running[process]
+                    self.finish_run(process, config, home)
+                    self.save_stats()
+
+            if time.monotonic() - last_report > report_interval:
+                last_report = time.monotonic()
+                print(f"{self.stats['runs']} runs, {self.stats['failures']} failures in "
+                      f"{len(self.stats['buckets'])} buckets, {self.runs_per_hour():.1f} runs/hour.",
+                      flush=True)
+                publish_metric("format_runs_per_hour", self.runs_per_hour())
+        self.save_stats()
+        self.worker.wait()
+
+# Run a format campaign. 'configs' is a comma-separated list of CONFIG files, run in turn.
+# The runs are started in 'run_root', and failures are saved under 'failure_dir'/format.
+def campaign(configs, run_root, failure_dir, wt_build_dir, jobs="0", max_runs="0"):
+    configs = [os.path.abspath(c) for c in configs.split(",")]
+    for config in configs:
+        read_config(config)
+    jobs = int(jobs) or os.cpu_count()
+    print(f"Starting a format campaign of {len(configs)} config(s) with {jobs} job(s) in "
+          f"'{run_root}'.", flush=True)
+    Campaign(configs, run_root, failure_dir, wt_build_dir, jobs).run(int(max_runs))
+
+# Print the statistics of the campaign whose failures are saved under 'failure_dir'/format.
+def report(failure_dir):
+    with open(os.path.join(failure_dir, "format", "campaign.json")) as f:
+        stats = json.load(f)
+    hours = (time.time() - stats["started"]) / 3600
+    print(f"Campaign running for {hours:.1f} hours: {stats['runs']} runs "
+          f"({stats.get('runs_per_hour', 0):.1f} runs/hour), {stats['failures']} failures in "
+          f"{len(stats['buckets'])} buckets.")
+    for signature, bucket in sorted(stats["buckets"].items(), key=lambda b: -b[1]["count"]):
+        print(f"  [{signature}] {bucket['count']:>5} x  {os.path.basename(bucket['config'])}: "
+              f"{bucket['description']}")
+
+# This allows us to call script functions by name from the command line with an
+# arbitrary number of parameters. Example usage is:
+#
+#   $ python3 testy_format.py campaign 'CONFIG.a,CONFIG.b' '/srv/testy/data' \
+#         '/srv/testy/failures' '/srv/testy/wiredtiger/build'
+#   $ python3 testy_format.py report '/srv/testy/failures'
+#
+if __name__ == "__main__":
+
+    globals()[sys.argv[1]](*sys.argv[2:])
@@ -0,0 +1,173 @@
+import configparser as cp
+import glob, json, os, shutil, subprocess, sys, threading, time
+from testy_resources import get_directory_size, get_disk_capacity
+
+# Keep a running workload's database within the space actually available on its volume. The
+# create and drop triggers of a workgen workload are computed once from a target size, but
+# snapshots, failure files and statistics logs share the volume and can fill it. The governor
+# runs in the workload process: it periodically measures the database directory and the free
+# space, and lowers the workload's size targets when they no longer leave the safety reserve
+# free, restoring them when space comes back. Workloads running alongside each other share the
+# free space above the reserve equally.
+
+# The governor settings used when the testy configuration file has no 'governor' section or
+# is missing some of its options.
+default_settings = {
+    "interval": 30,
+    "reserve_percent": 10.0,
+    "stats_log_keep": 48,
+    "monitor_max_mb": 64,
+}
+
+# Return the file holding the latest state of the governor of a workload, for other tools
+# running on the testy server.
+def get_state_file(workload):
+    return f"/tmp/testy_governor-{workload}.json"
+
+# Return the number of workloads running on the testy server whose database is on the volume
+# of the given database directory, at least one. The workloads on other volumes do not share
+# its free space.
+def count_workloads(database_dir):
+
+    result = subprocess.run(["systemctl", "list-units", "--state=active", "--no-legend",
+                             "--plain", "testy-run@*.service"], capture_output=True, text=True)
+    device = os.stat(database_dir).st_dev
+    count = 0
+    for line in result.stdout.splitlines():
+        env = subprocess.run(["systemctl", "show", "--property", "Environment", "--value",
+                              line.split()[0]], capture_output=True, text=True).stdout.split()
+        dirs = [value.split("=", 1)[1] for value in env if value.startswith("database_dir=")]
+        try:
+            shared = not dirs or os.stat(dirs[-1]).st_dev == device
+        except OSError:
+            shared = True
+        count += 1 if shared else 0
+    return max(count, 1)
+
+# The workgen options holding the database size targets, in MB.
+size_options = ["create_trigger", "create_target", "drop_trigger", "drop_target"]
+
+# Return the governor settings from the 'governor' section of the testy configuration file.
+def get_settings(config):
+
+    parser = cp.ConfigParser(interpolation=cp.ExtendedInterpolation())
+    parser.read(config)
+
+    settings = dict(default_settings)
+    if parser.has_section("governor"):
+        section = parser["governor"]
+        for key, value in default_settings.items():
+            settings[key] = type(value)(section.get(key, value))
+    return settings
+
+# Return the size targets in MB that keep the reserve free on the volume. The database may
+# grow by its share of the free space above the reserve, so its drop trigger is capped at its
+# current size plus that space, and the other targets are scaled down in proportion.
+def get_limits(base, disk_total, disk_free, database_size, reserve_percent, workloads=1):
+
+    reserve = disk_total * reserve_percent / 100
+    max_size_mb = max(int((database_size + (disk_free - reserve) / workloads) / 1024 ** 2), 0)
+    scale = min(max_size_mb / base["drop_trigger"], 1) if base["drop_trigger"] > 0 else 1
+    return {option: int(base[option] * scale) for option in size_options}
+
+# Remove the oldest WiredTiger statistics logs in the database directory, keeping the 'keep'
+# most recent ones. WiredTiger only writes to the most recent log.
+def prune_statistics_logs(database_dir, keep):
+
+    logs = sorted(glob.glob(os.path.join(database_dir, "WiredTigerStat.*")),
+                  key=os.path.getmtime)
+    removed = 0
+    for log in logs[:-keep] if keep > 0 else []:
+        try:
+            removed += os.path.getsize(log)
+            os.remove(log)
+        except OSError:
+            pass
+    return removed
+
+# Rotate the workgen monitor file of the database directory once it is larger than the maximum
+# size: copy it to 'monitor.json.1', replacing the previous copy, and truncate it. Workgen
+# appends a sample to the file every sample interval and keeps it open, so it goes on writing
+# at the start of the truncated file. Return the number of bytes removed.
+def rotate_monitor(database_dir, max_mb):
+
+    monitor = os.path.join(database_dir, "monitor.json")
+    try:
+        size = os.path.getsize(monitor)
+        if max_mb <= 0 or size <= max_mb * 1024 ** 2:
+            return 0
+        shutil.copyfile(monitor, monitor + ".1")
+        os.truncate(monitor, 0)
+    except OSError:
+        return 0
+    return size
+
+class Governor(threading.Thread):
+    def __init__(self, workload, database_dir, settings=None):
+        super().__init__(daemon=True)
+        self.options = workload.options
+        self.database_dir = database_dir
+        self.settings = settings or get_settings(os.environ.get("testy_config", ""))
+        self.base = {option: getattr(self.options, option) for option in size_options}
+        self.state_file = get_state_file(os.environ.get("testy_workload", "workload"))
+        self.stopping = threading.Event()
+
+    # Measure the database and the volume, and apply the size targets to the workload.
+    def update(self):
+        prune_statistics_logs(self.database_dir, self.settings["stats_log_keep"])
+        rotate_monitor(self.database_dir, self.settings["monitor_max_mb"])
+        database_size = get_directory_size(self.database_dir)
+        disk_total, disk_free = get_disk_capacity(self.database_dir)
+        limits = get_limits(self.base, disk_total, disk_free, database_size,
+                            self.settings["reserve_percent"],
+                            count_workloads(self.database_dir))
+
+        if any(getattr(self.options, option) != limits[option] for option in size_options):
+            throttled = limits != self.base
+            print(f"Governor: {'Lowering' if throttled else 'Restoring'} the database size "
+                  f"targets to {limits} (database {database_size / 1024 ** 3:.1f}GB, "
+                  f"free {disk_free / 1024 ** 3:.1f}GB).", flush=True)
+            for option in size_options:
+                setattr(self.options, option, limits[option])
+
+        with open(self.state_file + ".tmp", "w") as f:
+            json.dump({"time": time.time(), "database_size": database_size,
+                       "disk_total": disk_total, "disk_free": disk_free,
+                       "base": self.base, "limits": limits}, f)
+        os.replace(self.state_file + ".tmp", self.state_file)
+
+    # Apply the size targets once before the workload starts, then keep updating them.
+    def start(self):
+        self.update()
+        super().start()
+
+    def run(self):
+        while not self.stopping.wait(self.settings["interval"]):
+            try:
+                self.update()
+            except OSError as e:
+                print(f"Governor: Error: {e}", flush=True)
+
+    def stop(self):
+        self.stopping.set()
+
+# Print the latest state of the governor of a workload.
+def show(workload):
+
+    with open(get_state_file(workload)) as f:
+        state = json.load(f)
+    print(f"Updated {time.time() - state['time']:.0f}s ago: database "
+          f"{state['database_size'] / 1024 ** 3:.1f}GB, free "
+          f"{state['disk_free'] / 1024 ** 3:.1f}GB of {state['disk_total'] / 1024 ** 3:.1f}GB.")
+    for option in size_options:
+        print(f"  {option:<16} {state['limits'][option]:>10} MB "
+              f"(configured {state['base'][option]} MB)")
+
+# This allows us to call script functions by name from the command line with an
+# arbitrary number of parameters. Example usage is:
+#
+#   $ python3 testy_governor.py show 'sample'
+#
+if __name__ == "__main__":
+
+    globals()[sys.argv[1]](*sys.argv[2:])
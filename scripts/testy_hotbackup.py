@@ -0,0 +1,351 @@
+import configparser as cp
+import glob, json, os, shutil, subprocess, sys, threading, time, uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Stream the database files of a running workload into a backup directory with the backup
+# cursor of WiredTiger, instead of snapshotting the whole root volume. A backup cursor can only
+# be opened on the connection of the workload, so the copy runs in a thread of the workload
+# process, like the governor, and starts when a backup is requested. The first backup copies
+# every file. The later backups are incremental: the backup cursor returns the blocks changed
+# since the previous backup, and only those are copied into the copy of the database kept in
+# the backup directory. The copy runs on several threads at the lowest CPU and best-effort I/O
+# priorities, and is rate-limited so the workload keeps most of the bandwidth of the volume.
+#
+# The backup service requests the backup, waits for the copy, and runs the validation of the
+# workload against a copy of it made with reflinks where the file system supports them, so the
+# validation never modifies the copy the next incremental backup builds on. Without reflinks,
+# e.g. on ext4, that copy reads and writes the whole database, so the validation can instead run
+# on the backup itself, which is then discarded and the next backup is a full one.
+
+# The hot backup settings used when the testy configuration file has no 'hotbackup' section
+# or is missing some of its options. A full backup is taken every 'full_interval' backups.
+# With 'validate_copy' off, the validation runs on the backup and every backup is a full one.
+default_settings = {
+    "backup_dir": "/srv/testy/hotbackup",
+    "threads": 4,
+    "rate_mb": 200,
+    "granularity_mb": 16,
+    "full_interval": 7,
+    "poll_interval": 5,
+    "timeout": 36000,
+    "validate_copy": True,
+}
+
+# The size of the reads and writes of the copy.
+chunk_size = 1024 * 1024
+
+# Return the hot backup settings from the 'hotbackup' section of the testy configuration file.
+def get_settings(config):
+
+    parser = cp.ConfigParser(interpolation=cp.ExtendedInterpolation())
+    parser.read(config)
+
+    settings = dict(default_settings)
+    if parser.has_section("hotbackup"):
+        section = parser["hotbackup"]
+        for key, value in default_settings.items():
+            if isinstance(value, bool):
+                settings[key] = section.getboolean(key, value)
+            else:
+                settings[key] = type(value)(section.get(key, value))
+    return settings
+
+# Return the directory of the backups of a workload, holding the copy of its database, the
+# requests and the state of the latest backup.
+def get_workload_dir(settings, workload):
+    return os.path.join(settings["backup_dir"], workload)
+
+def read_json(path):
+
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_json(path, value):
+
+    with open(path + ".tmp", "w") as f:
+        json.dump(value, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+# Limit the rate of the copy across all the copy threads.
+class RateLimiter:
+    def __init__(self, rate_mb):
+        self.rate = rate_mb * 1024 * 1024
+        self.lock = threading.Lock()
+        self.next_time = time.monotonic()
+
+    def acquire(self, size):
+        if self.rate <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_time - now
+            self.next_time = max(now, self.next_time) + size / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+# Lower the CPU and I/O priorities of the calling thread to the given ionice class and level,
+# to leave the cores and the disk to the workload.
+def lower_priority(io_class, io_level=None):
+
+    thread_id = threading.get_native_id()
+    os.setpriority(os.PRIO_PROCESS, thread_id, 19)
+    level = ["-n", str(io_level)] if io_level is not None else []
+    subprocess.run(["ionice", "-c", str(io_class), *level, "-p", str(thread_id)],
+                   capture_output=True)
+
+class BackupStopped(Exception):
+    pass
+
+# Copy a range of a file into the same range of the destination file, or the whole file if the
+# size is None. The copy ends when the workload stops.
+def copy_range(source, dest, offset, size, limiter, stopping):
+
+    # The ranges of a file are copied concurrently, the destination is never truncated on open.
+    copied = 0
+    fd = os.open(dest, os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        with open(source, "rb") as src:
+            if size is None:
+                size = os.fstat(src.fileno()).st_size
+                os.ftruncate(fd, size)
+            while copied < size:
+                if stopping.is_set():
+                    raise BackupStopped("The workload stopped during the backup.")
+                length = min(chunk_size, size - copied)
+                limiter.acquire(length)
+                data = os.pread(src.fileno(), length, offset + copied)
+                if not data:
+                    break
+                os.pwrite(fd, data, offset + copied)
+                copied += len(data)
+    finally:
+        os.close(fd)
+    return copied
+
+class HotBackup(threading.Thread):
+    def __init__(self, connection, database_dir, settings=None):
+        super().__init__(daemon=True)
+        self.connection = connection
+        self.database_dir = database_dir
+        self.settings = settings or get_settings(os.environ.get("testy_config", ""))
+        self.workload_dir = get_workload_dir(self.settings,
+                                             os.environ.get("testy_workload", "workload"))
+        self.copy_dir = os.path.join(self.workload_dir, "copy")
+        self.stopping = threading.Event()
+
+    def run(self):
+        # The lowest best-effort I/O priority: the idle I/O class of the checker would starve
+        # the copy under a busy workload.
+        lower_priority(2, 7)
+        while not self.stopping.wait(self.settings["poll_interval"]):
+            request = read_json(os.path.join(self.workload_dir, "request.json"))
+            state = read_json(os.path.join(self.workload_dir, "state.json")) or {}
+            if not request or request["id"] == state.get("request_id"):
+                continue
+            try:
+                state = self.backup(request, state)
+            except Exception as e:
+                # The copy may be partly updated, the next backup is a full one.
+                print(f"Hot backup: Error: {e}", flush=True)
+                state = {"request_id": request["id"], "result": "failed", "error": str(e)}
+            write_json(os.path.join(self.workload_dir, "state.json"), state)
+
+    # Copy the files listed by the backup cursor, or only their changed blocks for an
+    # incremental backup, and return the new state of the backups.
+    def backup(self, request, state):
+
+        backup_id = f"testy{int(time.time())}"
+        incremental = state.get("backup_id") and request.get("mode") != "full" and \
+                      state.get("incrementals", 0) + 1 < self.settings["full_interval"] and \
+                      os.path.isdir(self.copy_dir)
+        session = self.connection.open_session()
+        try:
+            return self.copy(session, request, state, backup_id, incremental)
+        finally:
+            # Closing the session closes the backup cursors, also when the copy fails.
+            session.close()
+
+    # Copy the files, or their changed blocks, with the backup cursor of the session.
+    def copy(self, session, request, state, backup_id, incremental):
+        import wiredtiger
+
+        cursor = None
+        if incremental:
+            try:
+                cursor = session.open_cursor("backup:", None, f"incremental=(src_id=\""
+                                             f"{state['backup_id']}\",this_id=\"{backup_id}\")")
+            except wiredtiger.WiredTigerError as e:
+                print(f"Hot backup: Taking a full backup, the incremental one failed: {e}",
+                      flush=True)
+                incremental = False
+        if not incremental:
+            shutil.rmtree(self.copy_dir, ignore_errors=True)
+            cursor = session.open_cursor("backup:", None, "incremental=(enabled=true,"
+                                         f"granularity={self.settings['granularity_mb']}MB,"
+                                         f"this_id=\"{backup_id}\")")
+        os.makedirs(self.copy_dir, exist_ok=True)
+
+        start = time.time()
+        print(f"Hot backup: Starting {'an incremental' if incremental else 'a full'} backup "
+              f"'{backup_id}'.", flush=True)
+        limiter = RateLimiter(self.settings["rate_mb"])
+        jobs, names, sizes = [], [], {}
+        while cursor.next() == 0:
+            name = cursor.get_key()
+            names.append(name)
+            source = os.path.join(self.database_dir, name)
+            dest = os.path.join(self.copy_dir, name)
+            if not incremental:
+                jobs.append((source, dest, 0, None))
+                continue
+            # The duplicate cursor returns the ranges of the file changed since the previous
+            # backup, or asks for the whole file, e.g. for a new file or a log file.
+            file_cursor = session.open_cursor(None, cursor, f"incremental=(file={name})")
+            sizes[dest] = os.path.getsize(source)
+            while file_cursor.next() == 0:
+                offset, size, kind = file_cursor.get_keys()
+                if kind == wiredtiger.WT_BACKUP_FILE:
+                    jobs.append((source, dest, 0, None))
+                    del sizes[dest]
+                    break
+                jobs.append((source, dest, offset, size))
+            file_cursor.close()
+
+        with ThreadPoolExecutor(max(self.settings["threads"], 1), initializer=lower_priority,
+                                initargs=(2, 7)) as executor:
+            copied = sum(executor.map(lambda job: copy_range(*job, limiter, self.stopping),
+                                      jobs))
+        cursor.close()
+
+        # The files copied by ranges take the size they had when listed, e.g. smaller after a
+        # compaction.
+        for dest, size in sizes.items():
+            if os.path.exists(dest):
+                os.truncate(dest, size)
+
+        # The files the backup cursor no longer lists were dropped from the database.
+        for path in glob.glob(os.path.join(self.copy_dir, "*")):
+            if os.path.basename(path) not in names:
+                os.remove(path)
+
+        duration = time.time() - start
+        print(f"Hot backup: Copied {copied / 1024 ** 2:.0f}MB of {len(names)} files in "
+              f"{duration:.0f}s.", flush=True)
+        return {"request_id": request["id"], "result": "success", "backup_id": backup_id,
+                "mode": "incremental" if incremental else "full", "time": time.time(),
+                "incrementals": state.get("incrementals", 0) + 1 if incremental else 0,
+                "files": len(names), "bytes": copied, "duration": duration}
+
+    def stop(self):
+        self.stopping.set()
+
+# Request a backup from the workload process and wait for it. Returns the state of the backup,
+# or None if the workload did not complete it in time.
+def request(settings, workload, mode="auto"):
+
+    workload_dir = get_workload_dir(settings, workload)
+    os.makedirs(workload_dir, exist_ok=True)
+    request_id = uuid.uuid4().hex[:16]
+    write_json(os.path.join(workload_dir, "request.json"), {"id": request_id, "mode": mode})
+
+    start = time.time()
+    while time.time() - start < settings["timeout"]:
+        state = read_json(os.path.join(workload_dir, "state.json"))
+        if state and state.get("request_id") == request_id:
+            return state
+        time.sleep(settings["poll_interval"])
+    return None
+
+def emit_event(config, service, event, *fields):
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    subprocess.run(["python3", os.path.join(script_dir, "testy_events.py"), "emit", config,
+                    service, event, *fields])
+
+# Take a hot backup of the workload and validate it, for the backup service. The validation
+# runs on a copy of the backup laid out like the root volume, so the validate function of the
+# workload finds the database under the given root. With 'validate_copy' off, the backup itself
+# is moved under the root instead, and the next backup is a full one as there is no copy left
+# to build on. A copy that fails validation is kept, with the failure file renamed after the
+# backup.
+def run(config, workload, service="testy-backup", mode="auto"):
+
+    settings = get_settings(config)
+    parser = cp.ConfigParser(interpolation=cp.ExtendedInterpolation())
+    parser.read(config)
+    database_dir = os.environ.get("database_dir") or parser.get("application", "database_dir")
+    workload_file = os.path.join(os.environ.get("workload_dir") or
+                                 parser.get("application", "workload_dir"), workload,
+                                 f"{workload}.sh")
+    failure_dir = os.environ.get("failure_dir") or parser.get("application", "failure_dir")
+    failure_file = os.environ.get("failure_file") or parser.get("application", "failure_file")
+
+    emit_event(config, service, "backup_started", f"workload={workload}", "mode=stream")
+    state = request(settings, workload, mode)
+    if not state or state["result"] != "success":
+        error = state.get("error") if state else "the workload did not complete the backup"
+        print(f"Error: The hot backup of workload '{workload}' failed: {error}")
+        emit_event(config, service, "backup_copied", f"workload={workload}", "result=failed")
+        return False
+    print(f"Copied {state['mode']} backup '{state['backup_id']}': {state['files']} files, "
+          f"{state['bytes'] / 1024 ** 2:.0f}MB in {state['duration']:.0f}s.")
+    emit_event(config, service, "backup_copied", f"workload={workload}", "result=success",
+               f"backup_id={state['backup_id']}", f"backup_mode={state['mode']}",
+               f"bytes={state['bytes']}", f"duration={state['duration']:.0f}")
+
+    workload_dir = get_workload_dir(settings, workload)
+    root = os.path.join(workload_dir, "validate")
+    shutil.rmtree(root, ignore_errors=True)
+    os.makedirs(os.path.dirname(root + database_dir), exist_ok=True)
+    if settings["validate_copy"]:
+        subprocess.run(["cp", "-a", "--reflink=auto", os.path.join(workload_dir, "copy"),
+                        root + database_dir], check=True)
+    else:
+        os.rename(os.path.join(workload_dir, "copy"), root + database_dir)
+
+    start = time.time()
+    if subprocess.run(["bash", workload_file, "validate", root]).returncode == 0:
+        print(f"Successfully validated backup '{state['backup_id']}'.")
+        emit_event(config, service, "validation", f"workload={workload}",
+                   f"backup_id={state['backup_id']}", "result=success",
+                   f"duration={time.time() - start:.0f}")
+        shutil.rmtree(root, ignore_errors=True)
+        return True
+
+    kept = f"{state['backup_id']}.txt"
+    subprocess.run(["sudo", "mv", "-v", os.path.join(failure_dir, failure_file),
+                    os.path.join(failure_dir, kept)])
+    print(f"Validation failed for backup '{state['backup_id']}', logs saved to "
+          f"{os.path.join(failure_dir, kept)}, database kept in '{root}'.")
+    emit_event(config, service, "validation", f"workload={workload}",
+               f"backup_id={state['backup_id']}", "result=failed",
+               f"duration={time.time() - start:.0f}", f"failure_file={kept}")
+    return True
+
+# Print the state of the latest hot backup of each workload.
+def show(config):
+
+    settings = get_settings(config)
+    for path in sorted(glob.glob(os.path.join(settings["backup_dir"], "*", "state.json"))):
+        state = read_json(path) or {}
+        workload = os.path.basename(os.path.dirname(path))
+        if state.get("result") != "success":
+            print(f"{workload}: failed: {state.get('error')}")
+            continue
+        print(f"{workload}: {state['mode']} backup '{state['backup_id']}' "
+              f"{time.time() - state['time']:.0f}s ago, {state['files']} files, "
+              f"{state['bytes'] / 1024 ** 2:.0f}MB copied in {state['duration']:.0f}s")
+
+# This allows us to call script functions by name from the command line with an
+# arbitrary number of parameters. Example usage is:
+#
+#   $ python3 testy_hotbackup.py run '/srv/testy/.testy' 'sample' 'testy-backup' 'full'
+#   $ python3 testy_hotbackup.py show '/srv/testy/.testy'
+#
+if __name__ == "__main__":
+
+    result = globals()[sys.argv[1]](*sys.argv[2:])
+    sys.exit(0 if result is not False else 1)
@@ -13,6 +13,20 @@ def get_hostname_for_instance(instance_id):
     hostname = result.stdout.strip()
     return hostname
 
+# Return the ID of the most recent baked testy image for the given distro, or an empty
+# string if no image has been baked for it.
+def get_baked_image_id(distro):
+    result = local(f"aws ec2 describe-images \
+        --owners self \
+        --filters 'Name=tag:Application,Values=testy' 'Name=tag:Distro,Values={distro}' \
+            'Name=state,Values=available' \
+        --query 'sort_by(Images, &CreationDate)[-1].ImageId' \
+        --output text", hide=True, warn=True)
+    if result.stderr:
+        raise Exit(result.stderr)
+    image_id = result.stdout.strip()
+    return "" if image_id == "None" else image_id
+
 def get_image_id(image_name):
     result = local(f"aws ec2 describe-images \
         --filters \"Name=name,Values={image_name}\" \
@@ -46,6 +60,7 @@ def get_launch_templates():
 # Get all the available snapshots and return the result as a list.
 def get_snapshots():
     result = local("aws ec2 describe-snapshots \
+        --owner-ids self \
         --filters 'Name=tag:Application,Values=testy' \
         --query 'Snapshots[*].{ID:SnapshotId,Validation:Tags[?Key==`Validation`]|[0].Value}' \
         --output yaml", hide=True, warn=True)
@@ -129,6 +144,29 @@ def register_image_from_snapshot(image_name, architecture, snapshot_id):
     image_id = result.stdout.strip()
     return image_id
 
+# Create an image from the given instance, tag it as a baked testy image for the given
+# distro and wait for it to become available. Returns the image ID.
+def create_image_from_instance(instance_id, image_name, distro, wiredtiger_commit):
+    tags = f"{{Key=Application,Value=testy}},{{Key=Distro,Value={distro}}}," \
+           f"{{Key=WiredTigerCommit,Value={wiredtiger_commit}}}"
+    result = local(f"aws ec2 create-image \
+        --instance-id {instance_id} \
+        --name {image_name} \
+        --description 'testy baked image for {distro}' \
+        --tag-specifications 'ResourceType=image,Tags=[{tags}]' \
+        --query ImageId \
+        --output text", hide=True, warn=True)
+    if result.stderr:
+        raise Exit(result.stderr)
+    image_id = result.stdout.strip()
+
+    print(f"Waiting for image '{image_id}' to become available. This may take several "
+          f"minutes ...", flush=True)
+    result = local(f"aws ec2 wait image-available --image-ids {image_id}", hide=True, warn=True)
+    if result.stderr:
+        raise Exit(result.stderr)
+    return image_id
+
 def snapshot_exists(snapshot_id):
     result = local(f"aws ec2 describe-snapshots \
         --snapshot-ids {snapshot_id} \
@@ -139,6 +177,69 @@ def snapshot_exists(snapshot_id):
         raise Exit(result.stderr)
     return True if result.stdout.strip() else False
 
+# Return the availability zone used by the default version of the given launch template.
+# If the template does not set one, the zone of its subnet is used, or the first zone of
+# the region if it has no subnet either.
+def get_launch_template_availability_zone(ltname):
+    result = local(f"aws ec2 describe-launch-template-versions \
+        --launch-template-name {ltname} \
+        --versions '$Default' \
+        --query 'LaunchTemplateVersions[0].LaunchTemplateData.[Placement.AvailabilityZone, \
+NetworkInterfaces[0].SubnetId]' \
+        --output text", hide=True, warn=True)
+    if result.stderr:
+        raise Exit(result.stderr)
+    zone, subnet = result.stdout.split()
+    if zone != "None":
+        return zone
+
+    if subnet != "None":
+        command = f"aws ec2 describe-subnets --subnet-ids {subnet} \
+            --query 'Subnets[0].AvailabilityZone' --output text"
+    else:
+        command = "aws ec2 describe-availability-zones \
+            --query 'AvailabilityZones[0].ZoneName' --output text"
+    result = local(command, hide=True, warn=True)
+    if result.stderr:
+        raise Exit(result.stderr)
+    return result.stdout.strip()
+
+# Enable fast snapshot restore for the snapshot in the given availability zone and wait
+# until volumes created from it are fully initialized at creation.
+def enable_fast_snapshot_restore(snapshot_id, availability_zone, timeout=7200):
+    result = local(f"aws ec2 enable-fast-snapshot-restores \
+        --availability-zones {availability_zone} \
+        --source-snapshot-ids {snapshot_id}", hide=True, warn=True)
+    if result.stderr:
+        raise Exit(result.stderr)
+
+    sleep_time = 30
+    for _ in range(0, timeout, sleep_time):
+        result = local(f"aws ec2 describe-fast-snapshot-restores \
+            --filters Name=snapshot-id,Values={snapshot_id} \
+                      Name=availability-zone,Values={availability_zone} \
+            --query 'FastSnapshotRestores[0].State' \
+            --output text", hide=True, warn=True)
+        if result.stderr:
+            raise Exit(result.stderr)
+        state = result.stdout.strip()
+        print("", end=f"\rFast snapshot restore for '{snapshot_id}' is {state} ...   ", flush=True)
+        if state == "enabled":
+            print("", flush=True)
+            return
+        time.sleep(sleep_time)
+
+    raise Exit(f"Fast snapshot restore for '{snapshot_id}' was not enabled after {timeout} seconds.")
+
+# Disable fast snapshot restore for the snapshot in the given availability zone. Fast
+# snapshot restore is billed for as long as it is enabled.
+def disable_fast_snapshot_restore(snapshot_id, availability_zone):
+    result = local(f"aws ec2 disable-fast-snapshot-restores \
+        --availability-zones {availability_zone} \
+        --source-snapshot-ids {snapshot_id}", hide=True, warn=True)
+    if result.stderr:
+        print(f"Error disabling fast snapshot restore for '{snapshot_id}': {result.stderr}")
+
 def wait_on_status_check(instance_id):
     max_retries = 60
     sleep_time = 10
@@ -207,8 +308,9 @@ def attach_iam_profile(instance_id, iam_profile):
 # instance via ssh and identify the instance on the AWS console. On failure, the dictionary
 # contains a user-friendly error message.
 
-# Launch an AWS instance given a distro.
-def launch_from_distro(distro, instance_name, iam_profile):
+# Launch an AWS instance given a distro. If an image ID is given, the instance is launched
+# from that image (e.g. a baked testy image) instead of the launch template's default image.
+def launch_from_distro(distro, instance_name, iam_profile, image_id=None):
 
     if not launch_template_exists(distro):
         return {"status": 1, "msg": f"The distro '{distro}' does not exist."}
@@ -216,11 +318,12 @@ def launch_from_distro(distro, instance_name, iam_profile):
     print("", end=f"\rCreating a {distro} testy server in EC2 ... ", flush=True)
     hostname = None
     user = None
+    image_option = f"--image-id {image_id}" if image_id else ""
 
     try:
         # Launch an EC2 instance based on a template.
         result = local(f"aws ec2 run-instances \
-            --launch-template LaunchTemplateName={distro} \
+            --launch-template LaunchTemplateName={distro} {image_option} \
             --query Instances[*].InstanceId \
             --output text", hide=True, warn=True)
         if result.stderr:
@@ -251,8 +354,10 @@ def launch_from_distro(distro, instance_name, iam_profile):
     return {"status": 0, "user": user, "hostname": hostname,
         "instance_id": instance_id, "instance_name": instance_name}
 
-# Launch an AWS instance from a snapshot ID.
-def launch_from_snapshot(snapshot_id, instance_name):
+# Launch an AWS instance from a snapshot ID. If fast_restore is set, fast snapshot restore
+# is enabled for the snapshot before the launch so the root volume is created fully
+# initialized, and disabled once the instance is running.
+def launch_from_snapshot(snapshot_id, instance_name, fast_restore=False):
 
     if not snapshot_exists(snapshot_id):
         return {"status": 1, "msg": f"The snapshot '{snapshot_id}' does not exist."}
@@ -260,6 +365,7 @@ def launch_from_snapshot(snapshot_id, instance_name):
     print("", end=f"\rCreating a testy server from snapshot '{snapshot_id}' ... ", flush=True)
     hostname = None
     user = None
+    fast_restore_zone = None
 
     try:
         snapshot_status = get_snapshot_status(snapshot_id)
@@ -276,9 +382,17 @@ def launch_from_snapshot(snapshot_id, instance_name):
 
         # Launch an EC2 instance based on a template and an image ID.
         ltname = get_tag_value_from_resource(snapshot_id, "LaunchTemplateName")
+        placement = ""
+        if fast_restore:
+            availability_zone = get_launch_template_availability_zone(ltname)
+            print("", flush=True)
+            # Fast snapshot restore is disabled on failure also when enabling it times out.
+            fast_restore_zone = availability_zone
+            enable_fast_snapshot_restore(snapshot_id, availability_zone)
+            placement = f"--placement AvailabilityZone={availability_zone}"
         result = local(f"aws ec2 run-instances \
             --launch-template LaunchTemplateName={ltname} \
-            --image-id {image_id} \
+            --image-id {image_id} {placement} \
             --query Instances[*].InstanceId \
             --output text", hide=True, warn=True)
         if result.stderr:
@@ -295,6 +409,11 @@ def launch_from_snapshot(snapshot_id, instance_name):
 
         wait_on_status_check(instance_id)
 
+        # The root volume has been created, fast snapshot restore is no longer needed.
+        if fast_restore_zone:
+            disable_fast_snapshot_restore(snapshot_id, fast_restore_zone)
+            fast_restore_zone = None
+
         # Add 'Name' tags for the new instance and volume.
         volume_id = get_volume_id_from_instance(instance_id)
         if not instance_name:
@@ -306,6 +425,8 @@ def launch_from_snapshot(snapshot_id, instance_name):
         user = get_tag_value_from_resource(instance_id, "User")
 
     except Exception as e:
+        if fast_restore_zone:
+            disable_fast_snapshot_restore(snapshot_id, fast_restore_zone)
         return {"status": 1, "msg": str(e).strip()}
 
     return {"status": 0, "user": user, "hostname": hostname,
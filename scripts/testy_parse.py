@@ -15,9 +15,23 @@ def get_value(config, section, key):
 
     print(parser.get(section, key), end='', flush=True)
 
+# Return the key/value pairs of the specified section of the testy configuration file. If a
+# workload is specified, the values of its 'workload.<name>' section override the values of
+# the keys the section has in common with it, e.g. the database directory of a workload that
+# runs alongside other workloads.
+def get_items(parser, section, workload=None):
+
+    items = dict(parser.items(section))
+    workload_section = f"workload.{workload}"
+    if workload and parser.has_section(workload_section):
+        for k, v in parser.items(workload_section):
+            if k in items:
+                items[k] = v
+    return items
+
 # Return the key/value pairs in the specified section of the testy configuration file
 # as a single string of shell environment values.
-def get_env(config, section):
+def get_env(config, section, workload=None):
 
     parser = cp.ConfigParser(interpolation=cp.ExtendedInterpolation())
     parser.read(config)
@@ -26,13 +40,13 @@ def get_env(config, section):
         raise ValueError(f"No '{section}' section in file '{config}'.")
 
     env = ""
-    for k, v in parser.items(section):
+    for k, v in get_items(parser, section, workload).items():
         env += k + "=" + v + " "
     print(env, end='', flush=True)
 
 # Return a string suitable for generating a drop-in .conf file of environment
 # values for the testy systemd services.
-def get_systemd_service_conf(config, section):
+def get_systemd_service_conf(config, section, workload=None):
 
     parser = cp.ConfigParser(interpolation=cp.ExtendedInterpolation())
     parser.read(config)
@@ -41,7 +55,7 @@ def get_systemd_service_conf(config, section):
         raise ValueError(f"No '{section}' section in file '{config}'.")
 
     env = "[Service]"
-    for k, v in parser.items(section):
+    for k, v in get_items(parser, section, workload).items():
         env += "\nEnvironment=\"" + k + "=" + v + "\""
     print(env, end='', flush=True)
 
@@ -61,6 +75,22 @@ def set_value(config, section, key, value):
     with open(config, 'w') as configfile:
         parser.write(configfile)
 
+# Copy the sections whose name starts with the specified prefix from a testy configuration file
+# into another, e.g. the 'workload.<name>' sections when the configuration file is replaced.
+def copy_sections(src, dest, prefix):
+
+    source = cp.ConfigParser(interpolation=None)
+    source.read(src)
+    parser = cp.ConfigParser(interpolation=None)
+    parser.read(dest)
+
+    for section in source.sections():
+        if section.startswith(prefix):
+            parser[section] = source[section]
+
+    with open(dest, 'w') as configfile:
+        parser.write(configfile)
+
 # This allows us to call script functions by name from the command line with an
 # arbitrary number of parameters. Example usage is:
 # 
@@ -0,0 +1,278 @@
+import configparser as cp
+import hashlib, os, random, string, sys, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from testy_resources import get_cpu_count, get_workload_profile
+import testy_cache
+
+# Bulk-load a new database to the target size of the workload, so a new server starts the run
+# in its steady-state size instead of growing the database one table at a time. The tables are
+# written with bulk cursors, which build the pages directly from sorted keys, one writer per
+# table. WiredTiger only lets one process open a database, so the writers are threads of one
+# connection with their own sessions: the cursor calls release the interpreter lock, and the
+# writers use all the cores.
+#
+# The keys are the sorted append keys of workgen, and the value sizes follow the inserts of the
+# run: the sample workload's by default, or the insert mixes of a workload spec. The tables are
+# created as the dynamic tables of workgen, with their mirrors, so the workload writes, checks
+# and drops them like the tables it creates.
+
+# The populate settings used when the testy configuration file has no 'populate' section or
+# is missing some of its options. Zero threads uses one per core, and zero tables one per
+# thread. The 'target_gb' applies to the workloads without a target size of their own, and
+# "auto" derives it from the disk. 'fill' is the share of the target database size to load.
+# An empty 'value_sizes' follows the inserts of the workload, otherwise it lists 'size:weight'
+# pairs.
+default_settings = {
+    "threads": 0,
+    "tables": 0,
+    "target_gb": "auto",
+    "fill": 1.0,
+    "value_sizes": "",
+    "seed": 0,
+}
+
+# The value sizes of the inserts of the sample workload and their weights: per insert thread,
+# 10 x 100 inserts of 1KB, 5 x 50 of 10KB and 20 of 100KB.
+sample_value_sizes = "1024:1000,10240:250,102400:20"
+sample_key_size = 512
+
+# The configuration and application metadata of the dynamic tables of workgen. Workgen picks
+# up the dynamic tables of an existing database when the workload starts.
+table_config = "key_format=S,value_format=S"
+table_prefix = "table_populate_"
+dynamic_table_metadata = "workgen_dynamic_table=true"
+mirror_table_metadata = "workgen_table_mirror"
+base_table_metadata = "workgen_base_table=true"
+
+# The version of the layout of the populated databases, to change when the data written for
+# a layout changes, so the databases cached under the previous version are not restored.
+layout_version = 1
+
+# The number of records between two progress reports of a writer.
+report_records = 10000
+
+# Return the populate settings from the 'populate' section of the testy configuration file.
+def get_settings(config):
+
+    parser = cp.ConfigParser(interpolation=cp.ExtendedInterpolation())
+    parser.read(config)
+
+    settings = dict(default_settings)
+    if parser.has_section("populate"):
+        section = parser["populate"]
+        for key, value in default_settings.items():
+            settings[key] = type(value)(section.get(key, value))
+    return settings
+
+# Return the value sizes and their weights from a list of 'size:weight' pairs.
+def parse_value_sizes(text):
+
+    sizes = []
+    for entry in text.split(","):
+        size, _, weight = entry.strip().partition(":")
+        sizes.append((int(size), float(weight or 1)))
+    return sizes
+
+# Return the value sizes and weights of the inserts of a workload spec, its key size, its
+# target size in GB and whether it mirrors its tables.
+def get_spec_shape(spec_file):
+
+    from testy_workload import load_plan, parse_mix_entry
+
+    variant = load_plan(spec_file)["variants"][0]
+    weights, key_size = {}, sample_key_size
+    for thread in variant["threads"].values():
+        for entry in thread["mix"]:
+            name, repeat = parse_mix_entry(entry)
+            mix = variant["mixes"][name]
+            if mix["op"] == "insert":
+                weights[mix["value_size"]] = weights.get(mix["value_size"], 0) + \
+                                             thread["count"] * repeat * mix["count"]
+                key_size = mix["key_size"]
+    return (list(weights.items()) or parse_value_sizes(sample_value_sizes), key_size,
+            variant["size"].get("target_gb", "auto"),
+            variant["options"].get("mirror_tables", False))
+
+# Return the append key of workgen for a record number.
+def format_key(number, key_size):
+    return str(number).zfill(key_size - 1)
+
+# Write the records of a table, and of its mirror, with bulk cursors. The values are slices of
+# a random string at random offsets.
+def write_table(connection, uri, mirror_uri, records, value_sizes, key_size, seed, progress):
+
+    rng = random.Random(seed)
+    sizes, weights = zip(*value_sizes)
+    pool = "".join(rng.choices(string.ascii_letters + string.digits, k=2 * max(sizes)))
+
+    session = connection.open_session()
+    cursors = []
+    for table, other in [(uri, mirror_uri), (mirror_uri, uri)]:
+        if not table:
+            continue
+        metadata = dynamic_table_metadata
+        if other:
+            metadata += f",{mirror_table_metadata}={other}"
+            if table == uri:
+                metadata += f",{base_table_metadata}"
+        session.create(table, f"{table_config},app_metadata=\"{metadata}\"")
+        cursors.append(session.open_cursor(table, None, "bulk"))
+
+    written = 0
+    for number in range(1, records + 1):
+        size = rng.choices(sizes, weights)[0]
+        offset = rng.randrange(len(pool) - size + 1)
+        key, value = format_key(number, key_size), pool[offset:offset + size]
+        for cursor in cursors:
+            cursor.set_key(key)
+            cursor.set_value(value)
+            cursor.insert()
+        written += len(cursors) * (key_size + size)
+        if number % report_records == 0:
+            progress(written)
+            written = 0
+    progress(written)
+    for cursor in cursors:
+        cursor.close()
+    session.close()
+
+# Return the layout of the database to populate: its tables, records, keys and values, and the
+# digest of the workload spec. The target size is in GB, or "auto" to derive it from the disk as
+# the sample workload does. With a workload spec, the shape of the data follows the spec. The
+# layout is 'portable' when neither its table count nor its target size is derived from the
+# host, so it is the same on every server running the workload.
+def get_layout(home, spec_file="", target_gb=""):
+
+    settings = get_settings(os.environ.get("testy_config", ""))
+    utilization = float(os.environ.get("utilization") or 0.75)
+    profile = get_workload_profile(home, utilization)
+    if spec_file:
+        value_sizes, key_size, spec_target, mirror = get_spec_shape(spec_file)
+    else:
+        value_sizes, key_size, spec_target, mirror = \
+            parse_value_sizes(sample_value_sizes), sample_key_size, "auto", True
+    if settings["value_sizes"]:
+        value_sizes = parse_value_sizes(settings["value_sizes"])
+    target_gb = str(target_gb or spec_target)
+    if target_gb == "auto":
+        target_gb = settings["target_gb"]
+    portable = target_gb != "auto" and bool(settings["tables"] or settings["threads"])
+    target_gb = profile["db_size_target_gb"] if target_gb == "auto" else float(target_gb)
+
+    spec = "sample"
+    if spec_file:
+        with open(spec_file, "rb") as f:
+            spec = hashlib.sha256(f.read()).hexdigest()
+    tables = settings["tables"] or settings["threads"] or get_cpu_count()
+    total_weight = sum(w for _, w in value_sizes)
+    record_size = key_size + sum(s * w for s, w in value_sizes) / total_weight
+    target = target_gb * 1e9 * settings["fill"]
+    return {
+        "version": layout_version,
+        "tables": tables,
+        "records": max(int(target / tables / (2 if mirror else 1) / record_size), 1),
+        "mirror": mirror,
+        "key_size": key_size,
+        "value_sizes": value_sizes,
+        "seed": settings["seed"],
+        "spec": spec,
+        "portable": portable,
+    }
+
+# Bulk-load the database in the given directory to the target size of the workload. A database
+# that was already populated is left as is. A new database is restored from the cache of
+# populated databases when it holds a database of the same layout, and saved into it otherwise.
+# Only the portable layouts are cached: a layout derived from the cores or the free disk of the
+# host would only match the same host, and only while its disk usage holds. The cache errors are
+# not fatal: the database is populated without the cache.
+def run(home, spec_file="", target_gb="", connection_config=""):
+
+    import wiredtiger
+
+    config = os.environ.get("testy_config", "")
+    settings = get_settings(config)
+    layout = get_layout(home, spec_file, target_gb)
+    tables, records, mirror = layout["tables"], layout["records"], layout["mirror"]
+    key_size, value_sizes = layout["key_size"], layout["value_sizes"]
+    threads = settings["threads"] or get_cpu_count()
+    target = tables * records * (2 if mirror else 1) * \
+        (key_size + sum(s * w for s, w in value_sizes) / sum(w for _, w in value_sizes))
+
+    cache = testy_cache.get_settings(config)["enabled"] and \
+        not os.path.exists(os.path.join(home, "WiredTiger"))
+    if cache and not layout["portable"]:
+        print("The populated database is not cached, its table count or target size is derived "
+              "from the host. Set 'tables' and 'target_gb' in the populate section of the testy "
+              "configuration file to cache it.", flush=True)
+        cache = False
+    if cache:
+        key = testy_cache.get_key(layout)
+        try:
+            if testy_cache.restore(config, home, key):
+                return
+        except Exception as e:
+            print(f"Unable to restore the database from the cache: {e}", flush=True)
+
+    os.makedirs(home, exist_ok=True)
+    utilization = float(os.environ.get("utilization") or 0.75)
+    cache_size_gb = get_workload_profile(home, utilization)["cache_size_gb"]
+    connection_config = f"create=true,cache_size={cache_size_gb}GB,log=(enabled=true)" + \
+        (f",{connection_config}" if connection_config else "")
+    connection = wiredtiger.wiredtiger_open(home, connection_config)
+
+    session = connection.open_session()
+    cursor = session.open_cursor("metadata:", None, None)
+    populated = any(uri.startswith(f"table:{table_prefix}") for uri, _ in cursor)
+    cursor.close()
+    session.close()
+    if populated:
+        print(f"The database in '{home}' is already populated.")
+        connection.close()
+        return
+
+    print(f"Populating {tables} tables{' and their mirrors' if mirror else ''} with {records} "
+          f"records each, {target / 1e9:.1f}GB in total, on {threads} threads.", flush=True)
+    lock = threading.Lock()
+    start, total, last_report = time.monotonic(), [0], [time.monotonic()]
+
+    def progress(written):
+        with lock:
+            total[0] += written
+            now = time.monotonic()
+            if now - last_report[0] >= 10:
+                last_report[0] = now
+                print(f"Populated {total[0] / 1e9:.1f}GB of {target / 1e9:.1f}GB, "
+                      f"{total[0] / 1e6 / (now - start):.0f}MB/s.", flush=True)
+
+    seed = layout["seed"] or random.randrange(1, 2 ** 32)
+    with ThreadPoolExecutor(threads) as executor:
+        futures = []
+        for i in range(tables):
+            uri = f"table:{table_prefix}{i:04d}"
+            futures.append(executor.submit(write_table, connection, uri,
+                                           f"{uri}_mirror" if mirror else None, records,
+                                           value_sizes, key_size, seed + i, progress))
+        for future in futures:
+            future.result()
+
+    # Closing the connection checkpoints the bulk-loaded tables.
+    connection.close()
+    elapsed = time.monotonic() - start
+    print(f"Populated {total[0] / 1e9:.1f}GB in {elapsed:.0f}s "
+          f"({total[0] / 1e6 / elapsed:.0f}MB/s).", flush=True)
+    # The database is populated whether or not it can be cached.
+    if cache:
+        try:
+            testy_cache.save(config, home, key)
+        except Exception as e:
+            print(f"Unable to save the database into the cache: {e}", flush=True)
+
+# This allows us to call script functions by name from the command line with an
+# arbitrary number of parameters. Example usage is:
+#
+#   $ python3 testy_populate.py run '/srv/testy/data'
+#   $ python3 testy_populate.py run '/srv/testy/data' '/srv/testy/workloads/my_spec/my_spec.toml'
+#
+if __name__ == "__main__":
+
+    globals()[sys.argv[1]](*sys.argv[2:])
@@ -0,0 +1,145 @@
+import os, subprocess, sys, threading, time
+from concurrent.futures import ThreadPoolExecutor
+
+# Volumes restored from an EBS snapshot are loaded lazily: the first read of each block is
+# served from S3 and is much slower than subsequent reads. These functions read the blocks
+# ahead of use, in parallel, to initialize a restored volume, and verify the database in the
+# order its files are read, so the verification follows the initialization instead of waiting
+# for the whole volume.
+
+chunk_size = 1024 * 1024
+
+# Print progress at most once per interval, and always for the final update.
+class Progress:
+    def __init__(self, label, total, interval=5):
+        self.label = label
+        self.total = total
+        self.done = 0
+        self.interval = interval
+        self.start = self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def update(self, nbytes, force=False):
+        with self.lock:
+            self.done += nbytes
+            now = time.monotonic()
+            if not force and now - self.last < self.interval:
+                return
+            self.last = now
+            elapsed = max(now - self.start, 1e-6)
+            percent = 100 * self.done / self.total if self.total else 100
+            print(f"{self.label}: {self.done >> 20}/{self.total >> 20} MB ({percent:.1f}%) "
+                  f"at {(self.done >> 20) / elapsed:.1f} MB/s", flush=True)
+
+# Read 'length' bytes from the file descriptor starting at 'offset', discarding the data.
+def read_range(fd, offset, length, progress):
+    end = offset + length
+    while offset < end:
+        data = os.pread(fd, min(chunk_size, end - offset), offset)
+        if not data:
+            break
+        offset += len(data)
+        progress.update(len(data))
+
+# Return the block device backing the root file system, e.g. /dev/nvme0n1.
+def get_root_device():
+    source = subprocess.run(["findmnt", "-n", "-o", "SOURCE", "/"], capture_output=True,
+                            text=True, check=True).stdout.strip()
+    parent = subprocess.run(["lsblk", "-n", "-o", "PKNAME", source], capture_output=True,
+                            text=True).stdout.strip()
+    return f"/dev/{parent}" if parent else source
+
+# Read every block of the device in parallel. The device is split into 'threads' contiguous
+# ranges each read sequentially by one thread, which keeps the reads large and ordered.
+def prewarm_device(device="", threads="16"):
+    device = device or get_root_device()
+    threads = int(threads)
+
+    fd = os.open(device, os.O_RDONLY)
+    try:
+        size = os.lseek(fd, 0, os.SEEK_END)
+        progress = Progress(f"Initializing {device}", size)
+        step = -(-size // threads // chunk_size) * chunk_size
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            for future in [executor.submit(read_range, fd, offset, step, progress)
+                           for offset in range(0, size, step)]:
+                future.result()
+        progress.update(0, force=True)
+    finally:
+        os.close(fd)
+
+# Return the database files ordered from the most to the least recently modified. The most
+# recently modified tables are the ones the workload was using when the snapshot was taken.
+def get_hot_files(database_dir):
+    files = [e for e in os.scandir(database_dir) if e.is_file(follow_symlinks=False)]
+    return sorted(files, key=lambda e: e.stat().st_mtime, reverse=True)
+
+# Read the database files in parallel, hottest first. If an order file is given, the
+# WiredTiger objects are written to it in the same order, one URI per line, before the reads
+# start, so that verification can start on the hot tables while the rest of the volume is
+# initialized. The metadata is verified when the database is opened, and is not listed.
+def prewarm_files(database_dir, threads="16", order_file=""):
+    files = get_hot_files(database_dir)
+    progress = Progress(f"Initializing {database_dir}", sum(e.stat().st_size for e in files))
+
+    if order_file:
+        # The file is complete when it appears, and readable by the validation.
+        with open(order_file + ".tmp", "w") as f:
+            for e in files:
+                if e.name.endswith(".wt") and e.name != "WiredTiger.wt":
+                    f.write(f"file:{e.name}\n")
+        os.chmod(order_file + ".tmp", 0o644)
+        os.replace(order_file + ".tmp", order_file)
+
+    def read_file(path):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            read_range(fd, 0, os.fstat(fd).st_size, progress)
+        finally:
+            os.close(fd)
+
+    with ThreadPoolExecutor(max_workers=int(threads)) as executor:
+        for future in [executor.submit(read_file, e.path) for e in files]:
+            future.result()
+    progress.update(0, force=True)
+
+# Verify the database in the given directory with one connection: the metadata when the
+# database is opened, then the objects listed in the order file, then the objects of the
+# metadata the order file does not list. Return False if any of them failed verification.
+def verify(database_dir, order_file):
+    import wiredtiger
+
+    with open(order_file) as f:
+        uris = [line.strip() for line in f if line.strip()]
+
+    # Like 'wt -R', run recovery when the database is opened.
+    connection = wiredtiger.wiredtiger_open(database_dir, "log=(recover=on),verify_metadata=true")
+    session = connection.open_session()
+    cursor = session.open_cursor("metadata:", None, None)
+    uris += sorted(uri for uri, _ in cursor if uri.startswith("file:") and
+                   uri != "file:WiredTiger.wt" and uri not in uris)
+    cursor.close()
+
+    failed = []
+    for uri in uris:
+        print(f"Verifying '{uri}' ...", flush=True)
+        try:
+            session.verify(uri, None)
+        except wiredtiger.WiredTigerError as e:
+            print(f"Error: Verification of '{uri}' failed: {e}", flush=True)
+            failed.append(uri)
+    connection.close()
+    print(f"Verified {len(uris)} objects, {len(failed)} failed.", flush=True)
+    return not failed
+
+# This allows us to call script functions by name from the command line with an
+# arbitrary number of parameters. Example usage is:
+#
+#   $ sudo python3 testy_prewarm.py prewarm_files '/srv/testy/data' '16' '/tmp/verify.order'
+#   $ sudo python3 testy_prewarm.py prewarm_device '' '32'
+#   $ python3 testy_prewarm.py verify '/srv/testy/data' '/tmp/verify.order'
+#
+if __name__ == "__main__":
+
+    result = globals()[sys.argv[1]](*sys.argv[2:])
+    sys.exit(0 if result is not False else 1)
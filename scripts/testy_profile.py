@@ -0,0 +1,342 @@
+import configparser as cp
+import glob, gzip, json, os, re, shutil, subprocess, sys, tempfile
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+# Capture low-overhead profiles of a running workload: the workload processes are sampled
+# with perf at a low frequency for a short window, or with py-spy if perf is not available,
+# and their /proc I/O and scheduler counters are recorded over the same window. Profiles are
+# stored as compressed folded stacks, the input format of flamegraph.pl, next to a JSON file
+# holding the counters and the WiredTiger commit being tested. The oldest profiles are removed
+# when the profile directory grows beyond its size limit.
+
+# The profiling settings used when the testy configuration file has no 'profile' section or
+# is missing some of its options.
+default_settings = {
+    "profile_dir": "/srv/testy/profiles",
+    "duration": 60,
+    "frequency": 49,
+    "max_size_mb": 1024,
+}
+
+# Return the profiling settings from the 'profile' section of the testy configuration file,
+# and the WiredTiger source directory.
+def get_settings(config):
+
+    parser = cp.ConfigParser(interpolation=cp.ExtendedInterpolation())
+    parser.read(config)
+
+    settings = dict(default_settings)
+    if parser.has_section("profile"):
+        section = parser["profile"]
+        settings["profile_dir"] = section.get("profile_dir", settings["profile_dir"])
+        settings["duration"] = section.getint("duration", settings["duration"])
+        settings["frequency"] = section.getint("frequency", settings["frequency"])
+        settings["max_size_mb"] = section.getint("max_size_mb", settings["max_size_mb"])
+    settings["wt_home_dir"] = parser.get("wiredtiger", "home_dir", fallback="")
+    return settings
+
+# Return the process IDs of a systemd service: its main process and all its descendants.
+def get_service_pids(service):
+
+    result = subprocess.run(["systemctl", "show", "--property", "MainPID", "--value", service],
+                            capture_output=True, text=True)
+    main_pid = int(result.stdout.strip() or 0)
+    if not main_pid:
+        return []
+
+    pids, pending = [], [main_pid]
+    while pending:
+        pid = pending.pop()
+        pids.append(pid)
+        for children in glob.glob(f"/proc/{pid}/task/*/children"):
+            try:
+                with open(children) as f:
+                    pending.extend(int(p) for p in f.read().split())
+            except OSError:
+                pass
+    return pids
+
+# Return the I/O and scheduler counters of a process, summed over its threads, or None if
+# the process has exited. The block I/O delay is only counted when the kernel's delay
+# accounting is enabled (kernel.task_delayacct).
+def get_process_counters(pid):
+
+    try:
+        with open(f"/proc/{pid}/comm") as f:
+            counters = {"comm": f.read().strip()}
+        with open(f"/proc/{pid}/io") as f:
+            for line in f:
+                key, value = line.split(":")
+                counters[key] = int(value)
+        with open(f"/proc/{pid}/stat") as f:
+            # The command name may contain spaces, so split after its closing parenthesis.
+            fields = f.read().rsplit(")", 1)[1].split()
+            counters["blkio_delay_ns"] = int(fields[39]) * 1e9 / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError):
+        return None
+
+    counters.update(cpu_ns=0, run_delay_ns=0, voluntary_switches=0, involuntary_switches=0)
+    for task in glob.glob(f"/proc/{pid}/task/*"):
+        try:
+            with open(f"{task}/schedstat") as f:
+                cpu_ns, run_delay_ns, _ = f.read().split()
+            counters["cpu_ns"] += int(cpu_ns)
+            counters["run_delay_ns"] += int(run_delay_ns)
+            with open(f"{task}/status") as f:
+                for line in f:
+                    if line.startswith("voluntary_ctxt_switches:"):
+                        counters["voluntary_switches"] += int(line.split()[1])
+                    elif line.startswith("nonvoluntary_ctxt_switches:"):
+                        counters["involuntary_switches"] += int(line.split()[1])
+        except (OSError, ValueError):
+            # The thread exited while it was being read.
+            pass
+    return counters
+
+# Return the change of the process counters between two readings, for the processes present
+# in both. The time a process spent blocked, off-CPU, shows in its voluntary switches and
+# block I/O delay, the time it spent waiting for a CPU in its run delay.
+def get_counter_deltas(before, after):
+
+    deltas = {}
+    for pid, end in after.items():
+        start = before.get(pid)
+        if start is None or end is None or start["comm"] != end["comm"]:
+            continue
+        deltas[str(pid)] = {k: (v - start[k] if k != "comm" else v) for k, v in end.items()}
+    return deltas
+
+# Fold the output of 'perf script' into stacks: one "frame;frame;... count" line per unique
+# stack, outermost frame first and prefixed with the command name.
+def fold_perf_script(text):
+
+    stacks = Counter()
+    for event in text.split("\n\n"):
+        lines = event.strip().splitlines()
+        if not lines:
+            continue
+        frames = []
+        for line in lines[1:]:
+            parts = line.split(None, 1)
+            symbol = parts[1] if len(parts) > 1 else "[unknown]"
+            frames.append(re.sub(r"\+0x[0-9a-f]+$", "", symbol.split(" (")[0]) or "[unknown]")
+        stacks[";".join([lines[0].strip().replace(" ", "_")] + frames[::-1])] += 1
+    return stacks
+
+# Sample the given processes with perf for 'duration' seconds.
+def record_perf(pids, duration, frequency):
+
+    data = tempfile.mktemp(prefix="testy-profile-", suffix=".data")
+    try:
+        result = subprocess.run(["sudo", "perf", "record", "-q", "-F", str(frequency), "-g",
+                                 "-p", ",".join(str(p) for p in pids), "-o", data,
+                                 "--", "sleep", str(duration)], capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"perf record failed: {result.stderr.strip()}")
+        result = subprocess.run(["sudo", "perf", "script", "-i", data, "-F", "comm,ip,sym"],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"perf script failed: {result.stderr.strip()}")
+    finally:
+        subprocess.run(["sudo", "rm", "-f", data])
+    return fold_perf_script(result.stdout)
+
+# Sample the Python processes among the given processes with py-spy for 'duration' seconds,
+# including the native frames of the WiredTiger library.
+def record_py_spy(pids, duration, frequency):
+
+    stacks = Counter()
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/comm") as f:
+                if not f.read().startswith("python"):
+                    continue
+        except OSError:
+            continue
+        output = tempfile.mktemp(prefix="testy-profile-", suffix=".txt")
+        subprocess.run(["sudo", "py-spy", "record", "--format", "raw", "--native", "--nonblocking",
+                        "-r", str(frequency), "-d", str(duration), "-p", str(pid), "-o", output],
+                       capture_output=True)
+        try:
+            with open(output) as f:
+                stacks.update(read_folded(f))
+        except OSError:
+            pass
+        subprocess.run(["sudo", "rm", "-f", output])
+    return stacks
+
+# Parse folded stack lines into a counter of stacks.
+def read_folded(lines):
+
+    stacks = Counter()
+    for line in lines:
+        stack, _, count = line.rstrip().rpartition(" ")
+        if stack and count.isdigit():
+            stacks[stack] += int(count)
+    return stacks
+
+# Remove the oldest profiles until the profile directory holds at most 'max_bytes' bytes.
+def enforce_size_limit(profile_dir, max_bytes):
+
+    files = sorted(glob.glob(os.path.join(profile_dir, "*.folded.gz")))
+    total = sum(os.path.getsize(f) for f in glob.glob(os.path.join(profile_dir, "*")))
+    for folded in files[:-1]:
+        if total <= max_bytes:
+            break
+        for path in [folded, folded.replace(".folded.gz", ".json")]:
+            if os.path.exists(path):
+                total -= os.path.getsize(path)
+                os.remove(path)
+
+# Capture a profile of the workload run by the testy-run service, using the settings of the
+# testy configuration file.
+def capture(config, workload):
+
+    settings = get_settings(config)
+    pids = get_service_pids(f"testy-run@{workload}.service")
+    if not pids:
+        print(f"Workload '{workload}' is not running, no profile captured.")
+        return True
+
+    if shutil.which("perf"):
+        sampler, record = "perf", record_perf
+    elif shutil.which("py-spy"):
+        sampler, record = "py-spy", record_py_spy
+    else:
+        raise RuntimeError("Neither perf nor py-spy is installed.")
+
+    wt_commit = subprocess.run(["git", "-C", settings["wt_home_dir"], "rev-parse", "HEAD"],
+                               capture_output=True, text=True).stdout.strip()
+    start = datetime.now(timezone.utc)
+    before = {pid: get_process_counters(pid) for pid in pids}
+    stacks = record(pids, settings["duration"], settings["frequency"])
+    after = {pid: get_process_counters(pid) for pid in pids}
+
+    profile_dir = settings["profile_dir"]
+    os.makedirs(profile_dir, exist_ok=True)
+    name = os.path.join(profile_dir, start.strftime("%Y%m%dT%H%M%SZ"))
+    with gzip.open(name + ".folded.gz", "wt") as f:
+        f.writelines(f"{stack} {count}\n" for stack, count in stacks.items())
+    with open(name + ".json", "w") as f:
+        json.dump({"start": start.isoformat(), "duration": settings["duration"],
+                   "frequency": settings["frequency"], "sampler": sampler, "workload": workload,
+                   "wiredtiger_commit": wt_commit, "samples": sum(stacks.values()),
+                   "processes": get_counter_deltas(before, after)}, f, indent=1)
+
+    enforce_size_limit(profile_dir, settings["max_size_mb"] * 1024 * 1024)
+    print(f"Captured {sum(stacks.values())} samples of workload '{workload}' with {sampler} "
+          f"in '{name}.folded.gz'.")
+    return True
+
+# Parse a time of a profile selector: an ISO 8601 time, or a duration before now such as
+# '30m', '12h' or '7d'.
+def parse_time(value):
+
+    match = re.fullmatch(r"(\d+)([mhd])", value)
+    if match:
+        unit = {"m": "minutes", "h": "hours", "d": "days"}[match.group(2)]
+        return datetime.now(timezone.utc) - timedelta(**{unit: int(match.group(1))})
+    when = datetime.fromisoformat(value)
+    return when if when.tzinfo else when.replace(tzinfo=timezone.utc)
+
+# Return the metadata of the profiles matching a selector, oldest first. A selector is either
+# a time window 'start..end', where either end may be omitted, or a WiredTiger commit hash
+# prefix. An empty selector matches all profiles.
+def select_profiles(profile_dir, selector=""):
+
+    profiles = []
+    for path in sorted(glob.glob(os.path.join(profile_dir, "*.json"))):
+        with open(path) as f:
+            profile = json.load(f)
+        profile["file"] = path.replace(".json", ".folded.gz")
+        if os.path.exists(profile["file"]):
+            profiles.append(profile)
+
+    if ".." in selector:
+        start, end = [parse_time(t) if t else None for t in selector.split("..", 1)]
+        return [p for p in profiles
+                if (not start or datetime.fromisoformat(p["start"]) >= start) and
+                   (not end or datetime.fromisoformat(p["start"]) < end)]
+    if selector:
+        return [p for p in profiles if p["wiredtiger_commit"].startswith(selector)]
+    return profiles
+
+# Return the folded stacks of the profiles matching a selector, merged.
+def merge_stacks(profile_dir, selector):
+
+    profiles = select_profiles(profile_dir, selector)
+    if not profiles:
+        raise ValueError(f"No profile matches '{selector}'.")
+    stacks = Counter()
+    for profile in profiles:
+        with gzip.open(profile["file"], "rt") as f:
+            stacks.update(read_folded(f))
+    return stacks
+
+# Return the share of the samples in which each function appears.
+def get_function_shares(stacks):
+
+    functions = Counter()
+    for stack, count in stacks.items():
+        for function in set(stack.split(";")[1:]):
+            functions[function] += count
+    total = sum(stacks.values()) or 1
+    return {f: count / total for f, count in functions.items()}
+
+# Print the profiles matching a selector.
+def list_profiles(profile_dir, selector=""):
+
+    for p in select_profiles(profile_dir, selector):
+        processes = p["processes"].values()
+        cpu = sum(c["cpu_ns"] for c in processes) / 1e9
+        written = sum(c["write_bytes"] for c in processes) / 1024 ** 2
+        blkio = sum(c["blkio_delay_ns"] for c in processes) / 1e9
+        print(f"{p['start'][:19]}  {p['wiredtiger_commit'][:10]}  {p['workload']:<16} "
+              f"{p['sampler']:<6} {p['samples']:>8} samples  cpu {cpu:8.1f}s  "
+              f"written {written:8.1f}MB  blkio delay {blkio:6.1f}s")
+
+# Merge the profiles matching a selector into a folded stack file, ready for flamegraph.pl.
+def merge(profile_dir, selector, output):
+
+    stacks = merge_stacks(profile_dir, selector)
+    with open(output, "w") as f:
+        f.writelines(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+    print(f"Merged {sum(stacks.values())} samples matching '{selector}' into '{output}'.")
+
+# Compare the profiles matching two selectors. The functions whose share of the samples
+# changed the most are printed, and the stacks are written in the format of difffolded.pl,
+# with the counts of 'before' scaled to the number of samples of 'after', ready for
+# flamegraph.pl to draw a differential flame graph.
+def diff(profile_dir, before, after, output="", top="20"):
+
+    stacks_before = merge_stacks(profile_dir, before)
+    stacks_after = merge_stacks(profile_dir, after)
+    shares_before = get_function_shares(stacks_before)
+    shares_after = get_function_shares(stacks_after)
+
+    changes = {f: shares_after.get(f, 0) - shares_before.get(f, 0)
+               for f in set(shares_before) | set(shares_after)}
+    print(f"{'before':>8} {'after':>8} {'change':>8}  function")
+    for function in sorted(changes, key=lambda f: -abs(changes[f]))[:int(top)]:
+        print(f"{shares_before.get(function, 0):8.2%} {shares_after.get(function, 0):8.2%} "
+              f"{changes[function]:+8.2%}  {function}")
+
+    if output:
+        scale = sum(stacks_after.values()) / (sum(stacks_before.values()) or 1)
+        with open(output, "w") as f:
+            for stack in sorted(set(stacks_before) | set(stacks_after)):
+                f.write(f"{stack} {round(stacks_before[stack] * scale)} {stacks_after[stack]}\n")
+
+# This allows us to call script functions by name from the command line with an
+# arbitrary number of parameters. Example usage is:
+#
+#   $ python3 testy_profile.py capture '/srv/testy/.testy' 'sample'
+#   $ python3 testy_profile.py list_profiles '/srv/testy/profiles' '24h..'
+#   $ python3 testy_profile.py merge '/srv/testy/profiles' '3f2a1b' '/tmp/profile.folded'
+#   $ python3 testy_profile.py diff '/srv/testy/profiles' '3f2a1b' '8c9d0e' '/tmp/diff.folded'
+#
+if __name__ == "__main__":
+
+    result = globals()[sys.argv[1]](*sys.argv[2:])
+    sys.exit(0 if result is not False else 1)
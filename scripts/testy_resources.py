@@ -0,0 +1,238 @@
+import configparser as cp
+import getpass, json, os, shutil, subprocess, sys, tempfile, time
+
+# Detect the resources of the machine running a workload and derive a workload profile
+# from them, so that the same workload stresses a small and a large instance equally hard.
+
+# The machine size the sample workload's thread counts were tuned for.
+reference_cores = 16
+
+# The approximate write bandwidth generated by one insert or update thread of the sample
+# workload, in MB/s.
+thread_write_bandwidth_mbps = 0.25
+
+# The database size is allowed to vary by this fraction around its target before tables
+# are dropped.
+db_size_margin = 0.5
+
+bandwidth_cache = "/tmp/testy_resources.json"
+
+# The resources settings used when the testy configuration file has no 'resources' section or
+# is missing some of its options. The disk bandwidth is measured by writing a file of
+# 'bandwidth_test_mb' in blocks of 'bandwidth_block_kb' in the scratch directory.
+default_settings = {
+    "scratch_dir": "/srv/testy/scratch",
+    "bandwidth_test_mb": 256,
+    "bandwidth_block_kb": 1024,
+}
+
+# Where an unused instance store NVMe device is mounted for fast local storage, and the label
+# of the file system created on it.
+nvme_mount_point = "/mnt/testy-nvme"
+nvme_label = "testy-nvme"
+
+# Return the resources settings from the 'resources' section of the testy configuration file.
+def get_settings(config):
+
+    parser = cp.ConfigParser(interpolation=cp.ExtendedInterpolation())
+    parser.read(config)
+
+    settings = dict(default_settings)
+    if parser.has_section("resources"):
+        section = parser["resources"]
+        for key, value in default_settings.items():
+            settings[key] = type(value)(section.get(key, value))
+    return settings
+
+# Return the number of cores available to this process.
+def get_cpu_count():
+    return len(os.sched_getaffinity(0))
+
+# Return the total RAM in bytes.
+def get_total_memory():
+    with open("/proc/meminfo") as f:
+        for line in f:
+            if line.startswith("MemTotal:"):
+                return int(line.split()[1]) * 1024
+    raise ValueError("Unable to read the total memory from /proc/meminfo.")
+
+# Return the total and free bytes of the file system holding the given path.
+def get_disk_capacity(path):
+    st = os.statvfs(path)
+    return st.f_blocks * st.f_frsize, st.f_bavail * st.f_frsize
+
+# Return the total size in bytes of the files in the given directory.
+def get_directory_size(path):
+    return sum(e.stat().st_blocks * 512 for e in os.scandir(path) if e.is_file(follow_symlinks=False))
+
+# Measure the sequential write bandwidth in MB/s of the file system holding the given
+# directory by writing and syncing a temporary file. The file is written in the scratch
+# directory, outside the database, when it is on the same file system, and in a temporary
+# directory of the given directory otherwise. The result is cached per device since the
+# measurement itself loads the disk.
+def measure_disk_bandwidth(path):
+    device = str(os.stat(path).st_dev)
+    try:
+        with open(bandwidth_cache) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    if device in cache:
+        return cache[device]
+
+    settings = get_settings(os.environ.get("testy_config", ""))
+    scratch_dir = settings["scratch_dir"]
+    try:
+        scratch = os.stat(scratch_dir).st_dev == os.stat(path).st_dev and \
+            os.access(scratch_dir, os.W_OK)
+    except OSError:
+        scratch = False
+    tmp_dir = tempfile.mkdtemp(prefix=".testy-bandwidth-", dir=scratch_dir if scratch else path)
+    size_mb, block_kb = settings["bandwidth_test_mb"], settings["bandwidth_block_kb"]
+    block = os.urandom(block_kb * 1024)
+    start = time.monotonic()
+    try:
+        fd = os.open(os.path.join(tmp_dir, "bandwidth.tmp"), os.O_WRONLY | os.O_CREAT, 0o600)
+        try:
+            for _ in range(size_mb * 1024 // block_kb):
+                os.write(fd, block)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        bandwidth = size_mb / max(time.monotonic() - start, 1e-3)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    cache[device] = bandwidth
+    try:
+        with open(bandwidth_cache, "w") as f:
+            json.dump(cache, f)
+    except OSError:
+        pass
+    return bandwidth
+
+# Return the instance store NVMe devices of the machine as (device, mount point) pairs. The
+# mount point is None if the device is not mounted.
+def get_instance_store_devices():
+    result = subprocess.run(["lsblk", "-J", "-p", "-o", "NAME,MODEL,MOUNTPOINT"],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        return []
+
+    devices = []
+    for disk in json.loads(result.stdout)["blockdevices"]:
+        if "Instance Storage" not in (disk.get("model") or ""):
+            continue
+        mounts = [d["mountpoint"] for d in [disk] + disk.get("children", []) if d.get("mountpoint")]
+        devices.append((disk["name"], mounts[0] if mounts else None))
+    return devices
+
+# Return the signatures blkid finds on a device, such as the TYPE and LABEL of its file system
+# or the PTTYPE of its partition table, or None if the device cannot be probed.
+def probe_device(device):
+    result = subprocess.run(["sudo", "blkid", "-p", "-o", "export", device],
+                            capture_output=True, text=True)
+    # blkid exits with status 2 when it finds no signature.
+    if result.returncode == 2:
+        return {}
+    if result.returncode != 0:
+        return None
+    return dict(line.split("=", 1) for line in result.stdout.splitlines() if "=" in line)
+
+# Mount an unused instance store device, formatting it first if it is blank. A device holding
+# a file system or a partition table is only mounted if it holds the file system testy created,
+# e.g. before a reboot, and is never formatted. The instance store is ephemeral, so its content
+# is lost when the instance stops.
+def mount_instance_store(device, mount_point=nvme_mount_point):
+    signatures = probe_device(device)
+    if signatures is None:
+        return None
+    commands = []
+    if not signatures:
+        commands.append(["mkfs.ext4", "-q", "-L", nvme_label, device])
+    elif signatures.get("TYPE") != "ext4" or signatures.get("LABEL") != nvme_label:
+        return None
+    commands += [["mkdir", "-p", mount_point], ["mount", "-o", "noatime", device, mount_point],
+                 ["chown", getpass.getuser(), mount_point]]
+    for command in commands:
+        if subprocess.run(["sudo"] + command, capture_output=True,
+                          stdin=subprocess.DEVNULL).returncode != 0:
+            return None
+    return mount_point
+
+# Return a directory on fast local storage with at least 'required' free bytes, or None if
+# there is none. Instance store NVMe is preferred, mounting it if needed, then a tmpfs file
+# system. Short-lived, I/O-bound jobs placed there avoid the EBS throughput limits.
+def get_fast_storage(required):
+    for device, mount_point in get_instance_store_devices():
+        mount_point = mount_point or mount_instance_store(device)
+        if mount_point and os.access(mount_point, os.W_OK) and \
+           get_disk_capacity(mount_point)[1] >= required:
+            return mount_point
+
+    if os.path.isdir("/dev/shm") and get_disk_capacity("/dev/shm")[1] >= required:
+        return "/dev/shm"
+    return None
+
+# Return the resources available to a workload using the given database directory.
+def get_resources(database_dir):
+    disk_total, disk_free = get_disk_capacity(database_dir)
+    return {
+        "cores": get_cpu_count(),
+        "memory": get_total_memory(),
+        "disk_total": disk_total,
+        "disk_free": disk_free,
+        "database_size": get_directory_size(database_dir),
+        "disk_bandwidth_mbps": measure_disk_bandwidth(database_dir),
+    }
+
+# Return a workload profile that keeps the machine at the given utilization (between 0 and
+# 1) of its cores, disk capacity and disk bandwidth. The profile contains:
+#   cache_size_gb       The WiredTiger cache size, following MongoDB: (RAM - 1GB) / 2.
+#   thread_scale        The factor to apply to the workload's reference thread counts.
+#   db_size_target_gb   The target database size.
+#   db_size_margin_gb   How far the database size may go above or below the target.
+def get_workload_profile(database_dir, utilization=0.75):
+    resources = get_resources(database_dir)
+
+    # Scale the threads with the number of cores, but never generate more write bandwidth
+    # than the disk can absorb at the target utilization.
+    thread_scale = resources["cores"] * utilization / reference_cores
+    write_threads = 20 * thread_scale
+    max_write_threads = resources["disk_bandwidth_mbps"] * utilization / thread_write_bandwidth_mbps
+    if write_threads > max_write_threads:
+        thread_scale *= max_write_threads / write_threads
+
+    # The database may grow up to its target plus the margin. Size the target so that this
+    # fits in the share of the disk available to the database, i.e. the disk at the target
+    # utilization minus the space used by everything else.
+    other_usage = resources["disk_total"] - resources["disk_free"] - resources["database_size"]
+    db_budget = max(resources["disk_total"] * utilization - other_usage, 0)
+    db_size_target_gb = max(int(db_budget / (1 + db_size_margin) / 1e9), 1)
+
+    profile = {
+        "cache_size_gb": max(int(((resources["memory"] - 1e9) / 2) / 1e9), 1),
+        "thread_scale": thread_scale,
+        "db_size_target_gb": db_size_target_gb,
+        "db_size_margin_gb": max(int(db_size_target_gb * db_size_margin), 1),
+    }
+    return {**resources, **profile}
+
+# Scale a reference thread count by the profile's thread scale, keeping at least one thread.
+def scale_threads(profile, count):
+    return max(int(round(count * profile["thread_scale"])), 1)
+
+# Print the workload profile for the given database directory.
+def print_profile(database_dir, utilization="0.75"):
+    profile = get_workload_profile(database_dir, float(utilization))
+    for key, value in profile.items():
+        print(f"{key}: {round(value, 2) if isinstance(value, float) else value}")
+
+# This allows us to call script functions by name from the command line with an
+# arbitrary number of parameters. Example usage is:
+#
+#   $ python3 testy_resources.py print_profile '/srv/testy/data' '0.75'
+#
+if __name__ == "__main__":
+
+    globals()[sys.argv[1]](*sys.argv[2:])
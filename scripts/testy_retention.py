@@ -0,0 +1,188 @@
+import configparser as cp
+import json, subprocess, sys, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+# The retention policy used when the testy configuration file has no 'retention' section
+# or is missing some of its options.
+default_policy = {
+    "keep_failed": 5,
+    "max_age_days": 30,
+    "protect_failures": True,
+    "delete_concurrency": 4,
+    "delete_rate": 5.0,
+}
+
+# Run an aws cli command and return its parsed JSON output.
+def aws(*args):
+    result = subprocess.run(["aws", *args, "--output", "json"], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip())
+    return json.loads(result.stdout) if result.stdout.strip() else None
+
+# Return the retention policy from the 'retention' section of the testy configuration file.
+def get_policy(config):
+
+    parser = cp.ConfigParser(interpolation=cp.ExtendedInterpolation())
+    parser.read(config)
+
+    policy = dict(default_policy)
+    if parser.has_section("retention"):
+        section = parser["retention"]
+        policy["keep_failed"] = section.getint("keep_failed", policy["keep_failed"])
+        policy["max_age_days"] = section.getint("max_age_days", policy["max_age_days"])
+        policy["protect_failures"] = section.getboolean("protect_failures", policy["protect_failures"])
+        policy["delete_concurrency"] = section.getint("delete_concurrency", policy["delete_concurrency"])
+        policy["delete_rate"] = section.getfloat("delete_rate", policy["delete_rate"])
+    return policy
+
+# Yield the testy snapshots one page at a time. The filtering is done server-side and the
+# query only returns the fields needed by the retention policy, which keeps each page small
+# for accounts with a large number of snapshots.
+def describe_snapshots(instance_id=None, page_size=500):
+
+    filters = ["Name=tag:Application,Values=testy"]
+    if instance_id:
+        filters.append(f"Name=tag:InstanceID,Values={instance_id}")
+
+    query = "{NextToken: NextToken, Snapshots: Snapshots[*].{ID: SnapshotId, " \
+            "StartTime: StartTime, State: State, Size: VolumeSize, " \
+            "InstanceID: Tags[?Key=='InstanceID']|[0].Value, " \
+            "Validation: Tags[?Key=='Validation']|[0].Value, " \
+            "FailureFile: Tags[?Key=='FailureFile']|[0].Value}}"
+
+    token = None
+    while True:
+        args = ["ec2", "describe-snapshots", "--owner-ids", "self", "--filters", *filters,
+                "--query", query, "--no-paginate", "--max-results", str(page_size)]
+        if token:
+            args += ["--next-token", token]
+        page = aws(*args)
+        yield from page["Snapshots"] or []
+        token = page.get("NextToken")
+        if not token:
+            break
+
+# Decide which snapshots to keep and which to delete. Returns a list of (snapshot, action,
+# reason) tuples where the action is either "keep" or "delete". The rules are applied in
+# order:
+#   (1) Snapshots that are not yet completed are kept.
+#   (2) Snapshots whose failure file is still on the server, given as 'protected_ids', are
+#       kept if the policy protects failures.
+#   (3) Snapshots that have been successfully validated are deleted.
+#   (4) Only the most recent failed snapshots of each instance are kept. The ones tagged with
+#       a failure file are kept whatever their age if the policy protects failures.
+#   (5) Snapshots older than the maximum age are deleted.
+def plan_retention(snapshots, policy, now=None, protected_ids=()):
+
+    now = now or datetime.now(timezone.utc)
+    max_age = policy["max_age_days"] * 86400
+    plan = []
+    failed = {}
+
+    for snapshot in sorted(snapshots, key=lambda s: s["StartTime"], reverse=True):
+        age = (now - datetime.fromisoformat(snapshot["StartTime"].replace("Z", "+00:00"))).total_seconds()
+        expired = max_age > 0 and age > max_age
+
+        if snapshot["State"] != "completed":
+            plan.append((snapshot, "keep", f"snapshot is {snapshot['State']}"))
+        elif snapshot["ID"] in protected_ids and policy["protect_failures"]:
+            plan.append((snapshot, "keep", "has a failure file"))
+        elif snapshot.get("Validation") == "success":
+            plan.append((snapshot, "delete", "validated"))
+        elif snapshot.get("Validation") == "failed" or snapshot.get("FailureFile"):
+            instance = snapshot.get("InstanceID")
+            failed[instance] = failed.get(instance, 0) + 1
+            if failed[instance] > policy["keep_failed"]:
+                plan.append((snapshot, "delete", f"more than {policy['keep_failed']} failed snapshots"))
+            elif snapshot.get("FailureFile") and policy["protect_failures"]:
+                plan.append((snapshot, "keep", "recent failure with a failure file"))
+            elif expired:
+                plan.append((snapshot, "delete", f"older than {policy['max_age_days']} days"))
+            else:
+                plan.append((snapshot, "keep", "recent failure"))
+        elif expired:
+            plan.append((snapshot, "delete", f"older than {policy['max_age_days']} days"))
+        else:
+            plan.append((snapshot, "keep", "within retention"))
+
+    return plan
+
+# Print a report of the retention plan.
+def print_plan(plan):
+
+    print(f"{'Snapshot':<24} {'Instance':<21} {'Validation':<11} {'Started':<21} "
+          f"{'Action':<7} Reason")
+    for snapshot, action, reason in plan:
+        print(f"{snapshot['ID']:<24} {str(snapshot.get('InstanceID')):<21} "
+              f"{str(snapshot.get('Validation')):<11} {snapshot['StartTime'][:19]:<21} "
+              f"{action:<7} {reason}")
+
+    deleted = [s for s, action, _ in plan if action == "delete"]
+    size = sum(s.get("Size") or 0 for s in deleted)
+    print(f"\n{len(deleted)} of {len(plan)} snapshots to delete ({size} GiB of volume size).")
+
+# Delete the given snapshots concurrently. The number of delete calls is limited to 'rate'
+# calls per second across all workers, and throttled calls are retried with an exponential
+# backoff. Returns a dictionary mapping each snapshot ID to an error message, or None if the
+# snapshot was deleted.
+def delete_snapshots(snapshot_ids, concurrency=4, rate=5.0, retries=5):
+
+    lock = threading.Lock()
+    next_call = [time.monotonic()]
+
+    def throttle():
+        with lock:
+            now = time.monotonic()
+            wait = next_call[0] - now
+            next_call[0] = max(now, next_call[0]) + 1.0 / rate
+        if wait > 0:
+            time.sleep(wait)
+
+    def delete(snapshot_id):
+        for attempt in range(retries):
+            throttle()
+            try:
+                aws("ec2", "delete-snapshot", "--snapshot-id", snapshot_id)
+                print(f"Deleted snapshot '{snapshot_id}'.", flush=True)
+                return None
+            except RuntimeError as e:
+                error = str(e)
+                if "RequestLimitExceeded" not in error:
+                    break
+                time.sleep(2 ** attempt)
+        print(f"Error: Failed to delete snapshot '{snapshot_id}': {error}", flush=True)
+        return error
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        return dict(zip(snapshot_ids, executor.map(delete, snapshot_ids)))
+
+# Apply the retention policy from the testy configuration file to the testy snapshots, or
+# only to the snapshots of the given instance. Snapshots whose IDs are listed in
+# 'protected_ids' (a comma-separated string) have their failure file on the server. With
+# dry_run, only the report is printed. Returns True if all deletions succeeded.
+def prune(config, instance_id="", dry_run="false", protected_ids=""):
+
+    policy = get_policy(config)
+    protected = set(filter(None, protected_ids.split(",")))
+    plan = plan_retention(describe_snapshots(instance_id or None), policy, protected_ids=protected)
+    print_plan(plan)
+
+    if str(dry_run).lower() in ("true", "1", "yes"):
+        print("Dry run: no snapshots were deleted.")
+        return True
+
+    snapshot_ids = [s["ID"] for s, action, _ in plan if action == "delete"]
+    errors = delete_snapshots(snapshot_ids, policy["delete_concurrency"], policy["delete_rate"])
+    return not any(errors.values())
+
+# This allows us to call script functions by name from the command line with an
+# arbitrary number of parameters. Example usage is:
+#
+#   $ python3 testy_retention.py prune '/srv/testy/.testy' 'i-0123456789abcdef0'
+#   $ python3 testy_retention.py prune '/srv/testy/.testy' '' 'true'
+#
+if __name__ == "__main__":
+
+    result = globals()[sys.argv[1]](*sys.argv[2:])
+    sys.exit(0 if result is not False else 1)
@@ -0,0 +1,255 @@
+import configparser as cp
+import glob, json, os, shutil, subprocess, sys, time
+from datetime import datetime, timezone
+from testy_profile import get_service_pids
+from testy_telemetry import get_state_file
+
+# Detect checkpoint and eviction stalls in a running workgen workload. Workgen writes the
+# throughput and latency of each operation type to monitor.json in the database directory
+# every sample interval. The detector follows that file, and when the maximum latency of an
+# interval breaches the latency SLO it captures a diagnostic bundle: the stacks of all the
+# workload threads, the recent latency samples, the latest WiredTiger statistics with the
+# checkpoint and eviction counters that changed, and the I/O statistics of the host. Each
+# bundle records whether a checkpoint or application thread eviction was running at the time.
+
+# The stall detector settings used when the testy configuration file has no 'stall' section
+# or is missing some of its options.
+default_settings = {
+    "bundle_dir": "/srv/testy/stalls",
+    "latency_slo_ms": 1000,
+    "cooldown": 600,
+    "max_bundles": 50,
+    "poll_interval": 1,
+}
+
+# The number of latency samples and statistics records saved in a bundle.
+history_samples = 60
+history_stats = 3
+
+# The statistics correlated with stalls, matched by substring.
+checkpoint_stats = ["checkpoint currently running", "checkpoint most recent time",
+                    "checkpoint max time", "checkpoint prepare"]
+eviction_stats = ["pages evicted by application threads", "application thread time evicting",
+                  "page write from cache to disk time", "pages queued for urgent eviction",
+                  "bytes currently in the cache", "tracked dirty bytes"]
+
+# Return the stall detector settings from the 'stall' section of the testy configuration file,
+# and the database directory.
+def get_settings(config):
+
+    parser = cp.ConfigParser(interpolation=cp.ExtendedInterpolation())
+    parser.read(config)
+
+    settings = dict(default_settings)
+    if parser.has_section("stall"):
+        section = parser["stall"]
+        for key, value in default_settings.items():
+            settings[key] = type(value)(section.get(key, value))
+    # The service environment holds the database directory of the workload instance.
+    settings["database_dir"] = os.environ.get("database_dir") or \
+                               parser.get("application", "database_dir")
+    return settings
+
+# Flatten the nested statistics of a WiredTiger JSON statistics record into
+# "category: name" keys.
+def flatten_stats(record):
+
+    stats = {}
+    for category, values in record.get("wiredtiger", {}).items():
+        if isinstance(values, dict):
+            for name, value in values.items():
+                stats[f"{category}: {name}"] = value
+        else:
+            stats[category] = values
+    return stats
+
+# Return the last 'count' records of the most recent WiredTiger statistics log.
+def read_latest_stats(database_dir, count):
+
+    logs = sorted(glob.glob(os.path.join(database_dir, "WiredTigerStat.*")),
+                  key=os.path.getmtime)
+    if not logs:
+        return []
+    with open(logs[-1]) as f:
+        lines = f.readlines()[-count:]
+    records = []
+    for line in lines:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            pass
+    return records
+
+# Return the maximum latency in milliseconds of a workgen monitor sample and the operation
+# type it was seen for. The monitor reports the latencies in microseconds.
+def get_max_latency(sample):
+
+    latency, operation = 0, None
+    for name, values in sample.get("workgen", {}).items():
+        if isinstance(values, dict) and values.get("max latency", 0) / 1000 > latency:
+            latency, operation = values["max latency"] / 1000, name
+    return latency, operation
+
+# Return the checkpoint and eviction statistics of the latest statistics record, and their
+# change since the previous record, to correlate a stall with its likely cause.
+def correlate(stats_records):
+
+    if not stats_records:
+        return {"cause": "unknown", "checkpoint": {}, "eviction": {}}
+    latest = flatten_stats(stats_records[-1])
+    previous = flatten_stats(stats_records[-2]) if len(stats_records) > 1 else {}
+
+    def select(patterns):
+        selected = {}
+        for key, value in latest.items():
+            if any(p in key for p in patterns) and isinstance(value, (int, float)):
+                selected[key] = {"value": value, "delta": value - previous.get(key, value)}
+        return selected
+
+    checkpoint, eviction = select(checkpoint_stats), select(eviction_stats)
+    causes = []
+    if any("currently running" in k and v["value"] for k, v in checkpoint.items()):
+        causes.append("checkpoint")
+    if any("by application threads" in k and v["delta"] > 0 for k, v in eviction.items()):
+        causes.append("application eviction")
+    return {"cause": " and ".join(causes) or "unknown", "checkpoint": checkpoint,
+            "eviction": eviction}
+
+# Write the stacks of all the threads of the given processes into the bundle, with gdb. The
+# process is paused while its stacks are read.
+def capture_stacks(pids, bundle):
+
+    with open(os.path.join(bundle, "stacks.txt"), "w") as f:
+        for pid in pids:
+            f.write(f"==== Process {pid} ====\n")
+            f.flush()
+            subprocess.run(["sudo", "gdb", "-batch", "-p", str(pid), "-ex",
+                            "thread apply all bt"], stdout=f, stderr=subprocess.STDOUT)
+
+# Copy the I/O statistics of the host and the latest telemetry of the workload into the bundle.
+def capture_io_stats(pids, workload, bundle):
+
+    files = ["/proc/diskstats", "/proc/meminfo", "/proc/pressure/io", "/proc/pressure/memory",
+             "/proc/pressure/cpu", get_state_file(workload)]
+    files += [f"/proc/{pid}/io" for pid in pids]
+    with open(os.path.join(bundle, "io.txt"), "w") as f:
+        for path in files:
+            try:
+                with open(path) as src:
+                    f.write(f"==== {path} ====\n{src.read()}\n")
+            except OSError:
+                pass
+
+# Capture a diagnostic bundle for a stall and return its directory.
+def capture_bundle(settings, workload, samples, latency, operation):
+
+    now = datetime.now(timezone.utc)
+    bundle = os.path.join(settings["bundle_dir"], now.strftime("stall-%Y%m%dT%H%M%SZ"))
+    os.makedirs(bundle, exist_ok=True)
+
+    # Read the stacks first, while the stall may still be going on.
+    pids = get_service_pids(f"testy-run@{workload}.service")
+    capture_stacks(pids, bundle)
+    capture_io_stats(pids, workload, bundle)
+
+    stats_records = read_latest_stats(settings["database_dir"], history_stats)
+    with open(os.path.join(bundle, "stats.json"), "w") as f:
+        f.writelines(json.dumps(r) + "\n" for r in stats_records)
+    with open(os.path.join(bundle, "monitor.json"), "w") as f:
+        f.writelines(json.dumps(s) + "\n" for s in samples)
+
+    summary = {"time": now.isoformat(), "workload": workload, "latency_ms": latency,
+               "operation": operation,
+               "latency_slo_ms": settings["latency_slo_ms"], **correlate(stats_records)}
+    with open(os.path.join(bundle, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=1)
+    return bundle, summary
+
+# Remove the oldest bundles beyond the maximum number of bundles.
+def prune_bundles(bundle_dir, max_bundles):
+
+    bundles = sorted(glob.glob(os.path.join(bundle_dir, "stall-*")))
+    for bundle in bundles[:-max_bundles] if max_bundles > 0 else []:
+        shutil.rmtree(bundle, ignore_errors=True)
+
+# Yield the samples appended to the workgen monitor file, following it like 'tail -f'. The
+# file is reopened when it is recreated by a workload restart, and read from its start when
+# it is truncated by the governor.
+def follow_monitor(path, poll_interval):
+
+    f, inode = None, None
+    while True:
+        try:
+            stat = os.stat(path)
+            current = stat.st_ino
+        except OSError:
+            current = None
+        if f and current == inode and stat.st_size < f.tell():
+            f.seek(0)
+        if current != inode:
+            if f:
+                f.close()
+            f = open(path) if current else None
+            inode = current
+            # Skip the samples written before the detector started.
+            if f:
+                f.seek(0, os.SEEK_END)
+
+        line = f.readline() if f else ""
+        if not line:
+            time.sleep(poll_interval)
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            pass
+
+# Watch the latencies of the workload run by the testy-run service, and capture a bundle
+# when the latency SLO is breached, at most once per cooldown period.
+def watch(config, workload):
+
+    settings = get_settings(config)
+    monitor = os.path.join(settings["database_dir"], "monitor.json")
+    print(f"Watching '{monitor}' for latencies above {settings['latency_slo_ms']}ms.", flush=True)
+
+    samples, last_bundle = [], 0
+    for sample in follow_monitor(monitor, settings["poll_interval"]):
+        samples = (samples + [sample])[-history_samples:]
+        latency, operation = get_max_latency(sample)
+        if latency <= settings["latency_slo_ms"] or \
+           time.monotonic() - last_bundle < settings["cooldown"]:
+            continue
+
+        last_bundle = time.monotonic()
+        bundle, summary = capture_bundle(settings, workload, samples, latency, operation)
+        print(f"Stall: {operation} latency of {latency:.0f}ms, likely cause: {summary['cause']}. "
+              f"Diagnostics saved to '{bundle}'.", flush=True)
+        prune_bundles(settings["bundle_dir"], settings["max_bundles"])
+
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        subprocess.run(["python3", os.path.join(script_dir, "testy_events.py"), "emit", config,
+                        "testy-stall", "stall", f"workload={workload}", f"operation={operation}",
+                        f"latency_ms={latency:.0f}", f"cause={summary['cause']}",
+                        f"bundle={os.path.basename(bundle)}"])
+
+# Print the summaries of the captured bundles.
+def report(bundle_dir):
+
+    for bundle in sorted(glob.glob(os.path.join(bundle_dir, "stall-*"))):
+        try:
+            with open(os.path.join(bundle, "summary.json")) as f:
+                summary = json.load(f)
+        except (OSError, ValueError):
+            continue
+        print(f"{os.path.basename(bundle)}  {summary['operation']:<10} "
+              f"{summary['latency_ms']:>8.0f}ms  cause: {summary['cause']}")
+
+# This allows us to call script functions by name from the command line with an
+# arbitrary number of parameters. Example usage is:
+#
+#   $ python3 testy_stall.py watch '/srv/testy/.testy' 'sample'
+#   $ python3 testy_stall.py report '/srv/testy/stalls'
+#
+if __name__ == "__main__":
+
+    globals()[sys.argv[1]](*sys.argv[2:])
@@ -0,0 +1,307 @@
+import configparser as cp
+import json, os, subprocess, sys, tempfile, time
+from testy_cgroups import get_slice_metrics, get_slice_stats, slices
+from testy_profile import get_service_pids
+from testy_resources import get_disk_capacity
+
+# Collect host telemetry while a workload runs: disk, memory, CPU and pressure stall
+# information from /proc, the resource usage of the workload processes, and the usage, limits
+# and throttling of the testy cgroup slices. Samples are taken every few seconds, downsampled
+# locally, and published through the testy metrics script as one batch per publish interval.
+# Thresholds are checked on every sample, so an alert for the database volume fires while
+# there is still time to act, before the volume fills.
+
+# The telemetry settings used when the testy configuration file has no 'telemetry' section
+# or is missing some of its options.
+default_settings = {
+    "interval": 5,
+    "publish_interval": 60,
+    "disk_warning": 0.80,
+    "disk_critical": 0.90,
+    "fill_horizon": 3600,
+    "memory_warning": 0.90,
+    "pressure_warning": 25.0,
+}
+
+# Return the file holding the latest sample and alert levels of a workload, for other tools
+# running on the testy server.
+def get_state_file(workload):
+    return f"/tmp/testy_telemetry-{workload}.json"
+
+# The number of samples used to estimate the rate at which the database volume fills.
+fill_rate_samples = 60
+
+alert_levels = ["ok", "warning", "critical"]
+
+# Return the telemetry settings from the 'telemetry' section of the testy configuration file.
+def get_settings(config):
+
+    parser = cp.ConfigParser(interpolation=cp.ExtendedInterpolation())
+    parser.read(config)
+
+    settings = dict(default_settings)
+    if parser.has_section("telemetry"):
+        section = parser["telemetry"]
+        for key, value in default_settings.items():
+            settings[key] = type(value)(section.get(key, value))
+    settings["interval"] = min(max(settings["interval"], 1), 10)
+    return settings
+
+# Return the block device name holding the given path, e.g. 'nvme1n1', as named in
+# /proc/diskstats.
+def get_block_device(path):
+
+    dev = os.stat(path).st_dev
+    try:
+        path = os.path.realpath(f"/sys/dev/block/{os.major(dev)}:{os.minor(dev)}")
+        return os.path.basename(path) if os.path.exists(path) else None
+    except OSError:
+        return None
+
+# Return the counters of a block device from /proc/diskstats: completed reads and writes,
+# sectors read and written, and milliseconds spent doing I/O.
+def read_diskstats(device):
+
+    with open("/proc/diskstats") as f:
+        for line in f:
+            fields = line.split()
+            if fields[2] == device:
+                return {"reads": int(fields[3]), "read_sectors": int(fields[5]),
+                        "writes": int(fields[7]), "write_sectors": int(fields[9]),
+                        "io_ms": int(fields[12])}
+    return None
+
+# Return the fields of /proc/meminfo in bytes.
+def read_meminfo():
+
+    meminfo = {}
+    with open("/proc/meminfo") as f:
+        for line in f:
+            key, value = line.split(":")
+            meminfo[key] = int(value.split()[0]) * 1024
+    return meminfo
+
+# Return the total and the idle and iowait CPU ticks from /proc/stat.
+def read_cpu():
+
+    with open("/proc/stat") as f:
+        ticks = [int(t) for t in f.readline().split()[1:]]
+    return {"total": sum(ticks), "idle": ticks[3], "iowait": ticks[4]}
+
+# Return the 10-second averages of the time some tasks were stalled on the CPU, memory and
+# I/O, in percent. The values are missing if the kernel has no pressure stall information.
+def read_pressure():
+
+    pressure = {}
+    for resource in ["cpu", "memory", "io"]:
+        try:
+            with open(f"/proc/pressure/{resource}") as f:
+                some = f.readline().split()
+            pressure[resource] = float(some[1].split("=")[1])
+        except (OSError, IndexError, ValueError):
+            pass
+    return pressure
+
+# Return the resident memory, CPU ticks and bytes read and written of the given processes.
+def read_processes(pids):
+
+    usage = {"rss": 0, "cpu_ticks": 0, "read_bytes": 0, "write_bytes": 0}
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            usage["cpu_ticks"] += int(fields[11]) + int(fields[12])
+            usage["rss"] += int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+            with open(f"/proc/{pid}/io") as f:
+                for line in f:
+                    key, value = line.split(":")
+                    if key in ("read_bytes", "write_bytes"):
+                        usage[key] += int(value)
+        except (OSError, ValueError):
+            pass
+    return usage
+
+# Collects the samples and turns the counters into rates between two consecutive samples.
+class Collector:
+    def __init__(self, database_dir, service):
+        self.database_dir = database_dir
+        self.service = service
+        self.device = get_block_device(database_dir)
+        self.previous = None
+        self.free_history = []
+
+    # Take a raw reading of all counters.
+    def read(self):
+        total, free = get_disk_capacity(self.database_dir)
+        return {
+            "time": time.monotonic(),
+            "disk": read_diskstats(self.device) if self.device else None,
+            "disk_total": total,
+            "disk_free": free,
+            "meminfo": read_meminfo(),
+            "cpu": read_cpu(),
+            "pressure": read_pressure(),
+            "processes": read_processes(get_service_pids(self.service)),
+            "slices": {name: get_slice_stats(name) for name in slices},
+        }
+
+    # Return a sample of the host metrics, or None for the first reading.
+    def sample(self):
+        current = self.read()
+        previous, self.previous = self.previous, current
+        self.free_history.append((current["time"], current["disk_free"]))
+        del self.free_history[:-fill_rate_samples]
+        if previous is None:
+            return None
+
+        elapsed = current["time"] - previous["time"]
+        meminfo = current["meminfo"]
+        cpu = {k: current["cpu"][k] - previous["cpu"][k] for k in current["cpu"]}
+        cpu_total = max(cpu["total"], 1)
+        # Processes may exit between two samples, so their counters may go backwards.
+        processes = {k: max(current["processes"][k] - previous["processes"][k], 0)
+                     for k in current["processes"]}
+        metrics = {
+            "disk_used_percent": 100 * (1 - current["disk_free"] / current["disk_total"]),
+            "disk_free_gb": current["disk_free"] / 1e9,
+            "memory_used_percent": 100 * (1 - meminfo["MemAvailable"] / meminfo["MemTotal"]),
+            "memory_dirty_mb": meminfo.get("Dirty", 0) / 1e6,
+            "cpu_used_percent": 100 * (1 - cpu["idle"] / cpu_total),
+            "cpu_iowait_percent": 100 * cpu["iowait"] / cpu_total,
+            "workload_rss_mb": current["processes"]["rss"] / 1e6,
+            "workload_cpu_percent": 100 * processes["cpu_ticks"] / os.sysconf("SC_CLK_TCK") /
+                                    elapsed,
+            "workload_write_mbps": processes["write_bytes"] / 1e6 / elapsed,
+        }
+        for resource, value in current["pressure"].items():
+            metrics[f"pressure_{resource}_percent"] = value
+        metrics.update(get_slice_metrics(previous["slices"], current["slices"], elapsed))
+
+        if current["disk"] and previous["disk"]:
+            disk = {k: current["disk"][k] - previous["disk"][k] for k in current["disk"]}
+            metrics["disk_read_mbps"] = disk["read_sectors"] * 512 / 1e6 / elapsed
+            metrics["disk_write_mbps"] = disk["write_sectors"] * 512 / 1e6 / elapsed
+            metrics["disk_iops"] = (disk["reads"] + disk["writes"]) / elapsed
+            metrics["disk_busy_percent"] = min(100 * disk["io_ms"] / 1000 / elapsed, 100)
+
+        # Estimate when the database volume fills from its free space over the last samples.
+        (start, free_start), (end, free_end) = self.free_history[0], self.free_history[-1]
+        fill_rate = (free_start - free_end) / max(end - start, 1e-3)
+        metrics["disk_seconds_to_full"] = free_end / fill_rate if fill_rate > 0 else -1
+        return metrics
+
+# Return the alert level of each checked resource for a sample, with a message for the ones
+# that are not ok.
+def check_thresholds(metrics, settings):
+
+    alerts = {}
+    used = metrics["disk_used_percent"] / 100
+    to_full = metrics["disk_seconds_to_full"]
+    if used >= settings["disk_critical"]:
+        alerts["disk"] = (2, f"the database volume is {used:.0%} full")
+    elif 0 <= to_full < settings["fill_horizon"]:
+        alerts["disk"] = (2, f"the database volume fills in {to_full / 60:.0f} minutes "
+                             "at the current rate")
+    elif used >= settings["disk_warning"]:
+        alerts["disk"] = (1, f"the database volume is {used:.0%} full")
+
+    memory = metrics["memory_used_percent"] / 100
+    if memory >= settings["memory_warning"]:
+        alerts["memory"] = (1, f"{memory:.0%} of the memory is in use")
+
+    for resource in ["cpu", "memory", "io"]:
+        pressure = metrics.get(f"pressure_{resource}_percent", 0)
+        if pressure >= settings["pressure_warning"]:
+            alerts[f"{resource}_pressure"] = (1, f"tasks stalled on {resource} {pressure:.0f}% "
+                                                 "of the time")
+    return alerts
+
+# Return the CloudWatch metric data for the samples of a publish interval: the statistics of
+# each metric over the interval, and the highest alert level. The instance dimension is
+# filled in by the testy metrics script.
+def downsample(samples, alert_level):
+
+    metric_data = [{"MetricName": "telemetry_alert_level", "Value": alert_level,
+                    "Dimensions": [{"Name": "Instance", "Value": "@INSTANCE_ID@"}]}]
+    for name in dict.fromkeys(name for s in samples for name in s):
+        values = [s[name] for s in samples if name in s]
+        metric_data.append({
+            "MetricName": name,
+            "Dimensions": [{"Name": "Instance", "Value": "@INSTANCE_ID@"}],
+            "StatisticValues": {"SampleCount": len(values), "Sum": sum(values),
+                                "Minimum": min(values), "Maximum": max(values)}})
+    return metric_data
+
+# Publish a batch of metric data through the testy metrics script.
+def publish(script_dir, metric_data):
+
+    with tempfile.NamedTemporaryFile("w", prefix="testy-telemetry-", suffix=".json") as f:
+        json.dump(metric_data, f)
+        f.flush()
+        result = subprocess.run([os.path.join(script_dir, "testy-metrics.sh"), "--metric-data",
+                                 f.name], capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"Error: Unable to publish the telemetry: {result.stdout.strip()}", flush=True)
+
+# Collect telemetry for the workload run by the testy-run service until it stops.
+def collect(config, workload):
+
+    settings = get_settings(config)
+    parser = cp.ConfigParser(interpolation=cp.ExtendedInterpolation())
+    parser.read(config)
+    # The service environment holds the database directory of the workload instance.
+    database_dir = os.environ.get("database_dir") or parser.get("application", "database_dir")
+    script_dir = parser.get("application", "service_script_dir")
+    state_file = get_state_file(workload)
+
+    collector = Collector(database_dir, f"testy-run@{workload}.service")
+    print(f"Collecting telemetry for workload '{workload}' on device '{collector.device}' every "
+          f"{settings['interval']}s.", flush=True)
+
+    samples, levels, max_level = [], {}, 0
+    last_publish = time.monotonic()
+    while True:
+        metrics = collector.sample()
+        if metrics:
+            samples.append(metrics)
+
+            # Report the alerts when their level changes, not on every sample.
+            alerts = check_thresholds(metrics, settings)
+            for name in set(levels) | set(alerts):
+                level, message = alerts.get(name, (0, "back to normal"))
+                if level != levels.get(name, 0):
+                    print(f"{alert_levels[level].capitalize()}: {name}: {message}.", flush=True)
+                levels[name] = level
+            max_level = max([max_level] + [level for level, _ in alerts.values()])
+
+            with open(state_file + ".tmp", "w") as f:
+                json.dump({"time": time.time(), "metrics": metrics,
+                           "alerts": {k: alert_levels[v[0]] for k, v in alerts.items()}}, f)
+            os.replace(state_file + ".tmp", state_file)
+
+        if samples and time.monotonic() - last_publish >= settings["publish_interval"]:
+            publish(script_dir, downsample(samples, max_level))
+            samples, max_level = [], 0
+            last_publish = time.monotonic()
+        time.sleep(settings["interval"])
+
+# Print the latest telemetry sample and alerts of a workload.
+def show(workload):
+
+    with open(get_state_file(workload)) as f:
+        state = json.load(f)
+    print(f"Sampled {time.time() - state['time']:.0f}s ago:")
+    for name, value in sorted(state["metrics"].items()):
+        print(f"  {name:<28} {value:12.2f}")
+    for name, level in sorted(state["alerts"].items()):
+        print(f"  {level.capitalize()}: {name}")
+
+# This allows us to call script functions by name from the command line with an
+# arbitrary number of parameters. Example usage is:
+#
+#   $ python3 testy_telemetry.py collect '/srv/testy/.testy' 'sample'
+#   $ python3 testy_telemetry.py show 'sample'
+#
+if __name__ == "__main__":
+
+    globals()[sys.argv[1]](*sys.argv[2:])
@@ -0,0 +1,511 @@
+import configparser as cp
+import glob, json, os, random, signal, struct, subprocess, sys, threading, time, zlib
+
+# Record the operation stream of a workload and replay it against WiredTiger. Workgen runs its
+# operations in C++ and has no hook to observe them, so a workload spec with 'trace = true' in
+# its [workload] table is run by the Python driver below instead. The driver follows the plan
+# of the spec, mixes, threads, phases and sweeps, over a fixed set of tables, with a seeded
+# random generator, and records every operation it completes.
+#
+# A trace is a directory holding a metadata file and a ring of segment files. A segment starts
+# with a header listing the tables that exist when it starts, followed by compressed chunks of
+# records. Each record holds the operation type, the thread, the time since the previous record
+# in microseconds, and the table, the key as a delta from the previous key of the table and the
+# value size where they apply, all as variable-length integers. The chunk buffer bounds the
+# memory used by the recording, and the oldest segments are removed beyond the size limit of
+# the trace, so a trace holds the most recent operations of a run.
+
+# The trace settings used when the testy configuration file has no 'trace' section or is
+# missing some of its options. A seed of 0 draws a new seed for each run.
+default_settings = {
+    "trace_dir": "/srv/testy/traces",
+    "replay_dir": "/srv/testy/replay",
+    "tables": 10,
+    "seed": 0,
+    "chunk_records": 65536,
+    "segment_size_mb": 64,
+    "max_size_mb": 4096,
+}
+
+trace_version = 1
+segment_magic = b"TTRC"
+chunk_magic = b"TTCK"
+segment_header = struct.Struct("<4sHI")
+chunk_header = struct.Struct("<4sIIIQ")
+meta_file = "meta.json"
+
+# The operation types. Searches that do not find their key are flagged, so a replay can
+# report where it diverges from the recording.
+OP_INSERT, OP_UPDATE, OP_SEARCH, OP_REMOVE, OP_BEGIN, OP_COMMIT, OP_ROLLBACK, OP_CREATE = range(8)
+op_names = ["insert", "update", "search", "remove", "begin", "commit", "rollback", "create"]
+op_codes = {name: code for code, name in enumerate(op_names)}
+not_found_flag = 0x80
+table_ops = {OP_INSERT, OP_UPDATE, OP_SEARCH, OP_REMOVE, OP_CREATE}
+key_ops = {OP_INSERT, OP_UPDATE, OP_SEARCH, OP_REMOVE}
+value_ops = {OP_INSERT, OP_UPDATE}
+
+table_config = "key_format=Q,value_format=u"
+
+# Return the trace settings from the 'trace' section of the testy configuration file.
+def get_settings(config):
+
+    parser = cp.ConfigParser(interpolation=cp.ExtendedInterpolation())
+    parser.read(config)
+
+    settings = dict(default_settings)
+    if parser.has_section("trace"):
+        section = parser["trace"]
+        for key, value in default_settings.items():
+            settings[key] = type(value)(section.get(key, value))
+    return settings
+
+def get_table_uri(table):
+    return f"table:table_{table}"
+
+def write_varint(buffer, value):
+    while value >= 0x80:
+        buffer.append(value & 0x7f | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+def read_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+# Map signed key deltas to unsigned integers, small deltas of either sign to small integers.
+def zigzag(value):
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+def unzigzag(value):
+    return value // 2 if value % 2 == 0 else -(value + 1) // 2
+
+class TraceWriter:
+    def __init__(self, trace_dir, chunk_records=65536, segment_size_mb=64, max_size_mb=4096):
+        self.trace_dir = trace_dir
+        self.chunk_records = chunk_records
+        self.segment_size = segment_size_mb * 1024 * 1024
+        self.max_size = max_size_mb * 1024 * 1024
+        self.lock = threading.Lock()
+        self.start = time.monotonic()
+        self.tables = set()
+        self.records = 0
+        self.segment, self.segment_index = None, 0
+        os.makedirs(trace_dir, exist_ok=True)
+        self.new_chunk()
+        self.open_segment()
+
+    def new_chunk(self):
+        self.buffer = bytearray()
+        self.count = 0
+        self.base = self.last = None
+        self.last_keys = {}
+
+    # Start a new segment with the tables that exist at this point of the trace.
+    def open_segment(self):
+        path = os.path.join(self.trace_dir, f"trace-{self.segment_index:06d}.bin")
+        header = json.dumps({"tables": sorted(self.tables)}).encode()
+        self.segment = open(path, "wb")
+        self.segment.write(segment_header.pack(segment_magic, trace_version, len(header)))
+        self.segment.write(header)
+        self.segment_index += 1
+
+    # Remove the oldest segments beyond the size limit of the trace, keeping the current one.
+    def prune(self):
+        segments = sorted(glob.glob(os.path.join(self.trace_dir, "trace-*.bin")))
+        total = sum(os.path.getsize(s) for s in segments)
+        for segment in segments[:-1]:
+            if total <= self.max_size:
+                break
+            total -= os.path.getsize(segment)
+            os.remove(segment)
+
+    # Append a record for a completed operation. The records are ordered by completion time.
+    def record(self, op, thread, table=0, key=0, value_size=0, found=True):
+        with self.lock:
+            now = int((time.monotonic() - self.start) * 1e6)
+            if self.base is None:
+                self.base = self.last = now
+            buffer = self.buffer
+            buffer.append(op if found else op | not_found_flag)
+            write_varint(buffer, thread)
+            write_varint(buffer, now - self.last)
+            self.last = now
+            if op in table_ops:
+                write_varint(buffer, table)
+            if op in key_ops:
+                write_varint(buffer, zigzag(key - self.last_keys.get(table, 0)))
+                self.last_keys[table] = key
+            if op in value_ops:
+                write_varint(buffer, value_size)
+            if op == OP_CREATE:
+                self.tables.add(table)
+
+            self.count += 1
+            self.records += 1
+            if self.count >= self.chunk_records:
+                self.flush()
+
+    # Compress the chunk into the current segment, and start a new segment when the current
+    # one reaches its size limit. The caller holds the lock.
+    def flush(self):
+        if not self.count:
+            return
+        payload = zlib.compress(bytes(self.buffer), 1)
+        self.segment.write(chunk_header.pack(chunk_magic, self.count, len(payload),
+                                             zlib.crc32(payload), self.base))
+        self.segment.write(payload)
+        self.segment.flush()
+        self.new_chunk()
+
+        if self.segment.tell() >= self.segment_size:
+            self.segment.close()
+            self.open_segment()
+            self.prune()
+
+    def close(self):
+        with self.lock:
+            self.flush()
+            self.segment.close()
+
+# Return the tables listed in the header of a segment.
+def read_segment_header(f):
+
+    magic, version, length = segment_header.unpack(f.read(segment_header.size))
+    if magic != segment_magic or version != trace_version:
+        raise ValueError(f"'{f.name}' is not a testy trace segment of version {trace_version}.")
+    return json.loads(f.read(length))["tables"]
+
+# Yield the records of a segment as tuples of the time in microseconds since the start of the
+# trace, the operation, the thread, the table, the key, the value size and whether the key was
+# found. A chunk cut short by the end of the recording ends the segment.
+def read_segment(path):
+
+    with open(path, "rb") as f:
+        read_segment_header(f)
+        while True:
+            header = f.read(chunk_header.size)
+            if len(header) < chunk_header.size:
+                return
+            magic, count, length, crc, now = chunk_header.unpack(header)
+            payload = f.read(length)
+            if magic != chunk_magic or len(payload) < length or zlib.crc32(payload) != crc:
+                return
+            data, pos, last_keys = zlib.decompress(payload), 0, {}
+            for _ in range(count):
+                byte = data[pos]
+                op, found = byte & ~not_found_flag, not byte & not_found_flag
+                thread, pos = read_varint(data, pos + 1)
+                delta, pos = read_varint(data, pos)
+                now += delta
+                table = key = value_size = 0
+                if op in table_ops:
+                    table, pos = read_varint(data, pos)
+                if op in key_ops:
+                    delta, pos = read_varint(data, pos)
+                    key = last_keys.get(table, 0) + unzigzag(delta)
+                    last_keys[table] = key
+                if op in value_ops:
+                    value_size, pos = read_varint(data, pos)
+                yield now, op, thread, table, key, value_size, found
+
+# Return the segments of a trace, oldest first.
+def get_segments(trace_path):
+    return sorted(glob.glob(os.path.join(trace_path, "trace-*.bin")))
+
+# Run the threads of a plan variant phase over the tables of the trace, recording each
+# operation.
+class Recorder:
+    def __init__(self, connection, writer, tables, seed):
+        self.connection = connection
+        self.writer = writer
+        self.tables = tables
+        self.seed = seed
+        self.sizes = [0] * tables
+        self.size_lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.threads = []
+        self.values = {}
+
+    def create_tables(self):
+        session = self.connection.open_session()
+        for table in range(self.tables):
+            session.create(get_table_uri(table), table_config)
+            self.writer.record(OP_CREATE, 0, table)
+        session.close()
+
+    # Return a value of the given size. The values are shared by all the operations, only
+    # their size is recorded.
+    def get_value(self, size):
+        if size not in self.values:
+            self.values[size] = random.Random(size).randbytes(size)
+        return self.values[size]
+
+    # Return the key of an operation on the table. Inserts with append keys add a new key,
+    # the other operations pick an existing key with the mix's key distribution.
+    def get_key(self, mix, table, rng):
+        if mix["op"] == "insert" and mix["key"] == "append":
+            with self.size_lock:
+                self.sizes[table] += 1
+                return self.sizes[table] - 1
+        size = max(self.sizes[table], 1)
+        if mix["key"] == "pareto":
+            # Favour the most recent keys, as the workgen pareto distribution does.
+            return size - 1 - int(rng.paretovariate(mix["pareto_param"]) - 1) % size
+        if mix["key"] == "uniform":
+            return rng.randrange(size)
+        return size - 1
+
+    def run_mix(self, thread, session, cursors, mix, rng):
+        op = op_codes[mix["op"]]
+        for _ in range(mix["count"]):
+            table = rng.randrange(self.tables)
+            key = self.get_key(mix, table, rng)
+            if table not in cursors:
+                cursors[table] = session.open_cursor(get_table_uri(table))
+            cursor = cursors[table]
+            cursor.set_key(key)
+            found = True
+            if op == OP_INSERT or op == OP_UPDATE:
+                cursor.set_value(self.get_value(mix["value_size"]))
+                cursor.insert() if op == OP_INSERT else cursor.update()
+            elif op == OP_SEARCH:
+                found = cursor.search() == 0
+            else:
+                cursor.remove()
+            cursor.reset()
+            self.writer.record(op, thread, table, key, mix["value_size"], found)
+
+    def run_thread(self, thread, mixes, transaction, sleep_scale, deadline):
+        import wiredtiger
+
+        rng = random.Random(f"{self.seed}-{thread}")
+        session = self.connection.open_session()
+        cursors = {}
+        while not self.stopping.is_set() and time.monotonic() < deadline:
+            for mix in mixes:
+                # A failed commit rolls the transaction back itself.
+                running = False
+                try:
+                    if transaction:
+                        session.begin_transaction()
+                        self.writer.record(OP_BEGIN, thread)
+                        running = True
+                    self.run_mix(thread, session, cursors, mix, rng)
+                    if transaction:
+                        running = False
+                        session.commit_transaction()
+                        self.writer.record(OP_COMMIT, thread)
+                except wiredtiger.WiredTigerRollbackError:
+                    for cursor in cursors.values():
+                        cursor.reset()
+                    if running:
+                        session.rollback_transaction()
+                    if transaction:
+                        self.writer.record(OP_ROLLBACK, thread)
+                sleep = mix["sleep"] * sleep_scale
+                if sleep and self.stopping.wait(sleep):
+                    break
+        session.close()
+
+    # Run the threads of a variant for the duration of a phase. The thread numbers continue
+    # across phases so every thread of the trace has its own random sequence.
+    def run_phase(self, variant, phase, profile, first_thread):
+        from testy_resources import scale_threads
+        from testy_workload import parse_mix_entry
+
+        deadline = time.monotonic() + phase["duration"]
+        threads = self.threads = []
+        for thread in variant["threads"].values():
+            mixes = []
+            for entry in thread["mix"]:
+                name, repeat = parse_mix_entry(entry)
+                mixes += repeat * [variant["mixes"][name]]
+            for _ in range(scale_threads(profile, thread["count"] * phase["scale"])):
+                args = (first_thread + len(threads), mixes, thread["transaction"],
+                        phase["sleep_scale"], deadline)
+                threads.append(threading.Thread(target=self.run_thread, args=args, daemon=True))
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return first_thread + len(threads)
+
+# Run the plan of a workload spec with the trace driver, recording its operations in a new
+# trace in the trace directory. Called by the spec workload runner for specs in trace mode.
+def record(plan, home, profile, connection_config, workload):
+    import wiredtiger
+
+    settings = get_settings(os.environ.get("testy_config", ""))
+    seed = settings["seed"] or random.SystemRandom().randrange(1, 2 ** 31)
+    name = f"{workload}-{time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())}"
+    trace_path = os.path.join(settings["trace_dir"], name)
+    writer = TraceWriter(trace_path, settings["chunk_records"], settings["segment_size_mb"],
+                         settings["max_size_mb"])
+
+    wt_commit = subprocess.run(["git", "-C", os.environ.get("wt_home_dir", "."), "rev-parse",
+                                "HEAD"], capture_output=True, text=True).stdout.strip()
+    meta = {"workload": workload, "start": time.time(), "seed": seed,
+            "tables": settings["tables"], "connection": connection_config,
+            "wiredtiger_commit": wt_commit, "plan": plan}
+    with open(os.path.join(trace_path, meta_file), "w") as f:
+        json.dump(meta, f, indent=1)
+    print(f"Recording the workload to '{trace_path}' with seed {seed}.", flush=True)
+
+    # Stop cleanly when the service stops, so the last chunk is written.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    connection = wiredtiger.wiredtiger_open(home, connection_config)
+    recorder = Recorder(connection, writer, settings["tables"], seed)
+    try:
+        recorder.create_tables()
+        thread = 0
+        while True:
+            for variant in plan["variants"]:
+                for phase in plan["phases"]:
+                    print(f"Recording phase '{phase['name']}' of variant '{variant['label']}' "
+                          f"for {phase['duration']} seconds.", flush=True)
+                    thread = recorder.run_phase(variant, phase, profile, thread)
+            if not plan["repeat"]:
+                break
+    finally:
+        recorder.stopping.set()
+        for t in recorder.threads:
+            t.join()
+        writer.close()
+        connection.close()
+        meta.update(end=time.time(), records=writer.records)
+        with open(os.path.join(trace_path, meta_file), "w") as f:
+            json.dump(meta, f, indent=1)
+
+# Replay a trace against the database in the given directory, which should be empty. The
+# operations are applied in the order they completed in the recording, each on the session of
+# the thread that ran it. The timing is 'max' to replay as fast as possible, 'original' to
+# follow the recorded times, or a speed factor such as '2' for twice the original speed.
+def replay(trace_path, home, timing="max"):
+    import wiredtiger
+
+    with open(os.path.join(trace_path, meta_file)) as f:
+        meta = json.load(f)
+    segments = get_segments(trace_path)
+    if not segments:
+        print(f"Error: The trace '{trace_path}' has no segments.")
+        return False
+    speed = None if timing == "max" else 1.0 if timing == "original" else float(timing)
+
+    os.makedirs(home, exist_ok=True)
+    connection = wiredtiger.wiredtiger_open(home, meta["connection"])
+    session = connection.open_session()
+    with open(segments[0], "rb") as f:
+        for table in read_segment_header(f):
+            session.create(get_table_uri(table), table_config)
+
+    # The threads whose transaction failed in the replay, skipping their operations until the
+    # recorded end of the transaction.
+    aborted, transactions = set(), set()
+    sessions, values = {}, {}
+    counts = {name: 0 for name in op_names}
+    max_latency = {name: 0.0 for name in op_names}
+    diverged = rollbacks = 0
+    lag = first = None
+    start = time.monotonic()
+
+    for segment in segments:
+        for now, op, thread, table, key, value_size, found in read_segment(segment):
+            if first is None:
+                first = now
+            if speed:
+                delay = start + (now - first) / 1e6 / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                lag = max(lag or 0, -delay)
+
+            if thread not in sessions:
+                sessions[thread] = (connection.open_session(), {})
+            thread_session, cursors = sessions[thread]
+            if thread in aborted:
+                if op == OP_COMMIT or op == OP_ROLLBACK:
+                    aborted.discard(thread)
+                continue
+            began = time.monotonic()
+            try:
+                if op == OP_CREATE:
+                    session.create(get_table_uri(table), table_config)
+                elif op == OP_BEGIN:
+                    thread_session.begin_transaction()
+                    transactions.add(thread)
+                elif op == OP_COMMIT:
+                    transactions.discard(thread)
+                    thread_session.commit_transaction()
+                elif op == OP_ROLLBACK and thread in transactions:
+                    transactions.discard(thread)
+                    thread_session.rollback_transaction()
+                elif op in key_ops:
+                    if table not in cursors:
+                        cursors[table] = thread_session.open_cursor(get_table_uri(table))
+                    cursor = cursors[table]
+                    cursor.set_key(key)
+                    if op == OP_INSERT or op == OP_UPDATE:
+                        if value_size not in values:
+                            values[value_size] = random.Random(value_size).randbytes(value_size)
+                        cursor.set_value(values[value_size])
+                        cursor.insert() if op == OP_INSERT else cursor.update()
+                    elif op == OP_SEARCH:
+                        diverged += (cursor.search() == 0) != found
+                    else:
+                        cursor.remove()
+                    cursor.reset()
+            except wiredtiger.WiredTigerRollbackError:
+                rollbacks += 1
+                for cursor in cursors.values():
+                    cursor.reset()
+                if thread in transactions:
+                    transactions.discard(thread)
+                    thread_session.rollback_transaction()
+                    aborted.add(thread)
+            counts[op_names[op]] += 1
+            max_latency[op_names[op]] = max(max_latency[op_names[op]], time.monotonic() - began)
+
+    elapsed = time.monotonic() - start
+    connection.close()
+
+    total = sum(counts.values())
+    print(f"Replayed {total} operations of '{meta['workload']}' recorded with seed "
+          f"{meta['seed']} in {elapsed:.1f}s ({total / max(elapsed, 1e-6):.0f} ops/s).")
+    for name in op_names:
+        if counts[name]:
+            print(f"  {name:<10} {counts[name]:>12}  max latency {max_latency[name] * 1000:.1f}ms")
+    print(f"  {diverged} search(es) diverged from the recording, {rollbacks} rollback(s).")
+    if lag is not None:
+        print(f"  The replay fell at most {lag:.1f}s behind the original timing.")
+    return True
+
+# Print the traces in the trace directory with their time range, number of records and size.
+def list_traces(trace_dir):
+
+    for path in sorted(glob.glob(os.path.join(trace_dir, "*", meta_file))):
+        trace_path = os.path.dirname(path)
+        with open(path) as f:
+            meta = json.load(f)
+        size = sum(os.path.getsize(s) for s in get_segments(trace_path))
+        start = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(meta["start"]))
+        duration = f"{meta['end'] - meta['start']:.0f}s" if "end" in meta else "recording"
+        records = meta.get("records", "-")
+        print(f"{os.path.basename(trace_path):<40} {start}  {duration:>10}  {records:>12} "
+              f"records  {size / 1024 ** 2:.1f}MB  seed {meta['seed']}")
+
+# This allows us to call script functions by name from the command line with an
+# arbitrary number of parameters. Example usage is:
+#
+#   $ python3 testy_trace.py list_traces '/srv/testy/traces'
+#   $ python3 testy_trace.py replay '/srv/testy/traces/my_workload-20240101T000000Z' \
+#         '/srv/testy/replay' 'original'
+#
+if __name__ == "__main__":
+
+    result = globals()[sys.argv[1]](*sys.argv[2:])
+    sys.exit(0 if result is not False else 1)
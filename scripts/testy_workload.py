@@ -0,0 +1,366 @@
+import copy, hashlib, itertools, json, os, sys
+
+try:
+    import tomllib
+except ImportError:
+    import tomli as tomllib
+
+# Compile declarative workload spec files into workgen workloads. A spec is a TOML file
+# made of the following tables:
+#
+#   [workload]   The description, the WiredTiger connection configuration (the cache size is
+#                added from the machine's resources), whether to repeat the phases forever,
+#                and whether to record the operations in a trace (see testy_trace.py).
+#   [options]    Values for the workgen workload options, e.g. create_interval.
+#   [size]       The target database size in GB, or "auto" to derive it from the disk.
+#   [mix.NAME]   A reusable operation mix: 'count' operations followed by a sleep. Mixes
+#                from the shared library (workload_library.toml) can be used by name.
+#   [thread.NAME]  A thread type: a list of "mix" or "mix*N" entries, the number of threads
+#                  of this type on a 16-core reference machine and whether to run the
+#                  operations in a transaction.
+#   [[phase]]    The load shape: phases run in order, each for 'duration' seconds, with the
+#                thread counts multiplied by 'scale' and the mix sleeps by 'sleep_scale'.
+#   [sweep]      Parameter sweeps: a list of values for a dotted parameter path, e.g.
+#                "mix.insert_small.value_size" = [1024, 4096]. Each combination of values
+#                is a variant of the workload; the variants run one after the other.
+#
+# Compiling validates the spec and resolves it into a plan: plain data that is cached next
+# to the spec, keyed by a hash of the spec and the library. Building the workgen objects
+# from a plan is the only step that needs workgen.
+
+plan_version = 2
+library_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "workload_library.toml")
+
+operation_types = ["insert", "update", "search", "remove"]
+key_types = ["append", "pareto", "uniform"]
+
+# The workgen workload options a spec may set, and their types.
+workload_options = {
+    "background_compact": int, "create_count": int, "create_interval": int,
+    "create_target": int, "create_trigger": int, "drop_count": int, "drop_interval": int,
+    "drop_target": int, "drop_trigger": int, "max_num_files": int, "mirror_tables": bool,
+    "random_table_values": bool, "report_enabled": bool, "report_interval": int,
+    "sample_interval_ms": int, "run_time": int,
+}
+
+mix_defaults = {"key": "append", "key_size": 512, "value_size": 1024, "count": 1, "sleep": 0,
+                "pareto_param": 1}
+
+# Raised when a workload spec is invalid.
+class SpecError(ValueError):
+    pass
+
+def check(condition, message):
+    if not condition:
+        raise SpecError(message)
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+# Return the table of the spec, which must be a TOML table, or an empty table if missing.
+def get_table(spec, name):
+    table = spec.get(name, {})
+    check(isinstance(table, dict), f"'{name}' must be a table.")
+    return table
+
+# Split a thread mix entry of the form "name" or "name*N".
+def parse_mix_entry(entry):
+    check(isinstance(entry, str), f"Invalid mix entry '{entry}'.")
+    name, _, repeat = entry.partition("*")
+    check(not repeat or repeat.strip().isdigit(), f"Invalid mix entry '{entry}'.")
+    return name.strip(), int(repeat) if repeat else 1
+
+def validate_mix(name, mix):
+    mix = {**mix_defaults, **mix}
+    check(set(mix) <= set(mix_defaults) | {"op"}, f"Unknown keys in mix '{name}': "
+          f"{sorted(set(mix) - set(mix_defaults) - {'op'})}.")
+    check(mix.get("op") in operation_types, f"Mix '{name}' has an invalid op '{mix.get('op')}'.")
+    check(mix["key"] in key_types, f"Mix '{name}' has an invalid key '{mix['key']}'.")
+    for field in ["key_size", "value_size", "count", "pareto_param"]:
+        check(isinstance(mix[field], int) and mix[field] > 0,
+              f"Mix '{name}': '{field}' must be a positive integer.")
+    check(isinstance(mix["sleep"], (int, float)) and mix["sleep"] >= 0,
+          f"Mix '{name}': 'sleep' must be a non-negative number.")
+    return mix
+
+def validate_thread(name, thread, mixes):
+    check(isinstance(thread, dict), f"Thread '{name}' must be a table.")
+    check(set(thread) <= {"mix", "count", "transaction"}, f"Unknown keys in thread '{name}'.")
+    check(isinstance(thread.get("mix"), list) and thread["mix"],
+          f"Thread '{name}' needs a non-empty 'mix' list.")
+    for entry in thread["mix"]:
+        mix_name, _ = parse_mix_entry(entry)
+        check(mix_name in mixes, f"Thread '{name}' uses an unknown mix '{mix_name}'.")
+    count = thread.get("count", 1)
+    check(isinstance(count, int) and count > 0, f"Thread '{name}': 'count' must be positive.")
+    return {"mix": thread["mix"], "count": count, "transaction": bool(thread.get("transaction"))}
+
+def validate_phase(i, phase):
+    check(isinstance(phase, dict), f"Phase {i} must be a table.")
+    check(set(phase) <= {"name", "duration", "scale", "sleep_scale"}, f"Unknown keys in phase {i}.")
+    phase = {"name": f"phase{i}", "scale": 1.0, "sleep_scale": 1.0, **phase}
+    check(isinstance(phase.get("duration"), int) and phase["duration"] > 0,
+          f"Phase '{phase['name']}': 'duration' must be a positive number of seconds.")
+    check(is_number(phase["scale"]) and phase["scale"] > 0 and
+          is_number(phase["sleep_scale"]) and phase["sleep_scale"] >= 0,
+          f"Phase '{phase['name']}': 'scale' must be a positive number and 'sleep_scale' a "
+          f"non-negative number.")
+    return phase
+
+# Validate a variant of the spec, i.e. the spec with one value of each sweep applied.
+def validate_variant(spec, library):
+    unknown = set(spec) - {"workload", "options", "size", "mix", "thread", "phase", "sweep"}
+    check(not unknown, f"Unknown tables in spec: {sorted(unknown)}.")
+
+    options = get_table(spec, "options")
+    for key, value in options.items():
+        check(key in workload_options, f"Unknown workload option '{key}'.")
+        check(type(value) is workload_options[key],
+              f"Workload option '{key}' must be of type {workload_options[key].__name__}.")
+
+    check(set(get_table(spec, "size")) <= {"target_gb", "margin"}, "Unknown keys in [size].")
+    target = get_table(spec, "size").get("target_gb")
+    check(target is None or target == "auto" or (isinstance(target, (int, float)) and target > 0),
+          "'size.target_gb' must be a positive number or \"auto\".")
+
+    # A spec mix with the name of a library mix overrides the library mix field by field.
+    library_mixes, spec_mixes = library.get("mix", {}), get_table(spec, "mix")
+    for name, mix in spec_mixes.items():
+        check(isinstance(mix, dict), f"Mix '{name}' must be a table.")
+    mixes = {name: validate_mix(name, {**library_mixes.get(name, {}), **spec_mixes.get(name, {})})
+             for name in {**library_mixes, **spec_mixes}}
+    threads = {name: validate_thread(name, thread, mixes)
+               for name, thread in get_table(spec, "thread").items()}
+    check(threads, "The spec must define at least one thread.")
+
+    # Only keep the mixes used by the threads in the plan.
+    used = {parse_mix_entry(e)[0] for t in threads.values() for e in t["mix"]}
+    return {
+        "options": options,
+        "size": get_table(spec, "size"),
+        "mixes": {name: mix for name, mix in mixes.items() if name in used},
+        "threads": threads,
+    }
+
+# Set the value at a dotted path, e.g. "mix.insert_small.value_size", in the spec.
+def set_path(spec, path, value):
+    node = spec
+    keys = path.split(".")
+    for key in keys[:-1]:
+        node = node.setdefault(key, {})
+        check(isinstance(node, dict), f"Sweep '{path}': '{key}' is not a table.")
+    node[keys[-1]] = value
+
+# Return the variants of the spec, one per combination of the sweep values.
+def expand_sweeps(spec):
+    sweep = get_table(spec, "sweep")
+    for path, values in sweep.items():
+        check(isinstance(values, list) and values, f"Sweep '{path}' must be a non-empty list.")
+    paths = sorted(sweep)
+    for values in itertools.product(*(sweep[p] for p in paths)):
+        variant = copy.deepcopy(spec)
+        for path, value in zip(paths, values):
+            set_path(variant, path, value)
+        yield ", ".join(f"{p}={v}" for p, v in zip(paths, values)) or "default", variant
+
+# Validate the spec and compile it into a plan.
+def compile_spec(spec, library):
+    workload = get_table(spec, "workload")
+    check(set(workload) <= {"description", "connection", "repeat", "trace"},
+          "Unknown keys in [workload].")
+
+    check(isinstance(spec.get("phase", []), list), "'phase' must be an array of tables.")
+    phases = [validate_phase(i, p) for i, p in enumerate(spec.get("phase", []))]
+    if not phases:
+        # Without phases, run the workload for as long as possible (~68 years).
+        phases = [validate_phase(0, {"name": "steady", "duration": 2147483647})]
+
+    return {
+        "version": plan_version,
+        "description": workload.get("description", ""),
+        "connection": workload.get("connection", ""),
+        "repeat": bool(workload.get("repeat", True)),
+        "trace": bool(workload.get("trace", False)),
+        "phases": phases,
+        "variants": [{"label": label, **validate_variant(variant, library)}
+                     for label, variant in expand_sweeps(spec)],
+    }
+
+# Return the compiled plan for the spec file. The plan is cached in a '.plans' directory
+# next to the spec and recompiled only when the spec or the library changes.
+def load_plan(spec_file):
+    with open(spec_file, "rb") as f:
+        spec_data = f.read()
+    with open(library_file, "rb") as f:
+        library_data = f.read()
+
+    digest = hashlib.sha256(spec_data + library_data + str(plan_version).encode()).hexdigest()
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(spec_file)), ".plans")
+    cache_file = os.path.join(cache_dir, f"{digest}.json")
+    try:
+        with open(cache_file) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    try:
+        spec = tomllib.loads(spec_data.decode())
+    except tomllib.TOMLDecodeError as e:
+        raise SpecError(f"Unable to parse '{spec_file}': {e}")
+    plan = compile_spec(spec, tomllib.loads(library_data.decode()))
+
+    os.makedirs(cache_dir, exist_ok=True)
+    for old in os.listdir(cache_dir):
+        os.remove(os.path.join(cache_dir, old))
+    with open(cache_file + ".tmp", "w") as f:
+        json.dump(plan, f, indent=1)
+    os.replace(cache_file + ".tmp", cache_file)
+    return plan
+
+# Return the workgen operations for a mix.
+def build_mix(mix, sleep_scale):
+    from workgen import Key, Operation, ParetoOptions, Value
+
+    op = {"insert": Operation.OP_INSERT, "update": Operation.OP_UPDATE,
+          "search": Operation.OP_SEARCH, "remove": Operation.OP_REMOVE}[mix["op"]]
+    if mix["key"] == "pareto":
+        key = Key(Key.KEYGEN_PARETO, mix["key_size"], ParetoOptions(mix["pareto_param"]))
+    elif mix["key"] == "uniform":
+        key = Key(Key.KEYGEN_UNIFORM, mix["key_size"])
+    else:
+        key = Key(Key.KEYGEN_APPEND, mix["key_size"])
+
+    ops = mix["count"] * Operation(op, key, Value(mix["value_size"]))
+    if mix["sleep"] * sleep_scale > 0:
+        ops = ops + Operation(Operation.OP_SLEEP, str(mix["sleep"] * sleep_scale))
+    return ops
+
+# Return a workgen workload for one phase of a plan variant.
+def build_workload(context, variant, phase, profile):
+    from runner import txn
+    from testy_resources import scale_threads
+    from workgen import Thread, Workload
+
+    threads = None
+    for thread in variant["threads"].values():
+        ops = None
+        for entry in thread["mix"]:
+            name, repeat = parse_mix_entry(entry)
+            mix_ops = repeat * build_mix(variant["mixes"][name], phase["sleep_scale"])
+            ops = mix_ops if ops is None else ops + mix_ops
+        count = scale_threads(profile, thread["count"] * phase["scale"])
+        thread_ops = count * Thread(txn(ops) if thread["transaction"] else ops)
+        threads = thread_ops if threads is None else threads + thread_ops
+    workload = Workload(context, threads)
+
+    workload.options.report_enabled = False
+    workload.options.create_prefix = "table_"
+    workload.options.sample_interval_ms = 1000
+
+    # Derive the create and drop triggers from the target database size, as in the sample
+    # workload. Options set explicitly in the spec take precedence.
+    target_gb = variant["size"].get("target_gb")
+    if target_gb:
+        if target_gb == "auto":
+            target_gb, margin_gb = profile["db_size_target_gb"], profile["db_size_margin_gb"]
+        else:
+            margin_gb = max(int(target_gb * variant["size"].get("margin", 0.5)), 1)
+        workload.options.create_trigger = int(target_gb * 1024)
+        workload.options.create_target = int(target_gb * 1024)
+        workload.options.drop_trigger = int((target_gb + margin_gb) * 1024)
+        workload.options.drop_target = int((target_gb - margin_gb) * 1024)
+
+    for key, value in variant["options"].items():
+        setattr(workload.options, key, value)
+    workload.options.run_time = phase["duration"]
+    return workload
+
+# Run the workload defined by the spec file against the database in the given directory.
+def run(spec_file, home):
+    plan = load_plan(spec_file)
+    from testy_resources import get_workload_profile
+
+    profile = get_workload_profile(home, float(os.environ.get("utilization") or 0.75))
+    print(f"Workload profile: {profile}", flush=True)
+
+    connection_config = f"cache_size={profile['cache_size_gb']}GB,create=true"
+    if plan["connection"]:
+        connection_config += "," + plan["connection"]
+
+    # Workgen cannot observe its operations: traced workloads are run by the trace driver.
+    if plan["trace"]:
+        from testy_trace import record
+        workload = os.path.splitext(os.path.basename(spec_file))[0]
+        record(plan, home, profile, connection_config, workload)
+        return
+
+    # The workgen context parses the command line.
+    sys.argv = [sys.argv[0], "--home", home, "--keep"]
+    from runner import Context
+    from testy_governor import Governor
+    from testy_hotbackup import HotBackup
+    from testy_checker import Checker
+    from testy_crash import CrashInjector
+
+    context = Context()
+    connection = context.wiredtiger_open(connection_config)
+    hot_backup = HotBackup(connection, home)
+    hot_backup.start()
+    checker = Checker(connection, home)
+    checker.start()
+    crash_injector = CrashInjector(connection, home)
+    crash_injector.start()
+
+    while True:
+        for variant in plan["variants"]:
+            for phase in plan["phases"]:
+                print(f"Running phase '{phase['name']}' of variant '{variant['label']}' for "
+                      f"{phase['duration']} seconds.", flush=True)
+                workload = build_workload(context, variant, phase, profile)
+                governor = Governor(workload, home)
+                governor.start()
+                ret = workload.run(connection)
+                governor.stop()
+                assert ret == 0, ret
+        if not plan["repeat"]:
+            break
+
+    hot_backup.stop()
+    checker.stop()
+    crash_injector.stop()
+    # Wait for the threads using the connection to close their sessions and cursors.
+    for thread in [hot_backup, checker, crash_injector]:
+        thread.join()
+    connection.close()
+
+# Validate the spec file and cache its plan. Prints the error and exits with a non-zero
+# status if the spec is invalid.
+def validate(spec_file):
+    try:
+        plan = load_plan(spec_file)
+    except SpecError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(f"The spec '{spec_file}' is valid: {len(plan['variants'])} variant(s) of "
+          f"{len(plan['phases'])} phase(s).")
+
+# Describe the workload defined by the spec file.
+def describe(spec_file):
+    plan = load_plan(spec_file)
+    print(plan["description"] or f"A testy workload defined by '{os.path.basename(spec_file)}'.")
+    for phase in plan["phases"]:
+        print(f"  phase '{phase['name']}': {phase['duration']}s, threads x{phase['scale']}, "
+              f"sleeps x{phase['sleep_scale']}")
+    for variant in plan["variants"]:
+        threads = ", ".join(f"{t['count']} {name}" for name, t in variant["threads"].items())
+        print(f"  variant '{variant['label']}': {threads}")
+
+# This allows us to call script functions by name from the command line with an
+# arbitrary number of parameters. Example usage is:
+#
+#   $ python3 testy_workload.py validate 'my_workload.toml'
+#   $ python3 testy_workload.py run 'my_workload.toml' '/srv/testy/data'
+#
+if __name__ == "__main__":
+
+    globals()[sys.argv[1]](*sys.argv[2:])
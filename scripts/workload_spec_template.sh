@@ -0,0 +1,48 @@
+#! /bin/bash
+# The workload interface for testy workloads defined by a workload spec file. The spec file
+# is named after the workload and lives next to this script.
+set -e
+
+workload=$(basename "$0" .sh)
+spec=$(dirname "$(realpath "$0")")/${workload}.toml
+
+describe() {
+    python3 ${testy_script_dir}/testy_workload.py describe "$spec"
+}
+
+populate() {
+    export PYTHONPATH=${wt_build_dir}/lang/python:${testy_script_dir}:$PYTHONPATH
+    python3 ${testy_script_dir}/testy_populate.py run ${database_dir} "$spec"
+}
+
+run() {
+    export PYTHONPATH=${wt_build_dir}/bench/workgen:${wt_build_dir}/../bench/workgen/runner:${wt_build_dir}/lang/python:${testy_script_dir}:$PYTHONPATH
+    ${script_dir}/testy-metrics.sh workload_status 1
+    python3 ${testy_script_dir}/testy_workload.py run "$spec" ${database_dir}
+    ${script_dir}/testy-metrics.sh workload_status 0
+}
+
+validate() {
+    set -o pipefail
+    export PYTHONPATH=${wt_build_dir}/lang/python:${wt_home_dir}/tools:$PYTHONPATH
+    validation_logs=${failure_dir}/${failure_file}
+    database_path=$1/$database_dir
+    echo "Database path: $database_path"
+    echo "Logs saved to: $validation_logs"
+    echo "Running verify..."
+    free -h | sudo tee $validation_logs
+    df -h | sudo tee -a $validation_logs
+    du -h "$database_path" | sudo tee -a $validation_logs
+    # If a verify order is given, verify the objects in that order, e.g. the most recently
+    # used tables first on a volume restored from a snapshot. Otherwise verify everything.
+    if [ -n "$verify_order" ] && [ -f "$verify_order" ]; then
+        python3 ${testy_script_dir}/testy_prewarm.py verify "$database_path" "$verify_order" 2>&1 | sudo tee -a $validation_logs
+    else
+        ${wt_build_dir}/wt -h "$database_path" -R verify 2>&1 | sudo tee -a $validation_logs
+    fi
+    echo "Validating mirrors..."
+    python3 ${wt_home_dir}/bench/workgen/validate_mirror_tables.py "$database_path" 2>&1 | sudo tee -a $validation_logs
+    sudo rm -f $validation_logs
+}
+
+"$@"
@@ -1,6 +1,8 @@
 #!/bin/bash
 
-# The script expects in order: the name and the value of the metric.
+# The script expects in order: the name and the value of the metric. A batch of metrics can
+# be published at once with '--metric-data <file>', where the file holds the metric data in
+# the JSON format of put-metric-data, with @INSTANCE_ID@ in place of the instance dimension.
 _metric_name=$1
 _metric_value=$2
 _metric_namespace=testy
@@ -8,6 +10,15 @@ _metric_namespace=testy
 _aws_endpoint="http://169.254.169.254/latest/meta-data/"
 _instance_id=$(curl ${_aws_endpoint}/instance-id 2> /dev/null)
 
+if [ "$_metric_name" == "--metric-data" ]; then
+    _metric_data=$(sed "s/@INSTANCE_ID@/${_instance_id}/g" "$_metric_value")
+    if ! aws cloudwatch put-metric-data --namespace "$_metric_namespace" --metric-data "$_metric_data"; then
+        echo "Error: Failed calling put-metric-data (instance: $_instance_id, metric data: $_metric_value, metric namespace: $_metric_namespace)."
+        exit 1
+    fi
+    exit 0
+fi
+
 if ! aws cloudwatch put-metric-data --metric-name "$_metric_name" --dimensions Instance="$_instance_id" --namespace "$_metric_namespace" --value "$_metric_value"; then
     echo "Error: Failed calling put-metric-data (instance: $_instance_id, metric name: $_metric_name, metric value: $_metric_value, metric namespace: $_metric_namespace)."
     exit 1
@@ -7,11 +7,12 @@ describe() {
 }
 
 populate() {
-    echo "Populate is not defined."
+    export PYTHONPATH=${wt_build_dir}/lang/python:${testy_script_dir}:$PYTHONPATH
+    python3 ${testy_script_dir}/testy_populate.py run ${database_dir}
 }
 
 run() {
-    export PYTHONPATH=${wt_build_dir}/bench/workgen:${wt_build_dir}/../bench/workgen/runner:${wt_build_dir}/lang/python:$PYTHONPATH
+    export PYTHONPATH=${wt_build_dir}/bench/workgen:${wt_build_dir}/../bench/workgen/runner:${wt_build_dir}/lang/python:${testy_script_dir}:$PYTHONPATH
     ${script_dir}/testy-metrics.sh workload_status 1
     python3 ${workload_dir}/sample/sample_run.py --home ${database_dir} --keep
     ${script_dir}/testy-metrics.sh workload_status 0
@@ -28,7 +29,13 @@ validate() {
     free -h | sudo tee $validation_logs
     df -h | sudo tee -a $validation_logs
     du -h "$database_path" | sudo tee -a $validation_logs
-    ${wt_build_dir}/wt -h "$database_path" -R verify 2>&1 | sudo tee -a $validation_logs
+    # If a verify order is given, verify the objects in that order, e.g. the most recently
+    # used tables first on a volume restored from a snapshot. Otherwise verify everything.
+    if [ -n "$verify_order" ] && [ -f "$verify_order" ]; then
+        python3 ${testy_script_dir}/testy_prewarm.py verify "$database_path" "$verify_order" 2>&1 | sudo tee -a $validation_logs
+    else
+        ${wt_build_dir}/wt -h "$database_path" -R verify 2>&1 | sudo tee -a $validation_logs
+    fi
     echo "Validating mirrors..."
     python3 ${wt_home_dir}/bench/workgen/validate_mirror_tables.py "$database_path" 2>&1 | sudo tee -a $validation_logs
     sudo rm -f $validation_logs
@@ -28,16 +28,25 @@
 
 import os
 from runner import *
+from testy_governor import Governor
+from testy_hotbackup import HotBackup
+from testy_checker import Checker
+from testy_crash import CrashInjector
+from testy_resources import get_workload_profile, scale_threads
 from workgen import *
 
-# Return the total RAM in bytes.
-def get_total_os_memory():
-    return int(os.popen("free -t -b").readlines()[-1].split()[1:][0])
-
 # Set up the WiredTiger connection.
 context = Context()
+
+# Size the workload from the machine's resources: the thread counts below are scaled from a
+# 16-core reference machine, and the target database size is derived from the disk capacity.
+# The utilization is the share of the machine's resources the workload aims to use.
+utilization = float(os.environ.get("utilization") or 0.75)
+profile = get_workload_profile(context.args.home, utilization)
+print(f"Workload profile: {profile}", flush=True)
+
 # The allocated cache size follows what MongoDB does: (total memory available - 1GB) / 2.
-cache_size_gb = int(((get_total_os_memory() - 1e9) / 2) / 1e9)
+cache_size_gb = profile["cache_size_gb"]
 connection_config = f"cache_size={cache_size_gb}GB,checkpoint=(wait=60),create=true,log=(enabled=true),statistics=(fast),statistics_log=(wait=60,json),transaction_sync=(enabled,method=fsync)"
 connection = context.wiredtiger_open(connection_config)
 
@@ -75,17 +84,22 @@ txn_op = txn(2*insert_op_1 + 2*update_op_1 + 2*delete_op + 2*read_op)
 txn_thread = Thread(txn_op)
 
 # Define the workload using the above operations.
-workload = Workload(context, 10*insert_thread + 10*update_thread + 10*read_thread + \
-           5*delete_thread + txn_thread)
+workload = Workload(context, scale_threads(profile, 10)*insert_thread +
+           scale_threads(profile, 10)*update_thread + scale_threads(profile, 10)*read_thread +
+           scale_threads(profile, 5)*delete_thread + scale_threads(profile, 1)*txn_thread)
 
 # Disable generation of stats.
 workload.options.report_enabled = False
 
+# Write the latency of each operation type to monitor.json every second for the stall detector.
+workload.options.sample_interval_ms = 1000
+
 # Add a prefix to the table names.
 workload.options.create_prefix = "table_"
 
-# Target database size in GB.
-db_size_target_gb = 40
+# Target database size in GB, and how far the size may go above or below it.
+db_size_target_gb = profile["db_size_target_gb"]
+db_size_margin_gb = profile["db_size_margin_gb"]
 
 # Create one table every 30 seconds until we have reached the target database size.
 workload.options.create_interval = 30
@@ -101,8 +115,8 @@ workload.options.max_num_files = 1000
 # Stop when the database size is below the target size margin.
 workload.options.drop_interval = 90
 workload.options.drop_count = 5
-workload.options.drop_trigger = (db_size_target_gb + 20) * 1024
-workload.options.drop_target = (db_size_target_gb - 20) * 1024
+workload.options.drop_trigger = (db_size_target_gb + db_size_margin_gb) * 1024
+workload.options.drop_target = (db_size_target_gb - db_size_margin_gb) * 1024
 
 # Enable mirror tables and random table values.
 workload.options.mirror_tables = True
@@ -114,8 +128,32 @@ workload.options.background_compact = 100
 # Set the workload runtime to maximum value (~68 years).
 workload.options.run_time = 2147483647
 
+# Lower the size targets while the run goes on if other files take the space on the volume.
+governor = Governor(workload, context.args.home)
+governor.start()
+
+# Stream the database files to the backup directory when the backup service asks for it.
+hot_backup = HotBackup(connection, context.args.home)
+hot_backup.start()
+
+# Check the tables and their mirrors in the background while the workload runs.
+checker = Checker(connection, context.args.home)
+checker.start()
+
+# Crash the workload in the phase requested by the crash testing service.
+crash_injector = CrashInjector(connection, context.args.home)
+crash_injector.start()
+
 # Run the workload.
 ret = workload.run(connection)
+governor.stop()
+hot_backup.stop()
+checker.stop()
+crash_injector.stop()
+
+# Wait for the threads using the connection to close their sessions and cursors.
+for thread in [hot_backup, checker, crash_injector]:
+    thread.join()
 assert ret == 0, ret
 
 # Close the connection.
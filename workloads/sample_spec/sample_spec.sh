@@ -0,0 +1,4 @@
+#! /bin/bash
+# The sample workload spec, run with the spec workload interface file of testy. The interface
+# reads the spec file named after this script, next to it.
+source ${testy_script_dir}/workload_spec_template.sh
@@ -11,10 +11,13 @@ populate() {
 
 run() {
     ${script_dir}/testy-metrics.sh workload_status 1
-    # Remove leftover files in the directory
-    sudo rm -rf ${database_dir}/*
-    # Test format will stop on first failure. 
-    ${wt_build_dir}/test/format/format.sh -F -c ${workload_dir}/test_format/${config_file} -h ${database_dir} -j $(nproc)
+    # The campaign removes leftover files in the run directories in the background.
+    sudo mkdir -p ${failure_dir}/format && sudo chown $(whoami) ${failure_dir}/format
+    # Run a campaign over the comma-separated list of config files, one job per core. The
+    # runs are placed on fast local storage if available, ${database_dir} otherwise. The
+    # campaign keeps going after failures, which are bucketed in ${failure_dir}/format.
+    configs=$(echo "${config_file}" | tr ',' '\n' | sed "s|^|${workload_dir}/test_format/|" | paste -sd,)
+    python3 ${testy_script_dir}/testy_format.py campaign "$configs" ${database_dir} ${failure_dir} ${wt_build_dir} $(nproc)
     echo "Test format exited, please check for failure."
     ${script_dir}/testy-metrics.sh workload_status 0
 }